@@ -0,0 +1,319 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from database import db, supabase
+from rules import STALE_RULE, FleetEvaluation
+
+logger = logging.getLogger(__name__)
+
+# Состояния предупреждения
+ACTIVE = "active"
+ACKNOWLEDGED = "acknowledged"
+RESOLVED = "resolved"
+
+# Серьезность встроенного правила "устройство не отвечает"
+STALE_SEVERITY = "warning"
+
+# Колонки подтверждения пишет только запрос подтверждения, а не переходы состояний
+ACK_COLUMNS = ("acknowledged_at", "acknowledged_by")
+
+class AlertState:
+    """Состояние предупреждения по паре (устройство, правило)"""
+
+    def __init__(self, device_id: str, rule: str):
+        self.id: Optional[str] = None
+        self.device_id = device_id
+        self.device_name = ""
+        self.rule = rule
+        self.severity = ""
+        self.message = ""
+        self.status: Optional[str] = None  # None - нарушение еще не подтверждено
+        self.created_at: Optional[datetime] = None
+        self.acknowledged_at: Optional[datetime] = None
+        self.acknowledged_by: Optional[str] = None
+        self.resolved_at: Optional[datetime] = None
+        self.breach_count = 0
+        self.clear_count = 0
+        self.flapping = False
+        self.transitions: deque = deque()
+
+    @property
+    def is_open(self) -> bool:
+        return self.status in (ACTIVE, ACKNOWLEDGED)
+
+    def to_row(self) -> Dict[str, Any]:
+        """Строка таблицы monitoring_alerts"""
+        return {
+            "id": self.id,
+            "device_id": self.device_id,
+            "device_name": self.device_name,
+            "alert_type": self.rule,
+            "severity": self.severity,
+            "message": self.message,
+            "status": self.status,
+            "flapping": self.flapping,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "acknowledged_at": self.acknowledged_at.isoformat() if self.acknowledged_at else None,
+            "acknowledged_by": self.acknowledged_by,
+            "resolved_at": self.resolved_at.isoformat() if self.resolved_at else None,
+            "updated_at": datetime.utcnow().isoformat()
+        }
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "AlertState":
+        state = cls(str(row["device_id"]), row["alert_type"])
+        state.id = row["id"]
+        state.device_name = row.get("device_name") or ""
+        state.severity = row.get("severity") or ""
+        state.message = row.get("message") or ""
+        state.status = row["status"]
+        state.flapping = bool(row.get("flapping"))
+        state.created_at = datetime.fromisoformat(row["created_at"]) if row.get("created_at") else None
+        state.acknowledged_at = datetime.fromisoformat(row["acknowledged_at"]) if row.get("acknowledged_at") else None
+        state.acknowledged_by = row.get("acknowledged_by")
+        state.resolved_at = datetime.fromisoformat(row["resolved_at"]) if row.get("resolved_at") else None
+        return state
+
+class AlertManager:
+    """Жизненный цикл предупреждений с гистерезисом и подавлением дребезга.
+
+    Предупреждение открывается после ``raise_after`` подряд оценок с
+    нарушением и закрывается после ``clear_after`` подряд оценок без
+    него. Если за ``flap_window`` секунд произошло ``flap_threshold``
+    переходов, предупреждение считается дребезжащим: оно остается
+    открытым с тем же id (в БД пишется одна строка с признаком
+    ``flapping``) и закрывается только после ``flap_clear_after`` чистых
+    оценок. Активные предупреждения хранятся в памяти, в БД пишутся
+    только переходы состояний.
+
+    Писать может только один воркер (``writer()`` истинно - при
+    нескольких воркерах владелец аренды производителя), и только он
+    присваивает предупреждениям id. Перед каждой оценкой вызывается
+    ``claim()``: получив роль писателя, воркер перечитывает открытые
+    предупреждения из БД и продолжает их под теми же id, а потеряв ее -
+    забывает свои id. Переходы не трогают колонки подтверждения; перед
+    записью из БД подхватываются подтверждения, сделанные другими
+    воркерами.
+    """
+
+    def __init__(self, table: str, raise_after: int, clear_after: int,
+                 flap_window: float, flap_threshold: int, flap_clear_after: int):
+        self.table = table
+        self.raise_after = raise_after
+        self.clear_after = clear_after
+        self.flap_window = flap_window
+        self.flap_threshold = flap_threshold
+        self.flap_clear_after = flap_clear_after
+        self._states: Dict[Tuple[str, str], AlertState] = {}
+        self.active: Dict[str, AlertState] = {}
+        self.writer: Callable[[], bool] = lambda: True
+        self.writing = False
+
+    def _expire_transitions(self, state: AlertState):
+        horizon = time.monotonic() - self.flap_window
+        while state.transitions and state.transitions[0] < horizon:
+            state.transitions.popleft()
+
+    def _record_transition(self, state: AlertState):
+        state.transitions.append(time.monotonic())
+        self._expire_transitions(state)
+        if len(state.transitions) >= self.flap_threshold:
+            state.flapping = True
+
+    def _flaps_on_next(self, state: AlertState) -> bool:
+        """Сделает ли следующий переход предупреждение дребезжащим"""
+        self._expire_transitions(state)
+        return len(state.transitions) + 1 >= self.flap_threshold
+
+    def _open(self, state: AlertState, now: datetime):
+        # Воркер без роли писателя ведет состояние без id: оно не попадает в БД
+        state.id = str(uuid.uuid4()) if self.writing else None
+        state.status = ACTIVE
+        state.created_at = now
+        state.acknowledged_at = None
+        state.acknowledged_by = None
+        state.resolved_at = None
+        if state.id is not None:
+            self.active[state.id] = state
+        self._record_transition(state)
+
+    def _resolve(self, state: AlertState, now: datetime):
+        state.status = RESOLVED
+        state.resolved_at = now
+        self.active.pop(state.id, None)
+        if state.flapping:
+            # Эпизод дребезга закончен - история переходов начинается заново
+            state.flapping = False
+            state.transitions.clear()
+        else:
+            self._record_transition(state)
+
+    def process(self, evaluation: FleetEvaluation, device_ids: List[str],
+                device_names: List[str]) -> List[AlertState]:
+        """Обработка результата оценки правил; возвращает переходы состояний"""
+        now = datetime.utcnow()
+        transitions: List[AlertState] = []
+
+        # Нарушения правил с предупреждениями и признак "не отвечает"
+        alert_columns = [i for i, rule in enumerate(evaluation.rules) if rule.alert]
+        breached: Dict[Tuple[str, str], Tuple[int, str, str]] = {}
+        if alert_columns:
+            rows, columns = np.nonzero(evaluation.breaches[:, alert_columns])
+            for row, column in zip(rows.tolist(), columns.tolist()):
+                rule = evaluation.rules[alert_columns[column]]
+                value = evaluation.values[row, evaluation.metric_columns[rule.metric]]
+                breached[(str(device_ids[row]), rule.name)] = (row, rule.severity, rule.message.format(value=value))
+        for row in np.flatnonzero(evaluation.stale).tolist():
+            breached[(str(device_ids[row]), STALE_RULE)] = (row, STALE_SEVERITY, "Device not responding")
+
+        for key, (row, severity, message) in breached.items():
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = AlertState(*key)
+            state.breach_count += 1
+            state.clear_count = 0
+            state.device_name = device_names[row]
+            state.severity = severity
+            state.message = message
+            if not state.is_open and state.breach_count >= self.raise_after:
+                self._open(state, now)
+                transitions.append(state)
+
+        present = set(str(device_id) for device_id in device_ids)
+        for key in list(self._states.keys() - breached.keys()):
+            state = self._states[key]
+            state.breach_count = 0
+            state.clear_count += 1
+            clear_after = self.flap_clear_after if state.flapping else self.clear_after
+            if state.is_open and key[0] in present and not state.flapping \
+                    and state.clear_count >= clear_after and self._flaps_on_next(state):
+                # Вместо очередного закрытия предупреждение остается открытым с тем же id
+                state.flapping = True
+                state.transitions.append(time.monotonic())
+                transitions.append(state)
+            elif state.is_open and (state.clear_count >= clear_after or key[0] not in present):
+                self._resolve(state, now)
+                transitions.append(state)
+            if not state.is_open:
+                # История переходов хранится только пока нужна для обнаружения дребезга
+                self._expire_transitions(state)
+                if not state.transitions or key[0] not in present:
+                    del self._states[key]
+
+        return transitions
+
+    def acknowledge(self, alert_id: str, user_id: Optional[str]) -> Optional[AlertState]:
+        """Подтверждение активного предупреждения"""
+        state = self.active.get(alert_id)
+        if state is None:
+            return None
+        if state.status == ACTIVE:
+            state.status = ACKNOWLEDGED
+            state.acknowledged_at = datetime.utcnow()
+            state.acknowledged_by = user_id
+        return state
+
+    def list(self, status: Optional[str] = None, severity: Optional[str] = None) -> List[AlertState]:
+        """Активные предупреждения из памяти, новые первыми"""
+        alerts = [
+            state for state in self.active.values()
+            if (status is None or state.status == status) and (severity is None or state.severity == severity)
+        ]
+        alerts.sort(key=lambda state: (state.created_at, state.id), reverse=True)
+        return alerts
+
+    def open_severities(self) -> Dict[str, List[str]]:
+        """Важности открытых предупреждений по устройствам"""
+        severities: Dict[str, Set[str]] = {}
+        for state in self._states.values():
+            if not state.is_open:
+                continue
+            severities.setdefault(state.device_id, set()).add(state.severity)
+        return {device_id: sorted(values) for device_id, values in severities.items()}
+
+    async def claim(self) -> bool:
+        """Проверка роли писателя перед оценкой; при ее получении - загрузка открытых предупреждений"""
+        writer = self.writer()
+        if writer and not self.writing:
+            # Предупреждения прежнего писателя продолжаются под их id
+            self.writing = await self.load()
+        elif not writer and self.writing:
+            for state in self.active.values():
+                state.id = None
+            self.active.clear()
+            self.writing = False
+        return self.writing
+
+    async def _merge_acknowledgements(self, transitions: List[AlertState]):
+        """Подтверждения, сделанные в БД другими воркерами, для записываемых активных предупреждений"""
+        ids = [state.id for state in transitions if state.status == ACTIVE]
+        if not ids:
+            return
+        result = await asyncio.to_thread(
+            supabase.table(self.table).select('id,acknowledged_at,acknowledged_by')
+            .in_('id', ids).eq('status', ACKNOWLEDGED).execute
+        )
+        for row in result.data or []:
+            state = self.active.get(row['id'])
+            if state is not None and state.status == ACTIVE:
+                state.status = ACKNOWLEDGED
+                state.acknowledged_at = datetime.fromisoformat(row['acknowledged_at']) if row.get('acknowledged_at') else None
+                state.acknowledged_by = row.get('acknowledged_by')
+
+    async def persist(self, transitions: List[AlertState]) -> int:
+        """Запись переходов состояний одним пакетом (только воркером-писателем)"""
+        transitions = [state for state in transitions if state.id is not None]
+        if not self.writing or not transitions:
+            return 0
+        try:
+            await self._merge_acknowledgements(transitions)
+        except Exception as e:
+            logger.error(f"Ошибка чтения подтверждений предупреждений: {e}")
+        rows = []
+        for state in transitions:
+            row = state.to_row()
+            for column in ACK_COLUMNS:
+                del row[column]
+            rows.append(row)
+        return await db.upsert_rows(self.table, rows)
+
+    async def acknowledge_stored(self, alert_id: str, user_id: Optional[str]) -> bool:
+        """Подтверждение активного предупреждения в БД и в памяти воркера"""
+        now = datetime.utcnow()
+        result = await asyncio.to_thread(
+            supabase.table(self.table).update({
+                "status": ACKNOWLEDGED,
+                "acknowledged_at": now.isoformat(),
+                "acknowledged_by": user_id,
+                "updated_at": now.isoformat()
+            }).eq('id', alert_id).eq('status', ACTIVE).execute
+        )
+        # Писатель с этим предупреждением в памяти (остальные узнают о подтверждении из БД)
+        self.acknowledge(alert_id, user_id)
+        return bool(result.data)
+
+    async def load(self) -> bool:
+        """Загрузка открытых предупреждений из БД вместо состояния в памяти"""
+        try:
+            result = await asyncio.to_thread(
+                supabase.table(self.table).select('*').in_('status', [ACTIVE, ACKNOWLEDGED]).execute
+            )
+        except Exception as e:
+            logger.error(f"Ошибка загрузки активных предупреждений: {e}")
+            return False
+        self._states.clear()
+        self.active.clear()
+        for row in result.data or []:
+            state = AlertState.from_row(row)
+            state.breach_count = self.raise_after
+            self._states[(state.device_id, state.rule)] = state
+            self.active[state.id] = state
+        logger.info(f"Загружено активных предупреждений: {len(self.active)}")
+        return True
@@ -0,0 +1,91 @@
+import warnings
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+class EwmaAnomalyDetector:
+    """Потоковое обнаружение аномалий метрик по парку устройств.
+
+    Для каждой пары (устройство, метрика) поддерживаются
+    экспоненциально взвешенные среднее и дисперсия, обновляемые за O(1)
+    на каждый новый срез без обращения к истории. Оценка устройства -
+    наибольшее по метрикам отклонение нового значения от среднего в
+    стандартных отклонениях (z-оценка) до его учета в статистике.
+    Все вычисления выполняются векторно сразу по всему срезу парка.
+    """
+
+    def __init__(self, metrics: List[str], alpha: float, warmup: int,
+                 min_relative_std: float = 0.01, initial_devices: int = 256):
+        self.metrics = list(metrics)
+        self.alpha = alpha
+        self.warmup = warmup
+        self.min_relative_std = min_relative_std
+        self._index: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._allocate(initial_devices)
+
+    def _allocate(self, rows: int):
+        columns = len(self.metrics)
+        mean = np.zeros((rows, columns))
+        variance = np.zeros((rows, columns))
+        count = np.zeros((rows, columns), dtype=np.int64)
+        if hasattr(self, "_mean"):
+            used = len(self._mean)
+            mean[:used] = self._mean
+            variance[:used] = self._variance
+            count[:used] = self._count
+        self._mean, self._variance, self._count = mean, variance, count
+
+    def _rows(self, device_ids: List[str]) -> np.ndarray:
+        """Строки устройств (новые занимают освобожденные или добавленные строки)"""
+        rows = np.empty(len(device_ids), dtype=np.int64)
+        for i, device_id in enumerate(device_ids):
+            row = self._index.get(device_id)
+            if row is None:
+                if self._free:
+                    row = self._free.pop()
+                else:
+                    row = len(self._index)
+                    if row >= len(self._mean):
+                        self._allocate(len(self._mean) * 2)
+                self._index[device_id] = row
+            rows[i] = row
+        return rows
+
+    def update(self, device_ids: List[str], values: np.ndarray) -> np.ndarray:
+        """Оценка и учет среза: ``values`` - матрица (устройства x метрики), NaN - нет значения.
+
+        Возвращает оценку каждого устройства (NaN, пока статистика не накоплена).
+        """
+        rows = self._rows([str(device_id) for device_id in device_ids])
+        mean = self._mean[rows]
+        variance = self._variance[rows]
+        count = self._count[rows]
+        present = ~np.isnan(values)
+
+        # Оценка по статистике до учета нового значения
+        noise = np.maximum(np.sqrt(variance), self.min_relative_std * np.abs(mean) + 1e-9)
+        scores = np.where(present & (count >= self.warmup), np.abs(values - mean) / noise, np.nan)
+
+        # Первое значение задает среднее, далее - экспоненциальное обновление
+        first = present & (count == 0)
+        diff = np.where(present, values - mean, 0.0)
+        step = self.alpha * diff
+        self._mean[rows] = np.where(first, values, mean + step)
+        self._variance[rows] = np.where(first, 0.0, np.where(present, (1 - self.alpha) * (variance + diff * step), variance))
+        self._count[rows] = count + present
+
+        # Строки без единой оценки дают NaN без предупреждений numpy
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanmax(scores, axis=1) if len(self.metrics) else np.full(len(rows), np.nan)
+
+    def retain(self, device_ids: Iterable[str]):
+        """Сброс статистики устройств, отсутствующих в срезе"""
+        keep = set(str(device_id) for device_id in device_ids)
+        for device_id in [device_id for device_id in self._index if device_id not in keep]:
+            row = self._index.pop(device_id)
+            self._mean[row] = 0.0
+            self._variance[row] = 0.0
+            self._count[row] = 0
+            self._free.append(row)
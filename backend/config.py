@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Dict
 import os
 
 class Settings(BaseSettings):
@@ -39,10 +39,94 @@ class Settings(BaseSettings):
     ZABBIX_USERNAME: str = ""
     ZABBIX_PASSWORD: str = ""
     ZABBIX_ENABLED: bool = False
+    ZABBIX_AUTH_TTL_SECONDS: int = 900
+    ZABBIX_ITEM_BATCH_SIZE: int = 200
+    ZABBIX_ITEM_PAGE_LIMIT: int = 50000
+    ZABBIX_ITEM_CONCURRENCY: int = 4
     
     # Prometheus
     PROMETHEUS_URL: str = "http://prometheus:9090"
     PROMETHEUS_ENABLED: bool = False
+    PROMETHEUS_MAX_POINTS_PER_QUERY: int = 1000
+    PROMETHEUS_SCRAPE_INTERVAL_SECONDS: int = 15
+    PROMETHEUS_INSTANCE_INDEX_TTL_SECONDS: int = 300
+    PROMQL_CACHE_ENABLED: bool = True
+    # Таймаут подключения и операций Redis кэша и пауза обхода кэша после ошибки
+    PROMQL_CACHE_REDIS_TIMEOUT_SECONDS: float = 0.25
+    PROMQL_CACHE_BREAKER_SECONDS: float = 30.0
+    
+    # Фоновый опрос устройств
+    MONITORING_POLLER_ENABLED: bool = True
+    MONITORING_POLL_INTERVAL_SECONDS: int = 30
+    MONITORING_LAST_SEEN_FLUSH_SECONDS: int = 120
+    MONITORING_RULES_PATH: str = "monitoring_rules.yaml"
+    MONITORING_PAGE_MAX_LIMIT: int = 500
+    EXPORT_PAGE_SIZE: int = 5000
+    
+    # Массовая загрузка логов мониторинга
+    INGEST_MAX_REQUEST_RECORDS: int = 50000
+    INGEST_MAX_REQUEST_BYTES: int = 32 * 1024 * 1024
+    INGEST_BUFFER_CAPACITY: int = 200000
+    INGEST_BATCH_SIZE: int = 5000
+    INGEST_FLUSH_INTERVAL_SECONDS: float = 1.0
+    # Повторы пакета при временных ошибках записи (затем пакет отбрасывается)
+    INGEST_MAX_RETRIES: int = 5
+    
+    # Жизненный цикл предупреждений
+    ALERT_RAISE_AFTER: int = 2
+    ALERT_CLEAR_AFTER: int = 2
+    ALERT_FLAP_WINDOW_SECONDS: int = 3600
+    ALERT_FLAP_THRESHOLD: int = 4
+    ALERT_FLAP_CLEAR_AFTER: int = 10
+    
+    # Потоковое обнаружение аномалий метрик (EWMA)
+    ANOMALY_ALPHA: float = 0.1
+    ANOMALY_WARMUP_SAMPLES: int = 10
+    MONITORING_HISTORY_CACHE_SIZE: int = 2048
+    MONITORING_HISTORY_MAX_POINTS: int = 5000
+    
+    # Локальное хранилище последних метрик
+    TSDB_ENABLED: bool = True
+    TSDB_RETENTION_SECONDS: int = 24 * 3600
+    # Память: 4 байта x 5 метрик x (RETENTION / POLL_INTERVAL) срезов на устройство,
+    # около 57 КБ на устройство при значениях по умолчанию; остальные устройства - из Prometheus
+    TSDB_MAX_DEVICES: int = 10000
+    
+    # Активная проверка доступности устройств (ICMP/TCP), включается явно
+    PROBE_ENABLED: bool = False
+    PROBE_INTERVAL_SECONDS: int = 60
+    PROBE_TIMEOUT_SECONDS: float = 1.0
+    PROBE_CONCURRENCY: int = 2048
+    PROBE_METHODS: List[str] = ["icmp", "tcp"]
+    PROBE_TCP_PORTS: List[int] = [22, 443]
+    PROBE_JITTER: float = 0.1
+    PROBE_BUFFER_CAPACITY: int = 200000
+    PROBE_WRITE_BATCH_SIZE: int = 5000
+    # Хранение ping_results: строки старше срока удаляются раз в интервал очистки
+    PROBE_RESULTS_RETENTION_DAYS: int = 30
+    PROBE_RESULTS_PRUNE_INTERVAL_SECONDS: int = 3600
+    
+    # Рассылка по WebSocket
+    WS_QUEUE_SIZE: int = 32
+    WS_SLOW_CLIENT_POLICY: str = "drop_oldest"  # drop_oldest, disconnect
+    WS_MAX_DROPPED_FRAMES: int = 64
+    WS_SEND_TIMEOUT_SECONDS: float = 10.0
+    WS_FRAME_INTERVAL_SECONDS: float = 5.0
+    WS_DELTA_HISTORY: int = 60  # версий; отставшие клиенты получают полный снимок
+    # Обязательно при нескольких воркерах: аренда в Redis выбирает единственного
+    # производителя кадров и писателя опроса (статусы, предупреждения, проверки)
+    WS_BACKPLANE_ENABLED: bool = False
+    WS_BACKPLANE_PREFIX: str = "ws:monitoring"
+    WS_BACKPLANE_LEASE_SECONDS: float = 15.0
+    WS_BACKPLANE_CHECKPOINT_VERSIONS: int = 12
+    
+    # Общие HTTP клиенты внешних систем
+    HTTP_TIMEOUT_SECONDS: float = 30.0
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_UPSTREAM_MAX_CONNECTIONS: Dict[str, int] = {"prometheus": 50, "zabbix": 20, "netbox": 10, "lansweeper": 10}
+    HTTP2_ENABLED: bool = False
     
     # NetBox
     NETBOX_URL: str = ""
@@ -2,6 +2,7 @@ from supabase import create_client, Client
 from config import settings
 import asyncio
 import json
+from datetime import datetime
 from typing import Optional, Dict, Any, List
 
 # Инициализация Supabase клиента
@@ -103,6 +104,28 @@ async def create_tables():
         source VARCHAR(50),
         timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
+    CREATE INDEX IF NOT EXISTS idx_monitoring_logs_timestamp_id ON monitoring_logs (timestamp DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS idx_monitoring_logs_device_timestamp_id ON monitoring_logs (device_id, timestamp DESC, id DESC);
+    """
+    
+    # Предупреждения мониторинга (пишутся только переходы состояний)
+    monitoring_alerts_table = """
+    CREATE TABLE IF NOT EXISTS monitoring_alerts (
+        id UUID PRIMARY KEY,
+        device_id VARCHAR(100) NOT NULL,
+        device_name VARCHAR(255),
+        alert_type VARCHAR(100) NOT NULL,
+        severity VARCHAR(20),
+        message TEXT,
+        status VARCHAR(20) NOT NULL,
+        flapping BOOLEAN DEFAULT false,
+        created_at TIMESTAMP NOT NULL,
+        acknowledged_at TIMESTAMP,
+        acknowledged_by VARCHAR(100),
+        resolved_at TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_monitoring_alerts_status_created_id ON monitoring_alerts (status, created_at DESC, id DESC);
     """
     
     # Сетевые устройства
@@ -120,9 +143,26 @@ async def create_tables():
         serial_number VARCHAR(100),
         last_seen TIMESTAMP,
         metadata JSONB,
+        last_ping TIMESTAMP,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
+    ALTER TABLE network_devices ADD COLUMN IF NOT EXISTS last_ping TIMESTAMP;
+    """
+    
+    # Результаты активной проверки доступности устройств
+    ping_results_table = """
+    CREATE TABLE IF NOT EXISTS ping_results (
+        id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+        device_id VARCHAR(100) NOT NULL,
+        ip_address INET,
+        status VARCHAR(20) NOT NULL,
+        response_time REAL,
+        method VARCHAR(20),
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_ping_results_device_timestamp ON ping_results (device_id, timestamp DESC);
+    CREATE INDEX IF NOT EXISTS idx_ping_results_timestamp ON ping_results (timestamp);
     """
     
     # Аннотации сети
@@ -187,6 +227,7 @@ async def create_tables():
         resolved BOOLEAN DEFAULT false,
         timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
+    CREATE INDEX IF NOT EXISTS idx_security_logs_timestamp_id ON security_logs (timestamp, id);
     """
     
     # Уведомления
@@ -209,7 +250,9 @@ async def create_tables():
         checklists_table,
         sast_results_table,
         monitoring_logs_table,
+        monitoring_alerts_table,
         network_devices_table,
+        ping_results_table,
         network_annotations_table,
         integrations_table,
         audit_logs_table,
@@ -295,6 +338,37 @@ class DatabaseManager:
             print(f"Ошибка логирования безопасности: {e}")
             return None
     
+    async def upsert_rows(self, table: str, rows: List[Dict[str, Any]]) -> int:
+        """Пакетная запись строк одним upsert запросом"""
+        if not rows:
+            return 0
+        try:
+            await asyncio.to_thread(self.client.table(table).upsert(rows).execute)
+            return len(rows)
+        except Exception as e:
+            print(f"Ошибка пакетной записи в {table}: {e}")
+            return 0
+    
+    async def update_by_ids(self, table: str, values: Dict[str, Any], ids: List[Any]) -> bool:
+        """Запись одинаковых значений в существующие строки по id (без вставки новых)"""
+        if not ids:
+            return True
+        try:
+            await asyncio.to_thread(self.client.table(table).update(values).in_('id', ids).execute)
+            return True
+        except Exception as e:
+            print(f"Ошибка пакетного обновления {table}: {e}")
+            return False
+    
+    async def delete_older_than(self, table: str, column: str, cutoff: datetime) -> bool:
+        """Удаление строк, у которых column раньше cutoff"""
+        try:
+            await asyncio.to_thread(self.client.table(table).delete().lt(column, cutoff.isoformat()).execute)
+            return True
+        except Exception as e:
+            print(f"Ошибка удаления старых строк {table}: {e}")
+            return False
+    
     async def create_notification(self, notification_data: Dict[str, Any]) -> Dict[str, Any]:
         """Создание уведомления"""
         try:
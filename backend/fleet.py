@@ -0,0 +1,328 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+class FleetSnapshot:
+    """Неизменяемый снимок состояния парка устройств"""
+
+    def __init__(self, devices: List[Any], taken_at: datetime, duration: float):
+        self.devices: Dict[str, Any] = {str(device.device_id): device for device in devices}
+        self.taken_at = taken_at
+        self.duration = duration
+        self._monotonic = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        """Возраст снимка в секундах"""
+        return time.monotonic() - self._monotonic
+
+    def get(self, device_id: str) -> Optional[Any]:
+        return self.devices.get(str(device_id))
+
+    def list(self) -> List[Any]:
+        return list(self.devices.values())
+
+# Число корзин гистограммы процентов (0..100 с шагом 1%)
+PERCENT_BUCKETS = 101
+
+# Суммы хранятся целыми тысячными долями: сложение и вычитание вкладов
+# точные, поэтому ошибка округления не накапливается между опросами
+FIXED_POINT_SCALE = 1000
+
+def to_fixed(value: float) -> int:
+    return round(value * FIXED_POINT_SCALE)
+
+class FleetAggregates:
+    """Инкрементально поддерживаемые агрегаты по парку устройств.
+
+    Вклад каждого устройства запоминается, поэтому при изменении его
+    состояния агрегаты корректируются на разницу, а чтение обзора
+    выполняется за O(1) без обхода устройств. Процентили считаются по
+    гистограмме с фиксированным числом корзин. Суммы ведутся в целых
+    тысячных долях (``FIXED_POINT_SCALE``), чтобы не накапливать ошибку.
+    """
+
+    def __init__(self):
+        self.status_counts: Dict[str, int] = {}
+        self.traffic_in_fixed = 0
+        self.traffic_out_fixed = 0
+        self.cpu_sum_fixed = 0
+        self.cpu_count = 0
+        self.memory_sum_fixed = 0
+        self.memory_count = 0
+        self.cpu_histogram = [0] * PERCENT_BUCKETS
+        self.memory_histogram = [0] * PERCENT_BUCKETS
+        self._contributions: Dict[str, tuple] = {}
+
+    @staticmethod
+    def _bucket(value: int) -> int:
+        return min(max(value // FIXED_POINT_SCALE, 0), PERCENT_BUCKETS - 1)
+
+    def _add(self, contribution: tuple, sign: int):
+        status, traffic_in, traffic_out, cpu, memory = contribution
+        self.status_counts[status] = self.status_counts.get(status, 0) + sign
+        self.traffic_in_fixed += sign * traffic_in
+        self.traffic_out_fixed += sign * traffic_out
+        if cpu is not None:
+            self.cpu_sum_fixed += sign * cpu
+            self.cpu_count += sign
+            self.cpu_histogram[self._bucket(cpu)] += sign
+        if memory is not None:
+            self.memory_sum_fixed += sign * memory
+            self.memory_count += sign
+            self.memory_histogram[self._bucket(memory)] += sign
+
+    def update(self, device: Any):
+        """Учет нового состояния устройства"""
+        device_id = str(device.device_id)
+        contribution = (
+            device.status,
+            to_fixed(device.network_in or 0.0),
+            to_fixed(device.network_out or 0.0),
+            to_fixed(device.cpu_usage) if device.cpu_usage is not None else None,
+            to_fixed(device.memory_usage) if device.memory_usage is not None else None
+        )
+        previous = self._contributions.get(device_id)
+        if previous == contribution:
+            return
+        if previous is not None:
+            self._add(previous, -1)
+        self._add(contribution, 1)
+        self._contributions[device_id] = contribution
+
+    def remove(self, device_id: str):
+        """Исключение устройства из агрегатов"""
+        previous = self._contributions.pop(str(device_id), None)
+        if previous is not None:
+            self._add(previous, -1)
+
+    @property
+    def total(self) -> int:
+        return len(self._contributions)
+
+    def count(self, status: str) -> int:
+        return self.status_counts.get(status, 0)
+
+    @property
+    def traffic_in(self) -> float:
+        return self.traffic_in_fixed / FIXED_POINT_SCALE
+
+    @property
+    def traffic_out(self) -> float:
+        return self.traffic_out_fixed / FIXED_POINT_SCALE
+
+    @property
+    def average_cpu(self) -> float:
+        return self.cpu_sum_fixed / FIXED_POINT_SCALE / self.cpu_count if self.cpu_count else 0
+
+    @property
+    def average_memory(self) -> float:
+        return self.memory_sum_fixed / FIXED_POINT_SCALE / self.memory_count if self.memory_count else 0
+
+    @staticmethod
+    def _percentile(histogram: List[int], count: int, q: float) -> float:
+        if not count:
+            return 0
+        rank = q / 100 * count
+        seen = 0
+        for bucket, bucket_count in enumerate(histogram):
+            seen += bucket_count
+            if seen >= rank:
+                return float(bucket)
+        return float(PERCENT_BUCKETS - 1)
+
+    def cpu_percentile(self, q: float) -> float:
+        return self._percentile(self.cpu_histogram, self.cpu_count, q)
+
+    def memory_percentile(self, q: float) -> float:
+        return self._percentile(self.memory_histogram, self.memory_count, q)
+
+class DeviceStatusWriter:
+    """Запись статусов устройств в БД только по изменениям.
+
+    Изменившиеся статусы записываются за цикл опроса, а обновления
+    ``last_seen`` накапливаются и сбрасываются не чаще раза в
+    ``flush_interval`` секунд. Строки с одинаковыми значениями
+    обновляются одним запросом по списку id (группами по ``batch_size``),
+    поэтому удаленное за время опроса устройство не создается заново.
+    Не записанные из-за ошибки строки остаются в очереди до следующего
+    сброса.
+    """
+
+    def __init__(self, table: str, flush_interval: float, batch_size: int = 500):
+        self.table = table
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._last_seen: Dict[str, datetime] = {}
+        self._pending_seen: Dict[str, Dict[str, Any]] = {}
+        self._changed: Dict[str, Dict[str, Any]] = {}
+        self._last_flush = time.monotonic()
+
+    def last_seen(self, db_device: Dict[str, Any]) -> Optional[datetime]:
+        """Время последнего опроса устройства (из памяти или из БД)"""
+        known = self._last_seen.get(str(db_device['id']))
+        if known is not None:
+            return known
+        if db_device.get('last_seen'):
+            return datetime.fromisoformat(db_device['last_seen'])
+        return None
+
+    def record(self, db_device: Dict[str, Any], status: str, seen_at: datetime):
+        """Учет результата опроса устройства"""
+        device_id = str(db_device['id'])
+        self._last_seen[device_id] = seen_at
+        row = {'id': db_device['id'], 'last_seen': seen_at.isoformat()}
+        
+        if status != db_device.get('status'):
+            row['status'] = status
+            self._changed[device_id] = row
+            self._pending_seen.pop(device_id, None)
+        elif device_id in self._changed:
+            # Не записанное изменение статуса получает новое время опроса
+            self._changed[device_id]['last_seen'] = row['last_seen']
+        else:
+            self._pending_seen[device_id] = row
+
+    @property
+    def pending(self) -> int:
+        """Число строк, ожидающих записи"""
+        return len(self._changed) + len(self._pending_seen)
+
+    def retain(self, device_ids):
+        """Удаление из памяти устройств, отсутствующих в БД"""
+        for device_id in self._last_seen.keys() - set(device_ids):
+            self._last_seen.pop(device_id, None)
+            self._pending_seen.pop(device_id, None)
+            self._changed.pop(device_id, None)
+
+    async def _write(self, rows: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Запись строк группами одинаковых значений; возвращает не записанные"""
+        groups: Dict[tuple, List[str]] = {}
+        for device_id, row in rows.items():
+            values = tuple(sorted((key, value) for key, value in row.items() if key != 'id'))
+            groups.setdefault(values, []).append(device_id)
+        
+        failed: Dict[str, Dict[str, Any]] = {}
+        for values, device_ids in groups.items():
+            for start in range(0, len(device_ids), self.batch_size):
+                batch = device_ids[start:start + self.batch_size]
+                if not await db.update_by_ids(self.table, dict(values), [rows[device_id]['id'] for device_id in batch]):
+                    failed.update((device_id, rows[device_id]) for device_id in batch)
+        return failed
+
+    async def flush(self, force: bool = False) -> int:
+        """Запись изменений статуса и периодический сброс last_seen"""
+        changed, self._changed = self._changed, {}
+        seen: Dict[str, Dict[str, Any]] = {}
+        if force or time.monotonic() - self._last_flush >= self.flush_interval:
+            seen, self._pending_seen = self._pending_seen, {}
+            self._last_flush = time.monotonic()
+        
+        failed_changed = await self._write(changed)
+        failed_seen = await self._write(seen)
+        
+        # Строки, обновленные новым опросом во время записи, не перезаписываются старыми
+        for device_id, row in failed_changed.items():
+            self._changed.setdefault(device_id, row)
+        for device_id, row in failed_seen.items():
+            if device_id not in self._changed:
+                self._pending_seen.setdefault(device_id, row)
+        return len(changed) + len(seen) - len(failed_changed) - len(failed_seen)
+
+class FleetPoller:
+    """Фоновый опрос состояния парка устройств.
+
+    Периодически вызывает ``collect`` и публикует результат как
+    FleetSnapshot, который эндпоинты читают без обращения к внешним
+    системам.
+    """
+
+    def __init__(self, collect: Callable[[], Awaitable[List[Any]]], interval: float):
+        self.collect = collect
+        self.interval = interval
+        self.snapshot: Optional[FleetSnapshot] = None
+        self.aggregates = FleetAggregates()
+        self.listeners: List[Callable[[FleetSnapshot], Any]] = []
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        """Выполняется ли фоновый опрос"""
+        return self._task is not None and not self._task.done()
+
+    def _fresh(self, max_age: Optional[float]) -> bool:
+        return self.snapshot is not None and (max_age is None or self.snapshot.age < max_age)
+
+    async def refresh(self, max_age: Optional[float] = None) -> FleetSnapshot:
+        """Внеочередной опрос парка и публикация нового снимка.
+
+        Если задан ``max_age`` и снимок моложе него (например, его только
+        что получил параллельный запрос), опрос не выполняется.
+        """
+        async with self._lock:
+            if max_age is not None and self._fresh(max_age):
+                return self.snapshot
+            started = time.monotonic()
+            devices = await self.collect()
+            snapshot = FleetSnapshot(devices, datetime.utcnow(), time.monotonic() - started)
+            
+            # Агрегаты корректируются только по изменившимся устройствам
+            previous = self.snapshot.devices if self.snapshot else {}
+            for device_id, device in snapshot.devices.items():
+                if previous.get(device_id) != device:
+                    self.aggregates.update(device)
+            for device_id in previous.keys() - snapshot.devices.keys():
+                self.aggregates.remove(device_id)
+            
+            self.snapshot = snapshot
+        
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика снимка парка: {e}")
+        
+        return snapshot
+
+    async def get_snapshot(self) -> FleetSnapshot:
+        """Текущий снимок; если опрос еще не выполнялся - ожидание первого.
+
+        Без фонового опроса снимок старше ``interval`` обновляется по запросу.
+        """
+        max_age = None if self.running else self.interval
+        if self._fresh(max_age):
+            return self.snapshot
+        return await self.refresh(max_age if max_age is not None else float("inf"))
+
+    async def _run(self):
+        while True:
+            try:
+                snapshot = await self.refresh()
+                logger.debug(f"Снимок парка обновлен: {len(snapshot.devices)} устройств за {snapshot.duration:.2f}с")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка опроса устройств: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Запуск фонового опроса"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка фонового опроса"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,74 @@
+import logging
+from typing import Dict
+
+import httpx
+
+from config import settings
+from metrics import InstrumentedTransport
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 требует пакет h2 (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Внешние системы, клиенты которых создаются при запуске приложения
+UPSTREAMS = ["prometheus", "zabbix", "netbox", "lansweeper"]
+
+class HTTPClientRegistry:
+    """Реестр общих httpx.AsyncClient по внешним системам.
+
+    Каждая система получает собственный пул соединений с keep-alive и
+    ограничением числа подключений, поэтому TCP/TLS рукопожатие
+    выполняется один раз на соединение, а не на каждый запрос.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.http2 = settings.HTTP2_ENABLED and HTTP2_AVAILABLE
+        if settings.HTTP2_ENABLED and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 включен, но пакет h2 не установлен - используется HTTP/1.1")
+
+    def _create_client(self, upstream: str) -> httpx.AsyncClient:
+        """Создание клиента с пулом соединений для системы"""
+        max_connections = settings.HTTP_UPSTREAM_MAX_CONNECTIONS.get(upstream, settings.HTTP_MAX_CONNECTIONS)
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(settings.HTTP_MAX_KEEPALIVE_CONNECTIONS, max_connections),
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        )
+        # Транспорт задается явно, чтобы замерять время каждого обращения
+        transport = httpx.AsyncHTTPTransport(limits=limits, http2=self.http2)
+        return httpx.AsyncClient(
+            transport=InstrumentedTransport(upstream, transport),
+            timeout=settings.HTTP_TIMEOUT_SECONDS
+        )
+
+    def get(self, upstream: str) -> httpx.AsyncClient:
+        """Получение общего клиента системы (создается при первом обращении)"""
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            client = self._create_client(upstream)
+            self._clients[upstream] = client
+        return client
+
+    async def startup(self):
+        """Создание клиентов для известных систем"""
+        for upstream in UPSTREAMS:
+            self.get(upstream)
+        logger.info(f"HTTP клиенты созданы: {', '.join(UPSTREAMS)} (HTTP/2: {self.http2})")
+
+    async def shutdown(self):
+        """Закрытие всех клиентов и их пулов соединений"""
+        clients, self._clients = self._clients, {}
+        for upstream, client in clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Ошибка закрытия HTTP клиента {upstream}: {e}")
+
+# Общий реестр клиентов приложения
+http_clients = HTTPClientRegistry()
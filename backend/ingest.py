@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import db, supabase
+
+logger = logging.getLogger(__name__)
+
+# Коды ошибок Postgres, после которых повтор пакета имеет смысл:
+# соединение (08), откат транзакции (40), нехватка ресурсов (53),
+# вмешательство оператора (57); у PostgREST - PGRST000-PGRST003
+_TRANSIENT_SQLSTATE = ("08", "40", "53", "57")
+_TRANSIENT_POSTGREST = ("PGRST000", "PGRST001", "PGRST002", "PGRST003")
+
+def is_permanent_error(error: Exception) -> bool:
+    """Ошибка в самих данных пакета (4xx PostgREST, нарушение ограничений)"""
+    code = getattr(error, "code", None)
+    if not isinstance(code, str) or not code:
+        # Сетевые ошибки и таймауты не несут кода ответа
+        return False
+    if code.startswith("PGRST"):
+        return code not in _TRANSIENT_POSTGREST
+    return not code.startswith(_TRANSIENT_SQLSTATE)
+
+class IngestBuffer:
+    """Буфер массовой записи строк в таблицу с обратным давлением.
+
+    Строки принимаются в память, пока не превышена емкость ``capacity``
+    (иначе ``offer`` возвращает False и клиент должен повторить позже),
+    и записываются фоновой задачей пакетами по ``batch_size`` не реже
+    раза в ``flush_interval`` секунд. Если задан ``audit_action``, на
+    каждый пакет пишется одна сводная запись аудита.
+
+    Пакет, не записанный из-за временной ошибки, повторяется первым, но
+    не более ``max_retries`` раз. Пакет, отклоненный из-за самих данных,
+    не повторяется: он пишется в журнал и учитывается в ``failed``.
+    """
+
+    def __init__(self, table: str, audit_action: Optional[str], capacity: int, batch_size: int,
+                 flush_interval: float, max_retries: int = 5):
+        self.table = table
+        self.audit_action = audit_action
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._rows: deque = deque()
+        # Пакет, ожидающий повтора, и число неудачных попыток его записи
+        self._retry: Optional[List[Tuple[Optional[str], Dict[str, Any]]]] = None
+        self._attempts = 0
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"accepted": 0, "rejected": 0, "flushed": 0, "failed": 0, "batches": 0}
+
+    @property
+    def depth(self) -> int:
+        """Число строк, ожидающих записи"""
+        return len(self._rows) + len(self._retry or ())
+
+    def offer(self, rows: List[Dict[str, Any]], user_id: Optional[str] = None) -> bool:
+        """Постановка строк в буфер; False, если буфер переполнен"""
+        if self.depth + len(rows) > self.capacity:
+            self.stats["rejected"] += len(rows)
+            return False
+        self._rows.extend((user_id, row) for row in rows)
+        self.stats["accepted"] += len(rows)
+        if self.depth >= self.batch_size:
+            self._ready.set()
+        return True
+
+    def _take(self) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+        if self._retry is not None:
+            batch, self._retry = self._retry, None
+            return batch
+        count = min(self.batch_size, len(self._rows))
+        return [self._rows.popleft() for _ in range(count)]
+
+    async def _write(self, batch: List[Tuple[Optional[str], Dict[str, Any]]]):
+        rows = [row for _, row in batch]
+        try:
+            await asyncio.to_thread(supabase.table(self.table).insert(rows).execute)
+        except Exception as e:
+            self._attempts += 1
+            if is_permanent_error(e) or self._attempts > self.max_retries:
+                # Повтор не поможет: пакет отбрасывается с образцом строки в журнале
+                logger.error(
+                    f"Пакет из {len(rows)} строк для {self.table} отброшен "
+                    f"после {self._attempts} попыток: {e}; первая строка: {rows[0]}"
+                )
+                self.stats["failed"] += len(rows)
+                self._attempts = 0
+            else:
+                logger.error(f"Ошибка записи пакета в {self.table} (попытка {self._attempts}): {e}")
+                self._retry = batch
+            return False
+
+        self._attempts = 0
+        self.stats["flushed"] += len(rows)
+        self.stats["batches"] += 1
+
+        if self.audit_action:
+            users: Dict[str, int] = {}
+            for user_id, _ in batch:
+                users[str(user_id)] = users.get(str(user_id), 0) + 1
+            await db.log_audit_event({
+                "user_id": batch[0][0] if len(users) == 1 else None,
+                "action": self.audit_action,
+                "resource_type": self.table,
+                "details": {"count": len(rows), "users": users}
+            })
+        return True
+
+    async def flush(self):
+        """Запись всех накопленных строк"""
+        while self.depth:
+            if not await self._write(self._take()):
+                break
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._ready.clear()
+
+            while self.depth:
+                written = await self._write(self._take())
+                if not written or self.depth < self.batch_size:
+                    break
+
+    def start(self):
+        """Запуск фоновой записи"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка фоновой записи с сохранением остатка буфера"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
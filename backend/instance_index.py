@@ -0,0 +1,84 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+def instance_host(instance: str) -> str:
+    """Хост из метки instance (без порта, с поддержкой [IPv6]:port)"""
+    if instance.startswith("["):
+        return instance[1:].split("]", 1)[0]
+    if instance.count(":") == 1:
+        return instance.split(":", 1)[0]
+    return instance
+
+class InstanceIndex:
+    """Индекс устройство -> точные значения метки ``instance`` Prometheus.
+
+    Значения метки периодически (не чаще раза в ``ttl`` секунд) читаются
+    из Prometheus и группируются по хосту; устройство сопоставляется с
+    ними по своему id и IP адресу. Запросы по устройству строятся с
+    точным сопоставлением метки вместо регулярного выражения.
+    """
+
+    def __init__(self, load_instances: Callable[[], Awaitable[List[str]]], ttl: float):
+        self.load_instances = load_instances
+        self.ttl = ttl
+        self._by_host: Dict[str, List[str]] = {}
+        self._device_hosts: Dict[str, List[str]] = {}
+        self._refreshed_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def stale(self) -> bool:
+        return self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.ttl
+
+    async def refresh(self, force: bool = False):
+        """Перечитывание значений метки instance, если индекс устарел"""
+        if not force and not self.stale:
+            return
+        async with self._lock:
+            if not force and not self.stale:
+                return
+            try:
+                instances = await self.load_instances()
+            except Exception as e:
+                # При ошибке остается прежний индекс, повтор - на следующем обращении после ttl
+                logger.error(f"Ошибка загрузки меток instance: {e}")
+                self._refreshed_at = time.monotonic()
+                return
+            by_host: Dict[str, List[str]] = {}
+            for instance in instances:
+                by_host.setdefault(instance_host(instance), []).append(instance)
+            self._by_host = by_host
+            self._refreshed_at = time.monotonic()
+            logger.debug(f"Индекс instance обновлен: {len(instances)} значений")
+
+    def update_devices(self, db_devices: Iterable[Dict[str, Any]]):
+        """Хосты устройств из инвентаря (id и IP адрес)"""
+        device_hosts: Dict[str, List[str]] = {}
+        for db_device in db_devices:
+            device_id = str(db_device['id'])
+            hosts = [device_id]
+            if db_device.get('ip_address'):
+                hosts.append(str(db_device['ip_address']).split('/')[0])
+            device_hosts[device_id] = hosts
+        self._device_hosts = device_hosts
+
+    def instances(self, device_id: str) -> List[str]:
+        """Значения метки instance устройства"""
+        hosts = self._device_hosts.get(str(device_id), [str(device_id)])
+        return sorted({instance for host in hosts for instance in self._by_host.get(host, [])})
+
+    def matcher(self, device_id: str) -> Optional[str]:
+        """Селектор метки instance устройства (None, если рядов нет)"""
+        instances = self.instances(device_id)
+        if not instances:
+            return None
+        if len(instances) == 1:
+            return f"instance={json.dumps(instances[0])}"
+        # Перечисление литералов Prometheus проверяет как множество значений
+        return "instance=~`" + "|".join(re.escape(instance) for instance in instances) + "`"
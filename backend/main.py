@@ -2,7 +2,7 @@ from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, F
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhostmiddleware import TrustedHostMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text, Float
 from sqlalchemy.ext.declarative import declarative_base
@@ -24,6 +24,15 @@ import shutil
 from contextlib import asynccontextmanager
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import uvicorn
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from config import settings
+from database import init_db, supabase
+from http_clients import http_clients
+from metrics import WEBSOCKET_CLIENTS, InstrumentedRedis, MetricsMiddleware, instrument_supabase, queue_depths, start_metrics_server
+from routers import auth, documents, sast, monitoring, network, integrations
+from ws_feed import MonitoringFeed
+from ws_hub import WebSocketHub
 
 # Настройка логирования
 logging.basicConfig(
@@ -58,7 +67,7 @@ Base = declarative_base()
 
 # Redis для кэширования
 try:
-    redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+    redis_client = InstrumentedRedis.from_url(REDIS_URL, decode_responses=True)
     redis_client.ping()
     logger.info("Redis подключен успешно")
 except Exception as e:
@@ -186,6 +195,20 @@ def get_db():
 async def lifespan(app: FastAPI):
     # Инициализация при запуске
     await init_db()
+    await http_clients.startup()
+    if settings.PROMETHEUS_METRICS_ENABLED:
+        instrument_supabase(supabase)
+        if settings.PROMETHEUS_METRICS_PORT:
+            start_metrics_server(settings.PROMETHEUS_METRICS_PORT)
+    monitoring.log_ingest_buffer.start()
+    if settings.MONITORING_POLLER_ENABLED:
+        monitoring.fleet_poller.start()
+    monitoring.probe_results_buffer.start()
+    if settings.PROBE_ENABLED:
+        monitoring.device_prober.start()
+    if monitoring.ws_backplane is not None:
+        monitoring.ws_backplane.start()
+    monitoring_feed.start()
     print("🚀 Приложение запущено")
     
     # Создание супер администратора по умолчанию
@@ -208,6 +231,17 @@ async def lifespan(app: FastAPI):
     yield
     
     # Очистка при остановке
+    await monitoring_feed.stop()
+    if monitoring.ws_backplane is not None:
+        await monitoring.ws_backplane.stop()
+    await manager.close_all()
+    await monitoring.fleet_poller.stop()
+    await monitoring.device_prober.stop()
+    await monitoring.log_ingest_buffer.stop()
+    await monitoring.probe_results_buffer.stop()
+    await monitoring.status_writer.flush(force=True)
+    await monitoring.promql_cache.close()
+    await http_clients.shutdown()
     print("🛑 Приложение остановлено")
 
 # Создание FastAPI приложения
@@ -227,8 +261,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Snapshot-Age", "X-Snapshot-Taken-At"],
 )
 
+# Метрики Prometheus
+if settings.PROMETHEUS_METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Подключение статических файлов
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
@@ -256,6 +295,11 @@ app.include_router(monitoring.router, prefix="/api/monitoring", tags=["Network M
 app.include_router(network.router, prefix="/api/network", tags=["Network Visualization"])
 app.include_router(integrations.router, prefix="/api/integrations", tags=["Integrations"])
 
+# Глубина внутренних очередей для метрик
+queue_depths.add("monitoring_logs_ingest", lambda: monitoring.log_ingest_buffer.depth)
+queue_depths.add("ping_results", lambda: monitoring.probe_results_buffer.depth)
+queue_depths.add("device_status_writes", lambda: monitoring.status_writer.pending)
+
 # Основные эндпоинты
 @app.get("/")
 async def root():
@@ -290,6 +334,13 @@ async def health_check():
             "error": str(e)
         }
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Метрики приложения в формате Prometheus"""
+    if not settings.PROMETHEUS_METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/api/user/profile")
 async def get_user_profile(current_user = Depends(get_current_user)):
     """Получение профиля пользователя"""
@@ -304,51 +355,45 @@ from fastapi import WebSocket, WebSocketDisconnect
 import json
 import asyncio
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                await self.disconnect(connection)
-
-manager = ConnectionManager()
+# Рассылка кадров с отдельной очередью и задачей отправки на каждого клиента
+manager = WebSocketHub(
+    queue_size=settings.WS_QUEUE_SIZE,
+    policy=settings.WS_SLOW_CLIENT_POLICY,
+    max_dropped=settings.WS_MAX_DROPPED_FRAMES,
+    send_timeout=settings.WS_SEND_TIMEOUT_SECONDS
+)
+WEBSOCKET_CLIENTS.set_function(lambda: len(manager.clients))
+queue_depths.add("websocket_send", lambda: manager.depth)
+
+# Единственный производитель кадров (снимок и дельты) по снимку парка устройств
+monitoring_feed = MonitoringFeed(
+    manager,
+    monitoring.fleet_poller,
+    settings.WS_FRAME_INTERVAL_SECONDS,
+    settings.WS_DELTA_HISTORY,
+    backplane=monitoring.ws_backplane,
+    checkpoint_every=settings.WS_BACKPLANE_CHECKPOINT_VERSIONS
+)
 
 @app.websocket("/ws/monitoring")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, token: Optional[str] = None):
+    # Браузер не передает заголовок Authorization при открытии WebSocket - токен в query-параметре
     try:
-        while True:
-            # Симуляция данных мониторинга
-            monitoring_data = {
-                "timestamp": "2024-01-15T10:30:00Z",
-                "devices": [
-                    {"id": 1, "name": "Server-01", "status": "online", "cpu": 45.2, "ram": 67.8},
-                    {"id": 2, "name": "Router-01", "status": "online", "cpu": 23.1, "ram": 34.5},
-                    {"id": 3, "name": "Switch-01", "status": "offline", "cpu": 0, "ram": 0}
-                ],
-                "network_traffic": {
-                    "incoming": 1024.5,
-                    "outgoing": 756.3
-                }
-            }
-            await websocket.send_text(json.dumps(monitoring_data))
-            await asyncio.sleep(5)  # Отправка данных каждые 5 секунд
+        auth.verify_token(token or "")
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    client = await manager.connect(websocket)
+    monitoring_feed.welcome(client)
+    try:
+        # Кадры отправляет задача клиента, здесь только подтверждения версий от клиента
+        while not client.closed:
+            monitoring_feed.receive(client, await websocket.receive_text())
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
+    finally:
+        await manager.disconnect(client)
 
 if __name__ == "__main__":
     uvicorn.run(
@@ -0,0 +1,191 @@
+import logging
+import subprocess
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+import httpx
+import redis
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import REGISTRY, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин для внешних вызовов и подпроцессов (секунды)
+UPSTREAM_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SUBPROCESS_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+REQUEST_LATENCY = Histogram(
+    "networkview_http_request_duration_seconds",
+    "Время обработки HTTP запросов",
+    ["method", "route", "status"]
+)
+
+UPSTREAM_LATENCY = Histogram(
+    "networkview_upstream_request_duration_seconds",
+    "Время обращений к внешним системам",
+    ["upstream", "operation", "outcome"],
+    buckets=UPSTREAM_BUCKETS
+)
+
+SUBPROCESS_DURATION = Histogram(
+    "networkview_subprocess_duration_seconds",
+    "Время выполнения внешних инструментов сканирования",
+    ["tool", "outcome"],
+    buckets=SUBPROCESS_BUCKETS
+)
+
+PROMQL_CACHE_REQUESTS = Counter(
+    "networkview_promql_cache_requests_total",
+    "Обращения к кэшу запросов Prometheus",
+    ["kind", "result"]
+)
+
+WEBSOCKET_CLIENTS = Gauge(
+    "networkview_websocket_clients",
+    "Число подключенных WebSocket клиентов"
+)
+
+WEBSOCKET_DROPPED_FRAMES = Counter(
+    "networkview_websocket_dropped_frames_total",
+    "Кадры, вытесненные из переполненных очередей WebSocket клиентов"
+)
+
+WEBSOCKET_DISCONNECTS = Counter(
+    "networkview_websocket_disconnects_total",
+    "Отключения WebSocket клиентов",
+    ["reason"]
+)
+
+@contextmanager
+def observe(histogram: Histogram, **labels):
+    """Замер длительности блока с меткой outcome (ok, timeout, error)"""
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except (subprocess.TimeoutExpired, TimeoutError, httpx.TimeoutException):
+        outcome = "timeout"
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        histogram.labels(outcome=outcome, **labels).observe(time.perf_counter() - started)
+
+class QueueDepthCollector:
+    """Глубина внутренних очередей, считываемая в момент сбора метрик"""
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], int]] = {}
+
+    def add(self, queue: str, depth: Callable[[], int]):
+        self._sources[queue] = depth
+
+    def collect(self):
+        family = GaugeMetricFamily("networkview_queue_depth", "Число элементов во внутренних очередях", labels=["queue"])
+        for queue, depth in list(self._sources.items()):
+            try:
+                family.add_metric([queue], depth())
+            except Exception as e:
+                logger.warning(f"Ошибка чтения глубины очереди {queue}: {e}")
+        yield family
+
+queue_depths = QueueDepthCollector()
+REGISTRY.register(queue_depths)
+
+class MetricsMiddleware:
+    """ASGI middleware с гистограммой времени запросов по маршруту и статусу.
+
+    В метку route попадает шаблон пути маршрута (``/devices/{device_id}``),
+    а не фактический путь, чтобы число рядов не зависело от параметров.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], route, str(status)).observe(time.perf_counter() - started)
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Транспорт httpx с замером времени до получения заголовков ответа"""
+
+    def __init__(self, upstream: str, transport: httpx.AsyncBaseTransport):
+        self.upstream = upstream
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self.transport.handle_async_request(request)
+            outcome = str(response.status_code)
+            return response
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            raise
+        finally:
+            UPSTREAM_LATENCY.labels(self.upstream, request.method, outcome).observe(time.perf_counter() - started)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+class InstrumentedRedis(redis.Redis):
+    """Клиент Redis с замером времени каждой команды"""
+
+    def execute_command(self, *args, **options):
+        with observe(UPSTREAM_LATENCY, upstream="redis", operation=str(args[0]).lower()):
+            return super().execute_command(*args, **options)
+
+def instrument_supabase(client):
+    """Замер запросов Supabase (PostgREST) через хуки его httpx сессии.
+
+    Учитываются только полученные ответы: синхронный клиент не дает
+    перехватить ошибки соединения без замены его транспорта.
+    """
+    def on_request(request: httpx.Request):
+        request.extensions["metrics_started"] = time.perf_counter()
+
+    def on_response(response: httpx.Response):
+        started = response.request.extensions.get("metrics_started")
+        if started is None:
+            return
+        # Путь PostgREST: /rest/v1/<таблица>
+        table = response.request.url.path.rstrip("/").rsplit("/", 1)[-1]
+        UPSTREAM_LATENCY.labels("supabase", f"{response.request.method} {table}", str(response.status_code)).observe(
+            time.perf_counter() - started
+        )
+
+    try:
+        session = client.postgrest.session
+        session.event_hooks = {
+            "request": [*session.event_hooks["request"], on_request],
+            "response": [*session.event_hooks["response"], on_response]
+        }
+    except Exception as e:
+        logger.warning(f"Замер запросов Supabase недоступен: {e}")
+
+def start_metrics_server(port: int):
+    """Отдельный HTTP сервер метрик (при нескольких воркерах порт занимает первый)"""
+    try:
+        start_http_server(port)
+        logger.info(f"Метрики Prometheus доступны на порту {port}")
+    except OSError as e:
+        logger.warning(f"Сервер метрик на порту {port} не запущен: {e}")
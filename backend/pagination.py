@@ -0,0 +1,77 @@
+import asyncio
+import base64
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+def encode_cursor(timestamp: Any, row_id: Any) -> str:
+    """Непрозрачный курсор по паре (timestamp, id)"""
+    raw = json.dumps([str(timestamp), str(row_id)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Разбор курсора; ValueError при неверном формате.
+
+    Курсор приходит от клиента, поэтому обе части разбираются в типы
+    (время ISO 8601 и UUID): в фильтр запроса попадают только они.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        timestamp, row_id = datetime.fromisoformat(timestamp), uuid.UUID(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp, row_id
+
+def seek(query, column: str, cursor: Optional[str], limit: int, desc: bool = True):
+    """Keyset-выборка страницы: строки строго после курсора в порядке (column, id).
+
+    Вместо OFFSET используется условие по индексу (column, id), поэтому
+    стоимость запроса не зависит от глубины страницы.
+    """
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        timestamp, row_id = timestamp.isoformat(), str(row_id)
+        op = "lt" if desc else "gt"
+        query = query.or_(
+            f'{column}.{op}."{timestamp}",and({column}.eq."{timestamp}",id.{op}.{row_id})'
+        )
+    return query.order(column, desc=desc).order("id", desc=desc).limit(limit)
+
+def next_cursor(rows: list, column: str, limit: int) -> Optional[str]:
+    """Курсор следующей страницы (None, если страница последняя)"""
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(last[column], last["id"])
+
+def clamp_limit(limit: int, max_limit: int) -> int:
+    """Ограничение размера страницы на стороне сервера"""
+    return max(1, min(limit, max_limit))
+
+async def keyset_pages(make_query: Callable[[], Any], column: str, page_size: int,
+                       desc: bool = False) -> AsyncIterator[List[dict]]:
+    """Последовательный обход всей выборки страницами по (column, id).
+
+    ``make_query`` строит новый запрос с фильтрами (построитель запроса
+    изменяемый, поэтому на каждую страницу нужен свой). Следующая страница
+    запрашивается, пока вызывающий обрабатывает текущую; в памяти
+    одновременно не больше двух страниц.
+    """
+    def fetch(cursor: Optional[str]):
+        return asyncio.to_thread(seek(make_query(), column, cursor, page_size, desc).execute)
+
+    pending = asyncio.ensure_future(fetch(None))
+    try:
+        while pending is not None:
+            rows = (await pending).data or []
+            cursor = next_cursor(rows, column, page_size)
+            pending = asyncio.ensure_future(fetch(cursor)) if cursor else None
+            if rows:
+                yield rows
+    finally:
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import random
+import resource
+import socket
+import struct
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Типы сообщений ICMP
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+# Закрытие TCP сокета сразу с RST, без ожидания в TIME_WAIT
+SO_LINGER_RESET = struct.pack("ii", 1, 0)
+
+def icmp_checksum(data: bytes) -> int:
+    """Контрольная сумма ICMP (RFC 1071)"""
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+class ProbeResult:
+    """Результат проверки доступности одного устройства"""
+
+    __slots__ = ("device_id", "ip_address", "status", "response_time", "method", "timestamp")
+
+    def __init__(self, device_id: str, ip_address: str, status: str,
+                 response_time: Optional[float], method: Optional[str], timestamp: datetime):
+        self.device_id = device_id
+        self.ip_address = ip_address
+        self.status = status
+        self.response_time = response_time
+        self.method = method
+        self.timestamp = timestamp
+
+    def to_row(self) -> Dict[str, Any]:
+        """Строка таблицы ping_results"""
+        return {
+            "device_id": self.device_id,
+            "ip_address": self.ip_address,
+            "status": self.status,
+            "response_time": self.response_time,
+            "method": self.method,
+            "timestamp": self.timestamp.isoformat()
+        }
+
+class IcmpPinger:
+    """Эхо-запросы ICMP через один общий сокет без привилегий.
+
+    Используется сокет SOCK_DGRAM/IPPROTO_ICMP, который Linux разрешает
+    группам из net.ipv4.ping_group_range. Ответы читаются обработчиком
+    цикла событий и сопоставляются с ожидающими запросами по адресу и
+    порядковому номеру.
+    """
+
+    def __init__(self):
+        self._sock: Optional[socket.socket] = None
+        self._waiters: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._sequence = 0
+
+    @property
+    def available(self) -> bool:
+        return self._sock is not None
+
+    def open(self) -> bool:
+        """Открытие сокета; False, если ICMP без привилегий запрещен"""
+        if self._sock is not None:
+            return True
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        except OSError as e:
+            logger.warning(f"ICMP проверка недоступна, используется только TCP: {e}")
+            return False
+        sock.setblocking(False)
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._read)
+        self._sock = sock
+        return True
+
+    def close(self):
+        if self._sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        for waiter in self._waiters.values():
+            waiter.cancel()
+        self._waiters.clear()
+
+    def _read(self):
+        received = time.perf_counter()
+        while True:
+            try:
+                data, address = self._sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue
+            if len(data) < 8 or data[0] != ICMP_ECHO_REPLY:
+                continue
+            sequence = struct.unpack("!H", data[6:8])[0]
+            waiter = self._waiters.pop((address[0], sequence), None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(received)
+
+    async def ping(self, ip_address: str) -> Optional[float]:
+        """Время ответа в миллисекундах или None (таймаут задает вызывающий)"""
+        loop = asyncio.get_running_loop()
+        self._sequence = (self._sequence + 1) & 0xFFFF
+        sequence = self._sequence
+
+        # Идентификатор подставляет ядро по локальному порту сокета
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, 0, sequence)
+        payload = b"networkview-probe"
+        packet = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, icmp_checksum(header + payload), 0, sequence) + payload
+
+        key = (ip_address, sequence)
+        waiter = loop.create_future()
+        self._waiters[key] = waiter
+        try:
+            started = time.perf_counter()
+            await loop.sock_sendto(self._sock, packet, (ip_address, 0))
+            return ((await waiter) - started) * 1000
+        except OSError:
+            return None
+        finally:
+            if self._waiters.get(key) is waiter:
+                del self._waiters[key]
+
+async def tcp_ping(ip_address: str, port: int) -> Optional[float]:
+    """Время установки TCP соединения в миллисекундах или None.
+
+    Отказ в соединении (RST) тоже означает, что узел доступен.
+    """
+    loop = asyncio.get_running_loop()
+    family = socket.AF_INET6 if ":" in ip_address else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, SO_LINGER_RESET)
+    started = time.perf_counter()
+    try:
+        await loop.sock_connect(sock, (ip_address, port))
+    except ConnectionRefusedError:
+        pass
+    except OSError:
+        return None
+    finally:
+        sock.close()
+    return (time.perf_counter() - started) * 1000
+
+def raise_open_files_limit(required: int) -> int:
+    """Повышение мягкого лимита открытых файлов до required (не выше жесткого)"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = required if hard == resource.RLIM_INFINITY else min(required, hard)
+    if soft != resource.RLIM_INFINITY and soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        soft = target
+    return soft
+
+class Prober:
+    """Периодическая активная проверка доступности устройств.
+
+    На каждый раунд ``load_targets`` возвращает пары (device_id, ip),
+    которые проверяются пулом из ``concurrency`` сопрограмм в случайном
+    порядке. Для каждой цели одновременно запускаются ICMP эхо-запрос и
+    TCP подключения к ``tcp_ports``; первый ответ в пределах ``timeout``
+    считается успехом. Результаты раунда передаются в ``on_results``,
+    а интервал между раундами случайно смещается на долю ``jitter``.
+    """
+
+    def __init__(self, load_targets: Callable[[], Awaitable[List[Tuple[str, str]]]],
+                 on_results: Callable[[List[ProbeResult]], Awaitable[Any]],
+                 interval: float, timeout: float, concurrency: int,
+                 methods: List[str], tcp_ports: List[int], jitter: float = 0.0):
+        self.load_targets = load_targets
+        self.on_results = on_results
+        self.interval = interval
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.methods = list(methods)
+        self.tcp_ports = list(tcp_ports)
+        self.jitter = jitter
+        self.icmp = IcmpPinger()
+        self.stats = {"rounds": 0, "probed": 0, "online": 0, "last_round_seconds": 0.0}
+        self._task: Optional[asyncio.Task] = None
+
+    def _checks(self, ip_address: str) -> List[Tuple[str, Awaitable[Optional[float]]]]:
+        checks = []
+        if "icmp" in self.methods and self.icmp.available and ":" not in ip_address:
+            checks.append(("icmp", self.icmp.ping(ip_address)))
+        if "tcp" in self.methods:
+            checks.extend(("tcp", tcp_ping(ip_address, port)) for port in self.tcp_ports)
+        return checks
+
+    async def probe(self, device_id: str, ip_address: str) -> ProbeResult:
+        """Проверка одного устройства всеми доступными способами"""
+        timestamp = datetime.utcnow()
+        tasks = {asyncio.ensure_future(check): method for method, check in self._checks(ip_address)}
+        deadline = time.monotonic() + self.timeout
+        try:
+            pending = set(tasks)
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None and task.result() is not None:
+                        return ProbeResult(device_id, ip_address, "online", round(task.result(), 3), tasks[task], timestamp)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return ProbeResult(device_id, ip_address, "offline", None, None, timestamp)
+
+    async def run_round(self, targets: List[Tuple[str, str]]) -> List[ProbeResult]:
+        """Проверка всех целей с ограничением одновременных проверок"""
+        started = time.monotonic()
+        order = list(targets)
+        random.shuffle(order)
+        queue = iter(order)
+        results: List[ProbeResult] = []
+
+        async def worker():
+            for device_id, ip_address in queue:
+                results.append(await self.probe(device_id, ip_address))
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(order)))))
+
+        self.stats["rounds"] += 1
+        self.stats["probed"] = len(results)
+        self.stats["online"] = sum(1 for result in results if result.status == "online")
+        self.stats["last_round_seconds"] = round(time.monotonic() - started, 3)
+        return results
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                targets = await self.load_targets()
+                results = await self.run_round(targets)
+                await self.on_results(results)
+                logger.debug(f"Проверка доступности: {self.stats['online']}/{len(results)} за {self.stats['last_round_seconds']}с")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка проверки доступности устройств: {e}")
+            delay = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+            await asyncio.sleep(max(delay - (time.monotonic() - started), 0))
+
+    def start(self):
+        """Запуск фоновой проверки"""
+        if self._task is not None and not self._task.done():
+            return
+        if "icmp" in self.methods:
+            self.icmp.open()
+        # Каждая проверка может одновременно держать сокет на каждый TCP порт
+        required = self.concurrency * max(len(self.tcp_ports), 1) + 256
+        if raise_open_files_limit(required) < required:
+            logger.warning(f"Лимит открытых файлов ниже необходимого для проверки доступности ({required})")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка фоновой проверки"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.icmp.close()
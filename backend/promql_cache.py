@@ -0,0 +1,122 @@
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from redis import asyncio as aioredis
+
+from metrics import PROMQL_CACHE_REQUESTS, UPSTREAM_LATENCY, observe
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Строковые литералы PromQL, внутри которых пробелы значимы
+_PROMQL_STRING = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`[^`]*`)')
+
+def normalize_query(query: str) -> str:
+    """Запрос без лишних пробелов вне строковых литералов"""
+    parts = _PROMQL_STRING.split(query)
+    # Нечетные элементы - литералы, они сохраняются как есть
+    return "".join(part if i % 2 else " ".join(part.split()) for i, part in enumerate(parts)).strip()
+
+class PromQLCache:
+    """Общий для всех воркеров кэш ответов Prometheus в Redis.
+
+    Мгновенные запросы вычисляются на момент, выровненный вниз по
+    интервалу опроса Prometheus, поэтому все воркеры в пределах одного
+    интервала получают один ключ. Записи живут один интервал. Внутри
+    процесса одновременные промахи по одному ключу объединяются.
+
+    Операции с Redis ограничены таймаутом ``timeout`` секунд; после
+    ошибки кэш обходится ``breaker_seconds`` секунд, чтобы недоступный
+    Redis не добавлял задержку к каждому запросу.
+    """
+
+    def __init__(self, url: str, interval: int, enabled: bool = True, prefix: str = "promql",
+                 timeout: float = 0.25, breaker_seconds: float = 30.0):
+        self.url = url
+        self.interval = interval
+        self.enabled = enabled
+        self.prefix = prefix
+        self.timeout = timeout
+        self.breaker_seconds = breaker_seconds
+        # Монотонное время, до которого кэш обходится после ошибки Redis
+        self._open_until = 0.0
+        self._redis: Optional[aioredis.Redis] = None
+        self._flight = SingleFlight()
+
+    @property
+    def redis(self) -> aioredis.Redis:
+        if self._redis is None:
+            self._redis = aioredis.from_url(
+                self.url, socket_connect_timeout=self.timeout, socket_timeout=self.timeout
+            )
+        return self._redis
+
+    @property
+    def available(self) -> bool:
+        """Redis не отказывал последние ``breaker_seconds`` секунд"""
+        return time.monotonic() >= self._open_until
+
+    def _trip(self, error: Exception, action: str):
+        logger.warning(f"{action}: {error}; кэш PromQL отключен на {self.breaker_seconds:g}с")
+        self._open_until = time.monotonic() + self.breaker_seconds
+
+    def bucket(self, timestamp: float) -> int:
+        """Начало интервала опроса, содержащего timestamp"""
+        return int(timestamp // self.interval) * self.interval
+
+    def key(self, kind: str, params: Dict[str, Any]) -> str:
+        normalized = dict(params, query=normalize_query(params["query"]))
+        digest = hashlib.sha1(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+        return f"{self.prefix}:{kind}:{digest}"
+
+    async def _read(self, key: str) -> Optional[bytes]:
+        with observe(UPSTREAM_LATENCY, upstream="redis", operation="get"):
+            return await self.redis.get(key)
+
+    async def _write(self, key: str, content: bytes):
+        with observe(UPSTREAM_LATENCY, upstream="redis", operation="set"):
+            await self.redis.set(key, content, ex=self.interval)
+
+    async def get_or_fetch(self, kind: str, params: Dict[str, Any],
+                           fetch: Callable[[], Awaitable[bytes]]) -> Dict[str, Any]:
+        """Ответ Prometheus из кэша или от ``fetch`` (тело ответа JSON)"""
+        if not self.enabled:
+            return json.loads(await fetch())
+        if not self.available:
+            PROMQL_CACHE_REQUESTS.labels(kind, "bypass").inc()
+            return json.loads(await fetch())
+
+        key = self.key(kind, params)
+        try:
+            cached = await self._read(key)
+        except Exception as e:
+            self._trip(e, "Кэш PromQL недоступен")
+            PROMQL_CACHE_REQUESTS.labels(kind, "error").inc()
+            return json.loads(await fetch())
+
+        if cached is not None:
+            PROMQL_CACHE_REQUESTS.labels(kind, "hit").inc()
+            return json.loads(cached)
+        PROMQL_CACHE_REQUESTS.labels(kind, "miss").inc()
+
+        async def load() -> Dict[str, Any]:
+            content = await fetch()
+            result = json.loads(content)
+            # Ошибки Prometheus не кэшируются
+            if result.get("status") == "success":
+                try:
+                    await self._write(key, content)
+                except Exception as e:
+                    self._trip(e, "Ошибка записи в кэш PromQL")
+            return result
+
+        return await self._flight.do((kind, key), load)
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
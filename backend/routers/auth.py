@@ -5,10 +5,10 @@ from typing import Optional
 import bcrypt
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-import redis
 
 from config import settings
 from database import db
+from metrics import InstrumentedRedis
 
 router = APIRouter()
 
@@ -16,7 +16,7 @@ router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
 # Redis клиент для блокировки
-redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+redis_client = InstrumentedRedis.from_url(settings.REDIS_URL, decode_responses=True)
 
 # Pydantic модели
 class UserCreate(BaseModel):
@@ -1,11 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
-import httpx
 from datetime import datetime
 
 from config import settings, IntegrationType
 from database import db, supabase
+from http_clients import http_clients
 from routers.auth import oauth2_scheme, verify_token
 
 router = APIRouter()
@@ -77,30 +77,30 @@ async def test_integration(
 async def test_netbox_connection(config: IntegrationConfig) -> Dict[str, Any]:
     """Тестирование подключения к NetBox"""
     try:
-        async with httpx.AsyncClient() as client:
-            headers = {
-                "Authorization": f"Token {config.credentials.get('token')}",
-                "Accept": "application/json"
+        client = http_clients.get("netbox")
+        headers = {
+            "Authorization": f"Token {config.credentials.get('token')}",
+            "Accept": "application/json"
+        }
+        
+        response = await client.get(
+            f"{config.url}/api/dcim/devices/",
+            headers=headers,
+            timeout=30
+        )
+        
+        if response.status_code == 200:
+            data = response.json()
+            return {
+                "status": "success",
+                "message": f"Connected successfully. Found {data.get('count', 0)} devices."
+            }
+        else:
+            return {
+                "status": "error",
+                "message": f"Connection failed: {response.status_code}"
             }
             
-            response = await client.get(
-                f"{config.url}/api/dcim/devices/",
-                headers=headers,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "status": "success",
-                    "message": f"Connected successfully. Found {data.get('count', 0)} devices."
-                }
-            else:
-                return {
-                    "status": "error",
-                    "message": f"Connection failed: {response.status_code}"
-                }
-                
     except Exception as e:
         return {
             "status": "error",
@@ -110,42 +110,42 @@ async def test_netbox_connection(config: IntegrationConfig) -> Dict[str, Any]:
 async def test_zabbix_connection(config: IntegrationConfig) -> Dict[str, Any]:
     """Тестирование подключения к Zabbix"""
     try:
-        async with httpx.AsyncClient() as client:
-            # Аутентификация
-            auth_data = {
-                "jsonrpc": "2.0",
-                "method": "user.login",
-                "params": {
-                    "user": config.credentials.get('username'),
-                    "password": config.credentials.get('password')
-                },
-                "id": 1
-            }
-            
-            response = await client.post(
-                f"{config.url}/api_jsonrpc.php",
-                json=auth_data,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if "result" in result:
-                    return {
-                        "status": "success",
-                        "message": "Connected successfully to Zabbix"
-                    }
-                else:
-                    return {
-                        "status": "error",
-                        "message": f"Authentication failed: {result.get('error', {}).get('data', 'Unknown error')}"
-                    }
+        client = http_clients.get("zabbix")
+        # Аутентификация
+        auth_data = {
+            "jsonrpc": "2.0",
+            "method": "user.login",
+            "params": {
+                "user": config.credentials.get('username'),
+                "password": config.credentials.get('password')
+            },
+            "id": 1
+        }
+        
+        response = await client.post(
+            f"{config.url}/api_jsonrpc.php",
+            json=auth_data,
+            timeout=30
+        )
+        
+        if response.status_code == 200:
+            result = response.json()
+            if "result" in result:
+                return {
+                    "status": "success",
+                    "message": "Connected successfully to Zabbix"
+                }
             else:
                 return {
                     "status": "error",
-                    "message": f"Connection failed: {response.status_code}"
+                    "message": f"Authentication failed: {result.get('error', {}).get('data', 'Unknown error')}"
                 }
-                
+        else:
+            return {
+                "status": "error",
+                "message": f"Connection failed: {response.status_code}"
+            }
+            
     except Exception as e:
         return {
             "status": "error",
@@ -155,30 +155,30 @@ async def test_zabbix_connection(config: IntegrationConfig) -> Dict[str, Any]:
 async def test_lansweeper_connection(config: IntegrationConfig) -> Dict[str, Any]:
     """Тестирование подключения к Lansweeper"""
     try:
-        async with httpx.AsyncClient() as client:
-            headers = {
-                "Authorization": f"Bearer {config.credentials.get('token')}",
-                "Accept": "application/json"
+        client = http_clients.get("lansweeper")
+        headers = {
+            "Authorization": f"Bearer {config.credentials.get('token')}",
+            "Accept": "application/json"
+        }
+        
+        response = await client.get(
+            f"{config.url}/api/v2/assets",
+            headers=headers,
+            params={"limit": 1},
+            timeout=30
+        )
+        
+        if response.status_code == 200:
+            return {
+                "status": "success",
+                "message": "Connected successfully to Lansweeper"
+            }
+        else:
+            return {
+                "status": "error",
+                "message": f"Connection failed: {response.status_code}"
             }
             
-            response = await client.get(
-                f"{config.url}/api/v2/assets",
-                headers=headers,
-                params={"limit": 1},
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                return {
-                    "status": "success",
-                    "message": "Connected successfully to Lansweeper"
-                }
-            else:
-                return {
-                    "status": "error",
-                    "message": f"Connection failed: {response.status_code}"
-                }
-                
     except Exception as e:
         return {
             "status": "error",
@@ -234,71 +234,71 @@ async def sync_integration(integration_id: str, token: str = Depends(oauth2_sche
 async def sync_netbox_data(integration: Dict[str, Any]) -> Dict[str, Any]:
     """Синхронизация данных из NetBox"""
     try:
-        async with httpx.AsyncClient() as client:
-            headers = {
-                "Authorization": f"Token {integration['credentials']['token']}",
-                "Accept": "application/json"
+        client = http_clients.get("netbox")
+        headers = {
+            "Authorization": f"Token {integration['credentials']['token']}",
+            "Accept": "application/json"
+        }
+        
+        # Получение устройств
+        response = await client.get(
+            f"{integration['url']}/api/dcim/devices/",
+            headers=headers,
+            timeout=60
+        )
+        
+        if response.status_code != 200:
+            return {
+                "status": "error",
+                "error_message": f"Failed to fetch devices: {response.status_code}"
             }
-            
-            # Получение устройств
-            response = await client.get(
-                f"{integration['url']}/api/dcim/devices/",
-                headers=headers,
-                timeout=60
-            )
-            
-            if response.status_code != 200:
-                return {
-                    "status": "error",
-                    "error_message": f"Failed to fetch devices: {response.status_code}"
+        
+        devices_data = response.json()
+        synced_count = 0
+        
+        for device in devices_data.get('results', []):
+            # Создание/обновление устройства в БД
+            device_data = {
+                'name': device.get('name', ''),
+                'device_type': device.get('device_type', {}).get('display', 'unknown'),
+                'status': 'online' if device.get('status', {}).get('value') == 'active' else 'offline',
+                'vendor': device.get('device_type', {}).get('manufacturer', {}).get('name', ''),
+                'model': device.get('device_type', {}).get('model', ''),
+                'serial_number': device.get('serial', ''),
+                'metadata': {
+                    'netbox_id': device.get('id'),
+                    'site': device.get('site', {}).get('name', ''),
+                    'rack': device.get('rack', {}).get('name', '')
                 }
+            }
             
-            devices_data = response.json()
-            synced_count = 0
+            # Получение IP адреса
+            if device.get('primary_ip'):
+                ip_response = await client.get(
+                    f"{integration['url']}/api/ipam/ip-addresses/{device['primary_ip']['id']}/",
+                    headers=headers
+                )
+                if ip_response.status_code == 200:
+                    ip_data = ip_response.json()
+                    device_data['ip_address'] = ip_data.get('address', '').split('/')[0]
             
-            for device in devices_data.get('results', []):
-                # Создание/обновление устройства в БД
-                device_data = {
-                    'name': device.get('name', ''),
-                    'device_type': device.get('device_type', {}).get('display', 'unknown'),
-                    'status': 'online' if device.get('status', {}).get('value') == 'active' else 'offline',
-                    'vendor': device.get('device_type', {}).get('manufacturer', {}).get('name', ''),
-                    'model': device.get('device_type', {}).get('model', ''),
-                    'serial_number': device.get('serial', ''),
-                    'metadata': {
-                        'netbox_id': device.get('id'),
-                        'site': device.get('site', {}).get('name', ''),
-                        'rack': device.get('rack', {}).get('name', '')
-                    }
-                }
-                
-                # Получение IP адреса
-                if device.get('primary_ip'):
-                    ip_response = await client.get(
-                        f"{integration['url']}/api/ipam/ip-addresses/{device['primary_ip']['id']}/",
-                        headers=headers
-                    )
-                    if ip_response.status_code == 200:
-                        ip_data = ip_response.json()
-                        device_data['ip_address'] = ip_data.get('address', '').split('/')[0]
-                
-                # Проверка существования устройства
-                existing = supabase.table('network_devices').select('id').eq('serial_number', device_data['serial_number']).execute()
-                
-                if existing.data:
-                    # Обновление
-                    supabase.table('network_devices').update(device_data).eq('id', existing.data[0]['id']).execute()
-                else:
-                    # Создание
-                    supabase.table('network_devices').insert(device_data).execute()
-                
-                synced_count += 1
+            # Проверка существования устройства
+            existing = supabase.table('network_devices').select('id').eq('serial_number', device_data['serial_number']).execute()
             
-            return {
-                "status": "success",
-                "message": f"Synced {synced_count} devices from NetBox"
-            }
+            if existing.data:
+                # Обновление
+                supabase.table('network_devices').update(device_data).eq('id', existing.data[0]['id']).execute()
+            else:
+                # Создание
+                supabase.table('network_devices').insert(device_data).execute()
             
+            synced_count += 1
+        
+        return {
+            "status": "success",
+            "message": f"Synced {synced_count} devices from NetBox"
+        }
+        
     except Exception as e:
         return {
             "status": "error",
@@ -308,63 +308,63 @@ async def sync_netbox_data(integration: Dict[str, Any]) -> Dict[str, Any]:
 async def sync_lansweeper_data(integration: Dict[str, Any]) -> Dict[str, Any]:
     """Синхронизация данных из Lansweeper"""
     try:
-        async with httpx.AsyncClient() as client:
-            headers = {
-                "Authorization": f"Bearer {integration['credentials']['token']}",
-                "Accept": "application/json"
+        client = http_clients.get("lansweeper")
+        headers = {
+            "Authorization": f"Bearer {integration['credentials']['token']}",
+            "Accept": "application/json"
+        }
+        
+        # Получение активов
+        response = await client.get(
+            f"{integration['url']}/api/v2/assets",
+            headers=headers,
+            params={"limit": 1000},
+            timeout=60
+        )
+        
+        if response.status_code != 200:
+            return {
+                "status": "error",
+                "error_message": f"Failed to fetch assets: {response.status_code}"
             }
-            
-            # Получение активов
-            response = await client.get(
-                f"{integration['url']}/api/v2/assets",
-                headers=headers,
-                params={"limit": 1000},
-                timeout=60
-            )
-            
-            if response.status_code != 200:
-                return {
-                    "status": "error",
-                    "error_message": f"Failed to fetch assets: {response.status_code}"
+        
+        assets_data = response.json()
+        synced_count = 0
+        
+        for asset in assets_data.get('data', []):
+            # Создание/обновление устройства в БД
+            device_data = {
+                'name': asset.get('name', ''),
+                'device_type': asset.get('type', 'workstation'),
+                'os_version': asset.get('operatingSystem', ''),
+                'status': 'online' if asset.get('lastSeen') else 'offline',
+                'ip_address': asset.get('ipAddress'),
+                'vendor': asset.get('manufacturer', ''),
+                'model': asset.get('model', ''),
+                'metadata': {
+                    'lansweeper_id': asset.get('id'),
+                    'domain': asset.get('domain', ''),
+                    'last_seen': asset.get('lastSeen')
                 }
+            }
             
-            assets_data = response.json()
-            synced_count = 0
-            
-            for asset in assets_data.get('data', []):
-                # Создание/обновление устройства в БД
-                device_data = {
-                    'name': asset.get('name', ''),
-                    'device_type': asset.get('type', 'workstation'),
-                    'os_version': asset.get('operatingSystem', ''),
-                    'status': 'online' if asset.get('lastSeen') else 'offline',
-                    'ip_address': asset.get('ipAddress'),
-                    'vendor': asset.get('manufacturer', ''),
-                    'model': asset.get('model', ''),
-                    'metadata': {
-                        'lansweeper_id': asset.get('id'),
-                        'domain': asset.get('domain', ''),
-                        'last_seen': asset.get('lastSeen')
-                    }
-                }
-                
-                # Проверка существования устройства по IP
-                existing = supabase.table('network_devices').select('id').eq('ip_address', device_data['ip_address']).execute()
-                
-                if existing.data:
-                    # Обновление
-                    supabase.table('network_devices').update(device_data).eq('id', existing.data[0]['id']).execute()
-                else:
-                    # Создание
-                    supabase.table('network_devices').insert(device_data).execute()
-                
-                synced_count += 1
+            # Проверка существования устройства по IP
+            existing = supabase.table('network_devices').select('id').eq('ip_address', device_data['ip_address']).execute()
             
-            return {
-                "status": "success",
-                "message": f"Synced {synced_count} assets from Lansweeper"
-            }
+            if existing.data:
+                # Обновление
+                supabase.table('network_devices').update(device_data).eq('id', existing.data[0]['id']).execute()
+            else:
+                # Создание
+                supabase.table('network_devices').insert(device_data).execute()
             
+            synced_count += 1
+        
+        return {
+            "status": "success",
+            "message": f"Synced {synced_count} assets from Lansweeper"
+        }
+        
     except Exception as e:
         return {
             "status": "error",
@@ -1,14 +1,34 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
-import httpx
+from datetime import datetime, timedelta, timezone
 import asyncio
+import csv
+import io
 import json
+import time
 
+import numpy as np
+
+from alerts import ACKNOWLEDGED, ACTIVE, RESOLVED, AlertManager, AlertState
+from anomaly import EwmaAnomalyDetector
 from config import settings
 from database import db, supabase
+from fleet import DeviceStatusWriter, FleetPoller, FleetSnapshot
+from http_clients import http_clients
+from ingest import IngestBuffer
+from instance_index import InstanceIndex, instance_host
+from pagination import clamp_limit, decode_cursor, encode_cursor, keyset_pages, next_cursor, seek
+from prober import ProbeResult, Prober
+from promql_cache import PromQLCache
+from rules import RuleEngine
+from singleflight import SingleFlight
+from timeseries import TTLCache, align_window, downsample_values, merge_matrices, parse_step, split_range
+from tsdb import MetricRingStore
+from ws_backplane import RedisBackplane
 from routers.auth import oauth2_scheme, verify_token
+from schemas import PingResult
 
 router = APIRouter()
 
@@ -25,6 +45,10 @@ class DeviceStatus(BaseModel):
     network_out: Optional[float] = None
     last_seen: datetime
     alerts: Optional[List[str]] = []
+    anomaly_score: Optional[float] = None  # наибольшая z-оценка метрик относительно EWMA
+    device_type: Optional[str] = None
+    site: Optional[str] = None  # metadata.site
+    alert_severities: Optional[List[str]] = []  # важности открытых предупреждений
 
 class NetworkMetrics(BaseModel):
     total_devices: int
@@ -35,7 +59,10 @@ class NetworkMetrics(BaseModel):
     total_traffic_out: float
     average_cpu: float
     average_memory: float
+    p95_cpu: Optional[float] = None
+    p95_memory: Optional[float] = None
     timestamp: datetime
+    snapshot_age: Optional[float] = None  # секунды с момента опроса
 
 class MonitoringAlert(BaseModel):
     id: str
@@ -51,34 +78,74 @@ class MonitoringAlert(BaseModel):
 class MonitoringLog(BaseModel):
     id: str
     device_id: str
-    device_name: str
+    device_name: Optional[str] = None
     metric_name: str
     metric_value: float
-    status: str
-    alert_level: str
-    message: str
-    source: str
+    status: Optional[str] = None
+    alert_level: Optional[str] = None
+    message: Optional[str] = None
+    source: Optional[str] = None
     timestamp: datetime
 
+class MonitoringLogRecord(BaseModel):
+    """Запись лога мониторинга для массовой загрузки"""
+    device_id: str
+    device_name: Optional[str] = None
+    metric_name: str
+    metric_value: float
+    status: Optional[str] = None
+    alert_level: Optional[str] = None
+    message: Optional[str] = None
+    source: Optional[str] = None
+    # Время приема, если не указано (у всех строк пакета одинаковый набор колонок)
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+# Валидация всего пакета записей за один проход
+monitoring_log_batch = TypeAdapter(List[MonitoringLogRecord])
+
+# Запросы метрик по всему парку устройств (один запрос на метрику)
+FLEET_QUERIES = {
+    "cpu_usage": '100 - (avg by (instance) (rate(node_cpu_seconds_total{mode="idle"}[5m])) * 100)',
+    "memory_usage": 'avg by (instance) ((1 - (node_memory_MemAvailable_bytes / node_memory_MemTotal_bytes)) * 100)',
+    "disk_usage": 'avg by (instance) (100 - ((node_filesystem_avail_bytes{mountpoint="/"} * 100) / node_filesystem_size_bytes{mountpoint="/"}))',
+    "network_in": 'sum by (instance) (rate(node_network_receive_bytes_total[5m]))',
+    "network_out": 'sum by (instance) (rate(node_network_transmit_bytes_total[5m]))',
+}
+
+# Метрики, значения которых суммируются по всем instance устройства
+SUMMED_METRICS = {"network_in", "network_out"}
+
+# Запросы истории метрик устройства; $instance заменяется точным селектором метки instance
+DEVICE_QUERIES = {
+    "cpu_usage": '100 - (avg by (instance) (rate(node_cpu_seconds_total{mode="idle",$instance}[5m])) * 100)',
+    "memory_usage": '(1 - (node_memory_MemAvailable_bytes{$instance} / node_memory_MemTotal_bytes{$instance})) * 100',
+}
+
+def device_query(name: str, matcher: str) -> str:
+    return DEVICE_QUERIES[name].replace("$instance", matcher)
+
 # Интеграции с системами мониторинга
 class PrometheusClient:
     def __init__(self):
         self.url = settings.PROMETHEUS_URL
         self.enabled = settings.PROMETHEUS_ENABLED
     
+    async def _fetch(self, path: str, params: Dict[str, Any]) -> bytes:
+        client = http_clients.get("prometheus")
+        response = await client.get(f"{self.url}{path}", params=params, timeout=30)
+        return response.content
+    
     async def query_metric(self, query: str) -> Dict[str, Any]:
         """Запрос метрики из Prometheus"""
         if not self.enabled:
             return {"data": {"result": []}}
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.url}/api/v1/query",
-                    params={"query": query},
-                    timeout=30
-                )
-                return response.json()
+            params: Dict[str, Any] = {"query": query}
+            if promql_cache.enabled:
+                # Момент вычисления выравнивается по интервалу опроса для общего ключа кэша
+                params["time"] = promql_cache.bucket(time.time())
+            return await promql_cache.get_or_fetch("query", params, lambda: self._fetch("/api/v1/query", params))
         except Exception as e:
             print(f"Prometheus query error: {e}")
             return {"data": {"result": []}}
@@ -89,62 +156,79 @@ class PrometheusClient:
             return {"data": {"result": []}}
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.url}/api/v1/query_range",
-                    params={
-                        "query": query,
-                        "start": start.timestamp(),
-                        "end": end.timestamp(),
-                        "step": step
-                    },
-                    timeout=30
-                )
-                return response.json()
+            params = {
+                "query": query,
+                "start": start.timestamp(),
+                "end": end.timestamp(),
+                "step": step
+            }
+            return await promql_cache.get_or_fetch("query_range", params, lambda: self._fetch("/api/v1/query_range", params))
         except Exception as e:
             print(f"Prometheus range query error: {e}")
             return {"data": {"result": []}}
     
-    async def get_device_metrics(self, device_id: str) -> Dict[str, Any]:
-        """Получение метрик устройства"""
-        metrics = {}
-        
-        # CPU Usage
-        cpu_query = f'100 - (avg by (instance) (rate(node_cpu_seconds_total{{mode="idle",instance=~"{device_id}.*"}}[5m])) * 100)'
-        cpu_result = await self.query_metric(cpu_query)
-        
-        # Memory Usage
-        memory_query = f'(1 - (node_memory_MemAvailable_bytes{{instance=~"{device_id}.*"}} / node_memory_MemTotal_bytes{{instance=~"{device_id}.*"}})) * 100'
-        memory_result = await self.query_metric(memory_query)
-        
-        # Disk Usage
-        disk_query = f'100 - ((node_filesystem_avail_bytes{{instance=~"{device_id}.*",mountpoint="/"}} * 100) / node_filesystem_size_bytes{{instance=~"{device_id}.*",mountpoint="/"}})'
-        disk_result = await self.query_metric(disk_query)
-        
-        # Network Traffic
-        network_in_query = f'rate(node_network_receive_bytes_total{{instance=~"{device_id}.*"}}[5m])'
-        network_out_query = f'rate(node_network_transmit_bytes_total{{instance=~"{device_id}.*"}}[5m])'
-        
-        network_in_result = await self.query_metric(network_in_query)
-        network_out_result = await self.query_metric(network_out_query)
+    async def query_range_split(self, query: str, start: float, end: float, step: int) -> List[Dict[str, Any]]:
+        """Запрос за период, разбитый на параллельные поддиапазоны"""
+        ranges = split_range(start, end, step, settings.PROMETHEUS_MAX_POINTS_PER_QUERY)
+        results = await asyncio.gather(*(
+            self.query_range(
+                query,
+                datetime.fromtimestamp(chunk_start, tz=timezone.utc),
+                datetime.fromtimestamp(chunk_end, tz=timezone.utc),
+                f"{step}s"
+            )
+            for chunk_start, chunk_end in ranges
+        ))
+        return merge_matrices([result.get("data", {}).get("result", []) for result in results])
+    
+    async def get_label_values(self, label: str, match: str) -> List[str]:
+        """Значения метки у рядов, подходящих под селектор match"""
+        if not self.enabled:
+            return []
         
-        # Парсинг результатов
-        if cpu_result["data"]["result"]:
-            metrics["cpu_usage"] = float(cpu_result["data"]["result"][0]["value"][1])
+        content = await self._fetch(f"/api/v1/label/{label}/values", {"match[]": match})
+        return json.loads(content).get("data", [])
+    
+    async def get_fleet_metrics(self, db_devices: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Получение метрик всех устройств фиксированным числом запросов.
         
-        if memory_result["data"]["result"]:
-            metrics["memory_usage"] = float(memory_result["data"]["result"][0]["value"][1])
+        Каждая метрика запрашивается один раз агрегатом ``by (instance)``
+        по всему парку, после чего векторы результатов сопоставляются
+        с устройствами в памяти по хосту из метки ``instance``.
+        """
+        if not db_devices:
+            return {}
         
-        if disk_result["data"]["result"]:
-            metrics["disk_usage"] = float(disk_result["data"]["result"][0]["value"][1])
+        # Индекс хост -> device_id (по id и IP адресу устройства)
+        hosts: Dict[str, str] = {}
+        for db_device in db_devices:
+            device_id = str(db_device['id'])
+            hosts[device_id] = device_id
+            if db_device.get('ip_address'):
+                hosts.setdefault(str(db_device['ip_address']), device_id)
         
-        if network_in_result["data"]["result"]:
-            metrics["network_in"] = sum(float(r["value"][1]) for r in network_in_result["data"]["result"])
+        names = list(FLEET_QUERIES)
+        results = await asyncio.gather(*(self.query_metric(FLEET_QUERIES[name]) for name in names))
         
-        if network_out_result["data"]["result"]:
-            metrics["network_out"] = sum(float(r["value"][1]) for r in network_out_result["data"]["result"])
+        fleet_metrics: Dict[str, Dict[str, Any]] = {}
+        for name, result in zip(names, results):
+            for sample in result.get("data", {}).get("result", []):
+                instance = sample.get("metric", {}).get("instance", "")
+                device_id = hosts.get(instance_host(instance))
+                if device_id is None:
+                    continue
+                
+                value = float(sample["value"][1])
+                metrics = fleet_metrics.setdefault(device_id, {})
+                if name in SUMMED_METRICS:
+                    metrics[name] = metrics.get(name, 0.0) + value
+                else:
+                    metrics.setdefault(name, value)
         
-        return metrics
+        return fleet_metrics
+
+# Фрагменты сообщений Zabbix об истекшей или недействительной сессии
+ZABBIX_SESSION_ERRORS = ("session terminated", "re-login", "not authorised", "not authorized")
 
 class ZabbixClient:
     def __init__(self):
@@ -152,129 +236,527 @@ class ZabbixClient:
         self.username = settings.ZABBIX_USERNAME
         self.password = settings.ZABBIX_PASSWORD
         self.enabled = settings.ZABBIX_ENABLED
+        self.auth_ttl = settings.ZABBIX_AUTH_TTL_SECONDS
+        self.item_batch_size = settings.ZABBIX_ITEM_BATCH_SIZE
+        self.item_page_limit = settings.ZABBIX_ITEM_PAGE_LIMIT
+        self.item_concurrency = settings.ZABBIX_ITEM_CONCURRENCY
         self.auth_token = None
+        self._auth_expires_at = 0.0
+        self._login_task: Optional[asyncio.Task] = None
     
-    async def authenticate(self):
-        """Аутентификация в Zabbix API"""
-        if not self.enabled:
-            return
-        
+    def _token_valid(self) -> bool:
+        return self.auth_token is not None and time.monotonic() < self._auth_expires_at
+    
+    async def _login(self) -> Optional[str]:
+        """Выполнение user.login"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.url}/api_jsonrpc.php",
-                    json={
-                        "jsonrpc": "2.0",
-                        "method": "user.login",
-                        "params": {
-                            "user": self.username,
-                            "password": self.password
-                        },
-                        "id": 1
+            client = http_clients.get("zabbix")
+            response = await client.post(
+                f"{self.url}/api_jsonrpc.php",
+                json={
+                    "jsonrpc": "2.0",
+                    "method": "user.login",
+                    "params": {
+                        "user": self.username,
+                        "password": self.password
                     },
-                    timeout=30
-                )
-                result = response.json()
-                self.auth_token = result.get("result")
+                    "id": 1
+                },
+                timeout=30
+            )
+            result = response.json()
+            self.auth_token = result.get("result")
+            self._auth_expires_at = time.monotonic() + self.auth_ttl if self.auth_token else 0.0
         except Exception as e:
             print(f"Zabbix auth error: {e}")
+            self.auth_token = None
+            self._auth_expires_at = 0.0
+        return self.auth_token
+    
+    async def authenticate(self, force: bool = False) -> Optional[str]:
+        """Аутентификация в Zabbix API.
+        
+        Токен кэшируется на ``ZABBIX_AUTH_TTL_SECONDS``; одновременные
+        вызовы ожидают одну и ту же попытку входа.
+        """
+        if not self.enabled:
+            return None
+        
+        if not force and self._token_valid():
+            return self.auth_token
+        
+        if self._login_task is None or self._login_task.done():
+            self._login_task = asyncio.create_task(self._login())
+        return await asyncio.shield(self._login_task)
+    
+    def invalidate(self, token: Optional[str]):
+        """Сброс токена, если он не был обновлен другим вызовом"""
+        if token is not None and token == self.auth_token:
+            self.auth_token = None
+            self._auth_expires_at = 0.0
+    
+    @staticmethod
+    def _is_session_error(result: Dict[str, Any]) -> bool:
+        error = result.get("error")
+        if not error:
+            return False
+        text = f"{error.get('message', '')} {error.get('data', '')}".lower()
+        return any(marker in text for marker in ZABBIX_SESSION_ERRORS)
+    
+    async def call(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Вызов метода API с повторным входом при ошибке сессии"""
+        client = http_clients.get("zabbix")
+        
+        for attempt in range(2):
+            token = await self.authenticate()
+            if not token:
+                return {}
+            
+            response = await client.post(
+                f"{self.url}/api_jsonrpc.php",
+                json={
+                    "jsonrpc": "2.0",
+                    "method": method,
+                    "params": params,
+                    "auth": token,
+                    "id": 1
+                },
+                timeout=30
+            )
+            result = response.json()
+            
+            if attempt == 0 and self._is_session_error(result):
+                self.invalidate(token)
+                continue
+            return result
+        
+        return {}
     
     async def get_hosts(self) -> List[Dict[str, Any]]:
         """Получение списка хостов"""
-        if not self.enabled or not self.auth_token:
+        if not self.enabled:
             return []
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.url}/api_jsonrpc.php",
-                    json={
-                        "jsonrpc": "2.0",
-                        "method": "host.get",
-                        "params": {
-                            "output": ["hostid", "host", "name", "status"],
-                            "selectInterfaces": ["ip"]
-                        },
-                        "auth": self.auth_token,
-                        "id": 1
-                    },
-                    timeout=30
-                )
-                result = response.json()
-                return result.get("result", [])
+            result = await self.call("host.get", {
+                "output": ["hostid", "host", "name", "status"],
+                "selectInterfaces": ["ip"]
+            })
+            return result.get("result", [])
         except Exception as e:
             print(f"Zabbix hosts error: {e}")
             return []
     
     async def get_host_items(self, host_id: str) -> List[Dict[str, Any]]:
         """Получение элементов данных хоста"""
-        if not self.enabled or not self.auth_token:
-            return []
+        items = await self.get_items_for_hosts([host_id])
+        return items.get(str(host_id), [])
+    
+    async def _fetch_items_batch(self, host_ids: List[str]) -> List[Dict[str, Any]]:
+        """item.get по группе хостов с дроблением группы при усечении ответа"""
+        params = {
+            "output": ["itemid", "hostid", "name", "key_", "lastvalue", "units"],
+            "hostids": host_ids,
+            "filter": {
+                "status": 0  # Active items only
+            },
+            "sortfield": "itemid"
+        }
+        if len(host_ids) > 1:
+            params["limit"] = self.item_page_limit
         
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.url}/api_jsonrpc.php",
-                    json={
-                        "jsonrpc": "2.0",
-                        "method": "item.get",
-                        "params": {
-                            "output": ["itemid", "name", "key_", "lastvalue", "units"],
-                            "hostids": host_id,
-                            "filter": {
-                                "status": 0  # Active items only
-                            }
-                        },
-                        "auth": self.auth_token,
-                        "id": 1
-                    },
-                    timeout=30
-                )
-                result = response.json()
-                return result.get("result", [])
-        except Exception as e:
-            print(f"Zabbix items error: {e}")
-            return []
+        result = await self.call("item.get", params)
+        items = result.get("result", [])
+        
+        # Ответ достиг лимита - группа делится пополам и запрашивается заново
+        if len(host_ids) > 1 and len(items) >= self.item_page_limit:
+            middle = len(host_ids) // 2
+            first, second = await asyncio.gather(
+                self._fetch_items_batch(host_ids[:middle]),
+                self._fetch_items_batch(host_ids[middle:])
+            )
+            return first + second
+        
+        return items
+    
+    async def get_items_for_hosts(self, host_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Получение элементов данных множества хостов.
+        
+        Хосты запрашиваются группами по ``ZABBIX_ITEM_BATCH_SIZE`` в одном
+        item.get, одновременно выполняется не более
+        ``ZABBIX_ITEM_CONCURRENCY`` групп. Результат сгруппирован по hostid.
+        """
+        items_by_host: Dict[str, List[Dict[str, Any]]] = {str(host_id): [] for host_id in host_ids}
+        if not self.enabled or not host_ids:
+            return items_by_host
+        
+        host_ids = [str(host_id) for host_id in host_ids]
+        batches = [host_ids[i:i + self.item_batch_size] for i in range(0, len(host_ids), self.item_batch_size)]
+        semaphore = asyncio.Semaphore(self.item_concurrency)
+        
+        async def fetch(batch: List[str]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    return await self._fetch_items_batch(batch)
+                except Exception as e:
+                    print(f"Zabbix items error: {e}")
+                    return []
+        
+        for items in await asyncio.gather(*(fetch(batch) for batch in batches)):
+            for item in items:
+                items_by_host.setdefault(str(item.get("hostid")), []).append(item)
+        
+        return items_by_host
 
 # Инициализация клиентов
+promql_cache = PromQLCache(
+    settings.REDIS_URL,
+    settings.PROMETHEUS_SCRAPE_INTERVAL_SECONDS,
+    enabled=settings.PROMQL_CACHE_ENABLED,
+    timeout=settings.PROMQL_CACHE_REDIS_TIMEOUT_SECONDS,
+    breaker_seconds=settings.PROMQL_CACHE_BREAKER_SECONDS
+)
 prometheus_client = PrometheusClient()
+instance_index = InstanceIndex(
+    lambda: prometheus_client.get_label_values("instance", "up"),
+    settings.PROMETHEUS_INSTANCE_INDEX_TTL_SECONDS
+)
 zabbix_client = ZabbixClient()
 
+# Общая шина воркеров через Redis; ее аренда выбирает единственного писателя
+ws_backplane = RedisBackplane(
+    settings.REDIS_URL,
+    settings.WS_BACKPLANE_PREFIX,
+    settings.WS_BACKPLANE_LEASE_SECONDS
+) if settings.WS_BACKPLANE_ENABLED else None
+
+def is_fleet_writer() -> bool:
+    """Пишет ли этот воркер результаты опроса в БД (один воркер или владелец аренды)"""
+    return ws_backplane is None or ws_backplane.is_leader
+
+# Правила статуса и предупреждений
+rule_engine = RuleEngine(list(FLEET_QUERIES), settings.MONITORING_RULES_PATH)
+
+# Потоковая статистика метрик устройств для оценки аномалий
+anomaly_detector = EwmaAnomalyDetector(
+    list(FLEET_QUERIES),
+    alpha=settings.ANOMALY_ALPHA,
+    warmup=settings.ANOMALY_WARMUP_SAMPLES
+)
+
+# Жизненный цикл предупреждений
+alert_manager = AlertManager(
+    'monitoring_alerts',
+    raise_after=settings.ALERT_RAISE_AFTER,
+    clear_after=settings.ALERT_CLEAR_AFTER,
+    flap_window=settings.ALERT_FLAP_WINDOW_SECONDS,
+    flap_threshold=settings.ALERT_FLAP_THRESHOLD,
+    flap_clear_after=settings.ALERT_FLAP_CLEAR_AFTER
+)
+alert_manager.writer = is_fleet_writer
+
 # Утилиты
-async def determine_device_status(metrics: Dict[str, Any]) -> str:
-    """Определение статуса устройства на основе метрик"""
-    cpu = metrics.get("cpu_usage", 0)
-    memory = metrics.get("memory_usage", 0)
-    disk = metrics.get("disk_usage", 0)
+def alert_to_model(state: AlertState) -> MonitoringAlert:
+    """Преобразование состояния предупреждения в модель ответа"""
+    return MonitoringAlert(
+        id=state.id,
+        device_id=state.device_id,
+        device_name=state.device_name,
+        alert_type=state.rule,
+        severity=state.severity,
+        message=state.message,
+        status=state.status,
+        created_at=state.created_at,
+        resolved_at=state.resolved_at
+    )
+
+def device_group(db_device: Dict[str, Any]) -> Optional[str]:
+    """Группа устройства для правил (metadata.group)"""
+    return (db_device.get('metadata') or {}).get('group')
+
+def device_site(db_device: Dict[str, Any]) -> Optional[str]:
+    """Площадка устройства (metadata.site)"""
+    return (db_device.get('metadata') or {}).get('site')
+
+def utc_timestamp(value: datetime) -> float:
+    """Unix время для наивного datetime в UTC"""
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+def naive_utc(value: datetime) -> datetime:
+    """Наивный datetime в UTC (в памяти время хранится без зоны)"""
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+def build_device_status(
+    db_device: Dict[str, Any],
+    metrics: Dict[str, Any],
+    last_seen: datetime,
+    status: str,
+    alerts: List[str],
+    anomaly_score: Optional[float] = None
+) -> DeviceStatus:
+    """Сборка статуса устройства из записи БД и метрик Prometheus"""
+    return DeviceStatus(
+        device_id=db_device['id'],
+        device_name=db_device['name'],
+        ip_address=str(db_device['ip_address']) if db_device['ip_address'] else "",
+        status=status,
+        cpu_usage=metrics.get('cpu_usage'),
+        memory_usage=metrics.get('memory_usage'),
+        disk_usage=metrics.get('disk_usage'),
+        network_in=metrics.get('network_in'),
+        network_out=metrics.get('network_out'),
+        last_seen=last_seen,
+        alerts=alerts,
+        anomaly_score=anomaly_score,
+        device_type=db_device.get('device_type'),
+        site=device_site(db_device)
+    )
+
+async def collect_fleet_statuses() -> List[DeviceStatus]:
+    """Опрос состояния всех устройств (выполняется фоновым опросом)"""
+    devices = []
+    
+    # Получение устройств из БД
+    result = await asyncio.to_thread(supabase.table('network_devices').select('*').execute)
+    db_devices = result.data or []
+    
+    # Сопоставление устройств с метками instance для запросов по одному устройству
+    instance_index.update_devices(db_devices)
+    await instance_index.refresh()
+    
+    # Метрики всего парка фиксированным числом запросов к Prometheus
+    fleet_metrics = await prometheus_client.get_fleet_metrics(db_devices)
+    
+    polled_at = datetime.utcnow()
+    metrics = [fleet_metrics.get(str(db_device['id']), {}) for db_device in db_devices]
+    last_seen = [status_writer.last_seen(db_device) or polled_at for db_device in db_devices]
+    
+    device_ids = [str(db_device['id']) for db_device in db_devices]
+    values = rule_engine.metrics_matrix(metrics)
     
-    # Критические пороги
-    if cpu > 90 or memory > 90 or disk > 90:
-        return "offline"  # Считаем критическое состояние как offline
+    # Оценка правил сразу по всему парку
+    rule_engine.reload()
+    evaluation = rule_engine.evaluate(
+        values,
+        [db_device.get('device_type') for db_device in db_devices],
+        [device_group(db_device) for db_device in db_devices],
+        np.array([utc_timestamp(seen) for seen in last_seen], dtype=np.float64),
+        utc_timestamp(polled_at)
+    )
+    statuses = evaluation.statuses([db_device.get('status', 'unknown') for db_device in db_devices])
     
-    # Предупреждающие пороги
-    if cpu > 75 or memory > 75 or disk > 75:
-        return "warning"
+    # Отклонение от накопленной статистики устройства по той же матрице метрик
+    anomaly_detector.retain(device_ids)
+    scores = np.round(anomaly_detector.update(device_ids, values), 2)
     
-    return "online"
+    for index, db_device in enumerate(db_devices):
+        # Создание объекта устройства
+        score = scores[index]
+        device = build_device_status(
+            db_device, metrics[index], last_seen[index], statuses[index], evaluation.alerts(index),
+            None if np.isnan(score) else float(score)
+        )
+        
+        # Статус записывается в БД только при изменении
+        status_writer.record(db_device, device.status, polled_at)
+        
+        devices.append(device)
+    
+    status_writer.retain(device_ids)
+    # Остальные воркеры копят последние значения и запишут их, получив аренду
+    if is_fleet_writer():
+        await status_writer.flush()
+    
+    # В БД пишутся только переходы состояний предупреждений (только писателем)
+    await alert_manager.claim()
+    transitions = alert_manager.process(
+        evaluation,
+        device_ids,
+        [db_device['name'] for db_device in db_devices]
+    )
+    await alert_manager.persist(transitions)
+    
+    # Важности открытых предупреждений (для подписок WebSocket по важности)
+    severities = alert_manager.open_severities()
+    for device in devices:
+        device.alert_severities = severities.get(device.device_id, [])
+    
+    return devices
 
-async def generate_alerts(device: DeviceStatus) -> List[str]:
-    """Генерация предупреждений для устройства"""
-    alerts = []
+# Буфер массовой загрузки логов мониторинга
+log_ingest_buffer = IngestBuffer(
+    'monitoring_logs',
+    'monitoring_logs_ingested',
+    capacity=settings.INGEST_BUFFER_CAPACITY,
+    batch_size=settings.INGEST_BATCH_SIZE,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL_SECONDS,
+    max_retries=settings.INGEST_MAX_RETRIES
+)
+
+# Пакетная запись статусов устройств
+status_writer = DeviceStatusWriter('network_devices', settings.MONITORING_LAST_SEEN_FLUSH_SECONDS)
+
+# Кэш исторических метрик по выровненным окнам
+history_cache = TTLCache(settings.MONITORING_HISTORY_CACHE_SIZE)
+
+# Фоновый опрос парка устройств
+fleet_poller = FleetPoller(collect_fleet_statuses, settings.MONITORING_POLL_INTERVAL_SECONDS)
+
+# Объединение одновременных одинаковых чтений (ключ - эндпоинт и параметры)
+read_flight = SingleFlight()
+device_list_adapter = TypeAdapter(List[DeviceStatus])
+
+async def load_probe_targets() -> List[tuple]:
+    """Устройства с IP адресом для проверки доступности"""
+    # Проверку выполняет только воркер-писатель, иначе каждый воркер пишет свои результаты
+    if not is_fleet_writer():
+        return []
     
-    if device.cpu_usage and device.cpu_usage > 90:
-        alerts.append(f"High CPU usage: {device.cpu_usage:.1f}%")
+    def make_query():
+        return supabase.table('network_devices').select('id,ip_address,created_at').not_.is_('ip_address', 'null')
     
-    if device.memory_usage and device.memory_usage > 90:
-        alerts.append(f"High memory usage: {device.memory_usage:.1f}%")
+    targets = []
+    async for rows in keyset_pages(make_query, 'created_at', settings.EXPORT_PAGE_SIZE):
+        targets.extend((str(row['id']), str(row['ip_address']).split('/')[0]) for row in rows)
+    return targets
+
+async def store_probe_results(results: List[ProbeResult]):
+    """Пакетная запись результатов проверки и last_ping доступных устройств"""
+    rows = [result.to_row() for result in results]
+    if not probe_results_buffer.offer(rows):
+        print(f"Ping results buffer is full, dropped {len(rows)} results")
     
-    if device.disk_usage and device.disk_usage > 90:
-        alerts.append(f"High disk usage: {device.disk_usage:.1f}%")
+    # Одно время на раунд: last_ping доступных устройств обновляется запросом по списку id,
+    # поэтому удаленное за время проверки устройство не создается заново
+    stamp = datetime.utcnow().isoformat()
+    online = [result.device_id for result in results if result.status == "online"]
+    batch_size = settings.PROBE_WRITE_BATCH_SIZE
+    for start in range(0, len(online), batch_size):
+        await db.update_by_ids('network_devices', {'last_ping': stamp}, online[start:start + batch_size])
     
-    # Проверка последней активности
-    if device.last_seen < datetime.utcnow() - timedelta(minutes=5):
-        alerts.append("Device not responding")
+    await prune_ping_results()
+
+# Монотонное время последней очистки ping_results
+ping_results_pruned_at: Optional[float] = None
+
+async def prune_ping_results():
+    """Удаление результатов проверки старше срока хранения (не чаще интервала очистки)"""
+    global ping_results_pruned_at
+    now = time.monotonic()
+    if not is_fleet_writer() or (
+        ping_results_pruned_at is not None
+        and now - ping_results_pruned_at < settings.PROBE_RESULTS_PRUNE_INTERVAL_SECONDS
+    ):
+        return
+    ping_results_pruned_at = now
+    cutoff = datetime.utcnow() - timedelta(days=settings.PROBE_RESULTS_RETENTION_DAYS)
+    await db.delete_older_than('ping_results', 'timestamp', cutoff)
+
+# Буфер записи результатов проверки доступности (без аудита)
+probe_results_buffer = IngestBuffer(
+    'ping_results',
+    None,
+    capacity=settings.PROBE_BUFFER_CAPACITY,
+    batch_size=settings.PROBE_WRITE_BATCH_SIZE,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL_SECONDS,
+    max_retries=settings.INGEST_MAX_RETRIES
+)
+
+# Фоновая активная проверка доступности устройств
+device_prober = Prober(
+    load_probe_targets,
+    store_probe_results,
+    interval=settings.PROBE_INTERVAL_SECONDS,
+    timeout=settings.PROBE_TIMEOUT_SECONDS,
+    concurrency=settings.PROBE_CONCURRENCY,
+    methods=settings.PROBE_METHODS,
+    tcp_ports=settings.PROBE_TCP_PORTS,
+    jitter=settings.PROBE_JITTER
+)
+
+# Периоды истории: длительность (сек) и шаг исходных данных Prometheus
+HISTORY_PERIODS = {
+    "1h": (3600, "15s"),
+    "24h": (86400, "1m"),
+    "7d": (7 * 86400, "5m"),
+    "30d": (30 * 86400, "15m"),
+}
+
+# Периоды, которые обслуживаются из локального хранилища метрик
+LOCAL_HISTORY_PERIODS = {"1h", "24h"}
+
+# Локальное хранилище последних метрик, наполняемое фоновым опросом
+metric_store = MetricRingStore(
+    list(FLEET_QUERIES),
+    max(settings.TSDB_RETENTION_SECONDS // settings.MONITORING_POLL_INTERVAL_SECONDS, 1),
+    settings.TSDB_MAX_DEVICES
+)
+
+def record_snapshot_metrics(snapshot: FleetSnapshot):
+    """Запись метрик снимка парка в локальное хранилище"""
+    metric_store.retain(snapshot.devices)
+    metric_store.append(
+        snapshot.taken_at.replace(tzinfo=timezone.utc).timestamp(),
+        {
+            device_id: {metric: getattr(device, metric) for metric in metric_store.metrics}
+            for device_id, device in snapshot.devices.items()
+        }
+    )
+
+if settings.TSDB_ENABLED:
+    fleet_poller.add_listener(record_snapshot_metrics)
+
+def local_history(device_id: str, metric: str, start: float, end: float) -> List[Dict[str, Any]]:
+    """История метрики устройства из локального хранилища в формате Prometheus"""
+    timestamps, values = metric_store.range(device_id, metric, start, end)
+    if not len(values):
+        return []
+    return [{
+        "metric": {"device_id": device_id, "source": "local"},
+        "values": [[ts, str(value)] for ts, value in zip(timestamps.tolist(), values.tolist())]
+    }]
+
+def set_cursor_header(response: Response, cursor: Optional[str]):
+    """Заголовок с курсором следующей страницы"""
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+
+def parse_cursor(cursor: Optional[str]):
+    """Проверка курсора клиента до запроса; 400 при неверном формате"""
+    if not cursor:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def set_snapshot_headers(response: Response, snapshot: FleetSnapshot):
+    """Заголовки с возрастом снимка парка"""
+    response.headers["X-Snapshot-Age"] = f"{snapshot.age:.3f}"
+    response.headers["X-Snapshot-Taken-At"] = snapshot.taken_at.isoformat()
+
+# Выгружаемые наборы данных: таблица и колонка времени для keyset-обхода
+EXPORT_DATASETS = {
+    "logs": ("monitoring_logs", "timestamp"),
+    "security-logs": ("security_logs", "timestamp"),
+    "alerts": ("monitoring_alerts", "created_at"),
+}
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+def _csv_value(value: Any) -> Any:
+    return json.dumps(value, default=str) if isinstance(value, (dict, list)) else value
+
+def format_export_page(rows: List[Dict[str, Any]], fmt: str, header: bool) -> str:
+    """Сериализация одной страницы выгрузки"""
+    if fmt == "ndjson":
+        return "".join(json.dumps(row, default=str) + "\n" for row in rows)
     
-    return alerts
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(rows[0].keys())
+    writer.writerows([_csv_value(value) for value in row.values()] for row in rows)
+    return buffer.getvalue()
 
 # Роутеры
 @router.get("/devices", response_model=List[DeviceStatus])
@@ -283,92 +765,34 @@ async def get_device_statuses(token: str = Depends(oauth2_scheme)):
     
     verify_token(token)
     
+    async def render():
+        # Сериализация всего списка выполняется один раз на группу одновременных запросов
+        snapshot = await fleet_poller.get_snapshot()
+        return snapshot, await asyncio.to_thread(device_list_adapter.dump_json, snapshot.list())
+    
     try:
-        devices = []
-        
-        # Получение устройств из БД
-        result = supabase.table('network_devices').select('*').execute()
-        db_devices = result.data or []
-        
-        # Аутентификация в Zabbix если включен
-        if zabbix_client.enabled:
-            await zabbix_client.authenticate()
-        
-        for db_device in db_devices:
-            device_id = db_device['id']
-            
-            # Получение метрик из Prometheus
-            prometheus_metrics = await prometheus_client.get_device_metrics(device_id)
-            
-            # Создание объекта устройства
-            device = DeviceStatus(
-                device_id=device_id,
-                device_name=db_device['name'],
-                ip_address=str(db_device['ip_address']) if db_device['ip_address'] else "",
-                status=db_device.get('status', 'unknown'),
-                cpu_usage=prometheus_metrics.get('cpu_usage'),
-                memory_usage=prometheus_metrics.get('memory_usage'),
-                disk_usage=prometheus_metrics.get('disk_usage'),
-                network_in=prometheus_metrics.get('network_in'),
-                network_out=prometheus_metrics.get('network_out'),
-                last_seen=datetime.fromisoformat(db_device.get('last_seen', datetime.utcnow().isoformat()))
-            )
-            
-            # Определение статуса на основе метрик
-            if prometheus_metrics:
-                device.status = await determine_device_status(prometheus_metrics)
-            
-            # Генерация предупреждений
-            device.alerts = await generate_alerts(device)
-            
-            # Обновление статуса в БД
-            supabase.table('network_devices').update({
-                'status': device.status,
-                'last_seen': datetime.utcnow().isoformat()
-            }).eq('id', device_id).execute()
-            
-            devices.append(device)
+        snapshot, content = await read_flight.do(("devices",), render)
+        response = Response(content=content, media_type="application/json")
+        set_snapshot_headers(response, snapshot)
         
-        return devices
+        return response
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get device statuses: {str(e)}")
 
 @router.get("/devices/{device_id}", response_model=DeviceStatus)
-async def get_device_status(device_id: str, token: str = Depends(oauth2_scheme)):
+async def get_device_status(device_id: str, response: Response, token: str = Depends(oauth2_scheme)):
     """Получение статуса конкретного устройства"""
     
     verify_token(token)
     
     try:
-        # Получение устройства из БД
-        result = supabase.table('network_devices').select('*').eq('id', device_id).execute()
-        if not result.data:
+        snapshot = await fleet_poller.get_snapshot()
+        device = snapshot.get(device_id)
+        if device is None:
             raise HTTPException(status_code=404, detail="Device not found")
         
-        db_device = result.data[0]
-        
-        # Получение метрик
-        prometheus_metrics = await prometheus_client.get_device_metrics(device_id)
-        
-        device = DeviceStatus(
-            device_id=device_id,
-            device_name=db_device['name'],
-            ip_address=str(db_device['ip_address']) if db_device['ip_address'] else "",
-            status=db_device.get('status', 'unknown'),
-            cpu_usage=prometheus_metrics.get('cpu_usage'),
-            memory_usage=prometheus_metrics.get('memory_usage'),
-            disk_usage=prometheus_metrics.get('disk_usage'),
-            network_in=prometheus_metrics.get('network_in'),
-            network_out=prometheus_metrics.get('network_out'),
-            last_seen=datetime.fromisoformat(db_device.get('last_seen', datetime.utcnow().isoformat()))
-        )
-        
-        # Определение статуса и предупреждений
-        if prometheus_metrics:
-            device.status = await determine_device_status(prometheus_metrics)
-        
-        device.alerts = await generate_alerts(device)
+        set_snapshot_headers(response, snapshot)
         
         return device
         
@@ -378,42 +802,31 @@ async def get_device_status(device_id: str, token: str = Depends(oauth2_scheme))
         raise HTTPException(status_code=500, detail=f"Failed to get device status: {str(e)}")
 
 @router.get("/metrics/overview", response_model=NetworkMetrics)
-async def get_network_metrics(token: str = Depends(oauth2_scheme)):
+async def get_network_metrics(response: Response, token: str = Depends(oauth2_scheme)):
     """Получение общих метрик сети"""
     
     verify_token(token)
     
     try:
-        # Получение всех устройств
-        devices = await get_device_statuses(token)
-        
-        # Подсчет статистики
-        total_devices = len(devices)
-        online_devices = len([d for d in devices if d.status == "online"])
-        offline_devices = len([d for d in devices if d.status == "offline"])
-        warning_devices = len([d for d in devices if d.status == "warning"])
-        
-        # Суммарный трафик
-        total_traffic_in = sum(d.network_in or 0 for d in devices)
-        total_traffic_out = sum(d.network_out or 0 for d in devices)
+        snapshot = await read_flight.do(("metrics_overview",), fleet_poller.get_snapshot)
+        set_snapshot_headers(response, snapshot)
         
-        # Средние значения
-        cpu_values = [d.cpu_usage for d in devices if d.cpu_usage is not None]
-        memory_values = [d.memory_usage for d in devices if d.memory_usage is not None]
-        
-        average_cpu = sum(cpu_values) / len(cpu_values) if cpu_values else 0
-        average_memory = sum(memory_values) / len(memory_values) if memory_values else 0
+        # Агрегаты поддерживаются фоновым опросом инкрементально
+        aggregates = fleet_poller.aggregates
         
         return NetworkMetrics(
-            total_devices=total_devices,
-            online_devices=online_devices,
-            offline_devices=offline_devices,
-            warning_devices=warning_devices,
-            total_traffic_in=total_traffic_in,
-            total_traffic_out=total_traffic_out,
-            average_cpu=average_cpu,
-            average_memory=average_memory,
-            timestamp=datetime.utcnow()
+            total_devices=aggregates.total,
+            online_devices=aggregates.count("online"),
+            offline_devices=aggregates.count("offline"),
+            warning_devices=aggregates.count("warning"),
+            total_traffic_in=aggregates.traffic_in,
+            total_traffic_out=aggregates.traffic_out,
+            average_cpu=aggregates.average_cpu,
+            average_memory=aggregates.average_memory,
+            p95_cpu=aggregates.cpu_percentile(95),
+            p95_memory=aggregates.memory_percentile(95),
+            timestamp=snapshot.taken_at,
+            snapshot_age=snapshot.age
         )
         
     except Exception as e:
@@ -421,8 +834,9 @@ async def get_network_metrics(token: str = Depends(oauth2_scheme)):
 
 @router.get("/logs", response_model=List[MonitoringLog])
 async def get_monitoring_logs(
-    limit: int = Query(50, le=100),
-    offset: int = Query(0, ge=0),
+    response: Response,
+    limit: int = Query(50, ge=1),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из X-Next-Cursor"),
     device_id: Optional[str] = Query(None),
     alert_level: Optional[str] = Query(None),
     token: str = Depends(oauth2_scheme)
@@ -430,6 +844,8 @@ async def get_monitoring_logs(
     """Получение логов мониторинга"""
     
     verify_token(token)
+    limit = clamp_limit(limit, settings.MONITORING_PAGE_MAX_LIMIT)
+    parse_cursor(cursor)
     
     try:
         query = supabase.table('monitoring_logs').select('*')
@@ -440,7 +856,9 @@ async def get_monitoring_logs(
         if alert_level:
             query = query.eq('alert_level', alert_level)
         
-        result = query.order('timestamp', desc=True).range(offset, offset + limit - 1).execute()
+        # Keyset-пагинация по (timestamp, id)
+        result = seek(query, 'timestamp', cursor, limit).execute()
+        set_cursor_header(response, next_cursor(result.data or [], 'timestamp', limit))
         
         logs = []
         for log_data in result.data or []:
@@ -490,10 +908,68 @@ async def create_monitoring_log(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create log: {str(e)}")
 
+def parse_monitoring_logs(body: bytes, ndjson: bool) -> List[Dict[str, Any]]:
+    """Разбор и валидация тела запроса массовой загрузки логов; возвращает строки для вставки"""
+    try:
+        if ndjson:
+            records = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            records = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid payload: {str(e)}")
+    
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="Expected JSON array or NDJSON")
+    if len(records) > settings.INGEST_MAX_REQUEST_RECORDS:
+        raise HTTPException(status_code=413, detail=f"Too many records (max {settings.INGEST_MAX_REQUEST_RECORDS})")
+    
+    try:
+        validated = monitoring_log_batch.validate_python(records)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False)[:20])
+    
+    # PostgREST требует одинаковых ключей у всех строк массовой вставки (иначе PGRST102)
+    return [record.model_dump(mode="json") for record in validated]
+
+@router.post("/logs/bulk", status_code=202)
+async def ingest_monitoring_logs(request: Request, token: str = Depends(oauth2_scheme)):
+    """Массовая загрузка логов мониторинга (NDJSON или JSON массив)"""
+    
+    payload = verify_token(token)
+    user_id = payload.get("user_id")
+    
+    # Размер тела ограничивается до чтения: по Content-Length и по фактически полученным байтам
+    max_bytes = settings.INGEST_MAX_REQUEST_BYTES
+    too_large = HTTPException(status_code=413, detail=f"Request body too large (max {max_bytes} bytes)")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise too_large
+    
+    chunks = []
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise too_large
+        chunks.append(chunk)
+    
+    # Разбор и валидация пакета - CPU-нагрузка, выполняется вне цикла событий
+    ndjson = request.headers.get("content-type", "").startswith(("application/x-ndjson", "application/jsonl"))
+    rows = await asyncio.to_thread(parse_monitoring_logs, b"".join(chunks), ndjson)
+    if not log_ingest_buffer.offer(rows, user_id):
+        raise HTTPException(
+            status_code=503,
+            detail="Ingest buffer is full, retry later",
+            headers={"Retry-After": str(max(int(settings.INGEST_FLUSH_INTERVAL_SECONDS), 1))}
+        )
+    
+    return {"accepted": len(rows), "buffered": log_ingest_buffer.depth}
+
 @router.get("/devices/{device_id}/metrics/history")
 async def get_device_metrics_history(
     device_id: str,
     period: str = Query("1h", description="Time period: 1h, 24h, 7d, 30d"),
+    max_points: int = Query(500, ge=10, le=settings.MONITORING_HISTORY_MAX_POINTS),
     token: str = Depends(oauth2_scheme)
 ):
     """Получение исторических метрик устройства"""
@@ -502,36 +978,78 @@ async def get_device_metrics_history(
     
     try:
         # Определение временного диапазона
-        now = datetime.utcnow()
-        if period == "1h":
-            start_time = now - timedelta(hours=1)
-            step = "1m"
-        elif period == "24h":
-            start_time = now - timedelta(days=1)
-            step = "5m"
-        elif period == "7d":
-            start_time = now - timedelta(days=7)
-            step = "1h"
-        elif period == "30d":
-            start_time = now - timedelta(days=30)
-            step = "6h"
-        else:
+        if period not in HISTORY_PERIODS:
             raise HTTPException(status_code=400, detail="Invalid period")
         
-        # Запрос метрик из Prometheus
-        cpu_query = f'100 - (avg by (instance) (rate(node_cpu_seconds_total{{mode="idle",instance=~"{device_id}.*"}}[5m])) * 100)'
-        memory_query = f'(1 - (node_memory_MemAvailable_bytes{{instance=~"{device_id}.*"}} / node_memory_MemTotal_bytes{{instance=~"{device_id}.*"}})) * 100'
+        duration, step = HISTORY_PERIODS[period]
+        step_seconds = parse_step(step)
         
-        cpu_data = await prometheus_client.query_range(cpu_query, start_time, now, step)
-        memory_data = await prometheus_client.query_range(memory_query, start_time, now, step)
+        # Окно выравнивается по шагу, чтобы одновременные запросы делили запись кэша
+        start_ts, end_ts = align_window(time.time(), duration, step_seconds)
         
-        return {
-            "cpu_usage": cpu_data["data"]["result"],
-            "memory_usage": memory_data["data"]["result"],
-            "period": period,
-            "start_time": start_time.isoformat(),
-            "end_time": now.isoformat()
+        # Последние сутки обслуживаются из локального хранилища, если оно их покрывает
+        if (
+            settings.TSDB_ENABLED
+            and period in LOCAL_HISTORY_PERIODS
+            and metric_store.has(device_id)
+            and metric_store.covers(start_ts, tolerance=settings.MONITORING_POLL_INTERVAL_SECONDS)
+        ):
+            now_ts = time.time()
+            return {
+                **{
+                    name: [
+                        {"metric": series["metric"], "values": downsample_values(series["values"], max_points)}
+                        for series in local_history(device_id, name, now_ts - duration, now_ts)
+                    ]
+                    for name in ("cpu_usage", "memory_usage")
+                },
+                # Агрегаты по всем точкам периода, до прореживания
+                "summary": {
+                    name: {
+                        **metric_store.stats(device_id, name, now_ts - duration, now_ts),
+                        "rate": metric_store.rate(device_id, name, now_ts - duration, now_ts)
+                    }
+                    for name in ("cpu_usage", "memory_usage")
+                },
+                "period": period,
+                "source": "local",
+                "start_time": datetime.utcfromtimestamp(now_ts - duration).isoformat(),
+                "end_time": datetime.utcfromtimestamp(now_ts).isoformat()
+            }
+        
+        # Запрос метрик из Prometheus по точным значениям метки instance
+        await instance_index.refresh()
+        matcher = instance_index.matcher(device_id)
+        names = ["cpu_usage", "memory_usage"]
+        queries = {name: device_query(name, matcher) for name in names} if matcher else {}
+        
+        async def load(query: str) -> List[Dict[str, Any]]:
+            return await prometheus_client.query_range_split(query, start_ts, end_ts, step_seconds)
+        
+        results = await asyncio.gather(*(
+            history_cache.get_or_set(
+                ("history", queries[name], period, end_ts),
+                step_seconds,
+                lambda query=queries[name]: load(query)
+            )
+            for name in names
+        )) if queries else [[] for _ in names]
+        
+        response = {
+            name: [
+                {"metric": series["metric"], "values": downsample_values(series["values"], max_points)}
+                for series in result
+            ]
+            for name, result in zip(names, results)
         }
+        response.update({
+            "period": period,
+            "source": "prometheus",
+            "step": step,
+            "start_time": datetime.utcfromtimestamp(start_ts).isoformat(),
+            "end_time": datetime.utcfromtimestamp(end_ts).isoformat()
+        })
+        return response
         
     except HTTPException:
         raise
@@ -540,8 +1058,9 @@ async def get_device_metrics_history(
 
 @router.get("/alerts", response_model=List[MonitoringAlert])
 async def get_monitoring_alerts(
-    limit: int = Query(50, le=100),
-    offset: int = Query(0, ge=0),
+    response: Response,
+    limit: int = Query(50, ge=1),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из X-Next-Cursor"),
     status: Optional[str] = Query(None),
     severity: Optional[str] = Query(None),
     token: str = Depends(oauth2_scheme)
@@ -549,33 +1068,33 @@ async def get_monitoring_alerts(
     """Получение активных предупреждений"""
     
     verify_token(token)
+    limit = clamp_limit(limit, settings.MONITORING_PAGE_MAX_LIMIT)
+    position = parse_cursor(cursor)
     
     try:
-        # Получение предупреждений из логов безопасности
-        query = supabase.table('security_logs').select('*')
-        
-        if status:
-            query = query.eq('resolved', status == "resolved")
-        if severity:
-            query = query.eq('severity', severity)
-        
-        result = query.order('timestamp', desc=True).range(offset, offset + limit - 1).execute()
-        
-        alerts = []
-        for alert_data in result.data or []:
-            alerts.append(MonitoringAlert(
-                id=alert_data['id'],
-                device_id=alert_data.get('details', {}).get('device_id', ''),
-                device_name=alert_data.get('details', {}).get('device_name', ''),
-                alert_type=alert_data['event_type'],
-                severity=alert_data['severity'],
-                message=alert_data.get('details', {}).get('message', ''),
-                status="resolved" if alert_data['resolved'] else "active",
-                created_at=datetime.fromisoformat(alert_data['timestamp']),
-                resolved_at=None
-            ))
+        # Закрытые предупреждения (и все - при нескольких воркерах) читаются из БД,
+        # куда их пишет единственный воркер-писатель
+        if status == RESOLVED or ws_backplane is not None:
+            query = supabase.table('monitoring_alerts').select('*')
+            query = query.eq('status', status) if status else query.in_('status', [ACTIVE, ACKNOWLEDGED])
+            if severity:
+                query = query.eq('severity', severity)
+            
+            result = seek(query, 'created_at', cursor, limit).execute()
+            set_cursor_header(response, next_cursor(result.data or [], 'created_at', limit))
+            return [alert_to_model(AlertState.from_row(row)) for row in result.data or []]
         
-        return alerts
+        # Открытые предупреждения хранятся в памяти, курсор применяется к тому же порядку
+        alerts = alert_manager.list(status, severity)
+        if position:
+            created_at, alert_id = position
+            position = (naive_utc(created_at), str(alert_id))
+            alerts = [state for state in alerts if (naive_utc(state.created_at), state.id) < position]
+        
+        page = alerts[:limit]
+        if len(alerts) > limit:
+            set_cursor_header(response, encode_cursor(page[-1].created_at.isoformat(), page[-1].id))
+        return [alert_to_model(state) for state in page]
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get alerts: {str(e)}")
@@ -588,12 +1107,8 @@ async def acknowledge_alert(alert_id: str, token: str = Depends(oauth2_scheme)):
     user_id = payload.get("user_id")
     
     try:
-        # Обновление статуса предупреждения
-        result = supabase.table('security_logs').update({
-            'resolved': True
-        }).eq('id', alert_id).execute()
-        
-        if not result.data:
+        # Подтверждение пишется сразу в БД: переходы состояний его не перезаписывают
+        if not await alert_manager.acknowledge_stored(alert_id, user_id):
             raise HTTPException(status_code=404, detail="Alert not found")
         
         # Логирование действия
@@ -610,4 +1125,136 @@ async def acknowledge_alert(alert_id: str, token: str = Depends(oauth2_scheme)):
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to acknowledge alert: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to acknowledge alert: {str(e)}")
+
+@router.get("/devices/{device_id}/ping", response_model=List[PingResult])
+async def get_device_ping_results(
+    device_id: str,
+    limit: int = Query(50, ge=1),
+    token: str = Depends(oauth2_scheme)
+):
+    """Последние результаты проверки доступности устройства"""
+    
+    verify_token(token)
+    limit = clamp_limit(limit, settings.MONITORING_PAGE_MAX_LIMIT)
+    
+    try:
+        result = supabase.table('ping_results').select('*').eq('device_id', device_id).order('timestamp', desc=True).limit(limit).execute()
+        
+        return [
+            PingResult(
+                device_id=row['device_id'],
+                ip_address=str(row['ip_address']),
+                status=row['status'],
+                response_time=row.get('response_time'),
+                method=row.get('method'),
+                timestamp=str(row['timestamp'])
+            )
+            for row in result.data or []
+        ]
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get ping results: {str(e)}")
+
+@router.post("/devices/{device_id}/ping", response_model=PingResult)
+async def ping_device(device_id: str, token: str = Depends(oauth2_scheme)):
+    """Внеочередная проверка доступности устройства"""
+    
+    verify_token(token)
+    
+    try:
+        result = await asyncio.to_thread(
+            supabase.table('network_devices').select('id,ip_address').eq('id', device_id).execute
+        )
+        if not result.data or not result.data[0].get('ip_address'):
+            raise HTTPException(status_code=404, detail="Device not found")
+        
+        device = result.data[0]
+        probe = await device_prober.probe(str(device['id']), str(device['ip_address']).split('/')[0])
+        await store_probe_results([probe])
+        
+        return PingResult(**probe.to_row())
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to ping device: {str(e)}")
+
+@router.get("/stats/singleflight")
+async def get_singleflight_stats(token: str = Depends(oauth2_scheme)):
+    """Счетчики объединения одновременных запросов"""
+    
+    verify_token(token)
+    
+    return {"in_flight": read_flight.in_flight, "endpoints": read_flight.stats}
+
+@router.get("/export/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: str = Query("ndjson", description="Формат: csv, ndjson"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    device_id: Optional[str] = Query(None),
+    token: str = Depends(oauth2_scheme)
+):
+    """Потоковая выгрузка логов мониторинга, логов безопасности или предупреждений.
+    
+    Таблица обходится страницами по (время, id) в хронологическом порядке,
+    каждая страница сериализуется и сразу отдается клиенту, поэтому память
+    не зависит от объема выгрузки.
+    """
+    
+    payload = verify_token(token)
+    user_id = payload.get("user_id")
+    user_role = payload.get("role")
+    
+    if user_role not in ["admin", "super_admin", "auditor"]:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(status_code=404, detail="Unknown dataset")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    
+    table, column = EXPORT_DATASETS[dataset]
+    if device_id and table == "security_logs":
+        raise HTTPException(status_code=400, detail="device_id filter is not supported for security logs")
+    
+    def make_query():
+        query = supabase.table(table).select('*')
+        if start:
+            query = query.gte(column, start.isoformat())
+        if end:
+            query = query.lt(column, end.isoformat())
+        if device_id:
+            query = query.eq('device_id', device_id)
+        return query
+    
+    await db.log_audit_event({
+        "user_id": user_id,
+        "action": "data_exported",
+        "resource_type": table,
+        "details": {
+            "format": format,
+            "start": start.isoformat() if start else None,
+            "end": end.isoformat() if end else None,
+            "device_id": device_id
+        }
+    })
+    
+    async def stream():
+        header = True
+        try:
+            async for rows in keyset_pages(make_query, column, settings.EXPORT_PAGE_SIZE):
+                yield format_export_page(rows, format, header)
+                header = False
+        except Exception as e:
+            # Статус ответа уже отправлен, выгрузка обрывается
+            print(f"Export error ({table}): {e}")
+            raise
+    
+    filename = f"{dataset}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        stream(),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
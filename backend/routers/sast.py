@@ -14,6 +14,7 @@ import tarfile
 
 from config import settings, VulnerabilitySeverity
 from database import db, supabase
+from metrics import SUBPROCESS_DURATION, observe
 from routers.auth import oauth2_scheme, verify_token
 
 router = APIRouter()
@@ -126,9 +127,10 @@ class SASTAnalyzer:
                 "--skip", "B101,B601"  # Пропуск некоторых правил
             ]
             
-            result = subprocess.run(
-                cmd, capture_output=True, text=True, timeout=settings.SAST_TIMEOUT_SECONDS
-            )
+            with observe(SUBPROCESS_DURATION, tool="bandit"):
+                result = subprocess.run(
+                    cmd, capture_output=True, text=True, timeout=settings.SAST_TIMEOUT_SECONDS
+                )
             
             if result.stdout:
                 return json.loads(result.stdout)
@@ -159,9 +161,10 @@ class SASTAnalyzer:
                 code_path
             ]
             
-            result = subprocess.run(
-                cmd, capture_output=True, text=True, timeout=settings.SAST_TIMEOUT_SECONDS
-            )
+            with observe(SUBPROCESS_DURATION, tool="semgrep"):
+                result = subprocess.run(
+                    cmd, capture_output=True, text=True, timeout=settings.SAST_TIMEOUT_SECONDS
+                )
             
             if result.stdout:
                 return json.loads(result.stdout)
@@ -180,9 +183,10 @@ class SASTAnalyzer:
                 "--ext", ".js,.jsx,.ts,.tsx"
             ]
             
-            result = subprocess.run(
-                cmd, capture_output=True, text=True, timeout=settings.SAST_TIMEOUT_SECONDS
-            )
+            with observe(SUBPROCESS_DURATION, tool="eslint"):
+                result = subprocess.run(
+                    cmd, capture_output=True, text=True, timeout=settings.SAST_TIMEOUT_SECONDS
+                )
             
             if result.stdout:
                 return json.loads(result.stdout)
@@ -522,9 +526,10 @@ async def scan_repository(
             temp_dir
         ]
         
-        result = subprocess.run(
-            clone_cmd, capture_output=True, text=True, timeout=300
-        )
+        with observe(SUBPROCESS_DURATION, tool="git_clone"):
+            result = subprocess.run(
+                clone_cmd, capture_output=True, text=True, timeout=300
+            )
         
         if result.returncode != 0:
             raise Exception(f"Git clone failed: {result.stderr}")
@@ -0,0 +1,183 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# Ранги серьезности и соответствующие им статусы устройства
+SEVERITY_RANKS = {"warning": 1, "critical": 2}
+STATUS_BY_RANK = np.array(["online", "warning", "offline"], dtype=object)
+
+# Правила по умолчанию (пороги 75/90% по CPU, памяти и диску)
+DEFAULT_RULES = {
+    "stale_after_minutes": 5,
+    "rules": [
+        {"name": "cpu_warning", "metric": "cpu_usage", "threshold": 75, "severity": "warning", "alert": False},
+        {"name": "cpu_critical", "metric": "cpu_usage", "threshold": 90, "severity": "critical",
+         "message": "High CPU usage: {value:.1f}%"},
+        {"name": "memory_warning", "metric": "memory_usage", "threshold": 75, "severity": "warning", "alert": False},
+        {"name": "memory_critical", "metric": "memory_usage", "threshold": 90, "severity": "critical",
+         "message": "High memory usage: {value:.1f}%"},
+        {"name": "disk_warning", "metric": "disk_usage", "threshold": 75, "severity": "warning", "alert": False},
+        {"name": "disk_critical", "metric": "disk_usage", "threshold": 90, "severity": "critical",
+         "message": "High disk usage: {value:.1f}%"},
+    ]
+}
+
+# Имя встроенного правила "устройство не отвечает"
+STALE_RULE = "device_not_responding"
+
+class Rule:
+    """Пороговое правило для метрики.
+
+    Правило без ``device_types``/``groups`` действует на весь парк;
+    правило с тем же именем и фильтром переопределяет его для
+    подходящих устройств.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.name = data["name"]
+        self.metric = data["metric"]
+        self.threshold = float(data["threshold"])
+        self.severity = data.get("severity", "warning")
+        self.rank = SEVERITY_RANKS[self.severity]
+        self.alert = data.get("alert", True)
+        self.message = data.get("message", f"{self.metric} above {self.threshold:g}: {{value:.1f}}")
+        self.device_types = set(data.get("device_types") or [])
+        self.groups = set(data.get("groups") or [])
+
+    @property
+    def specific(self) -> bool:
+        return bool(self.device_types or self.groups)
+
+    def applies(self, device_types: np.ndarray, groups: np.ndarray) -> np.ndarray:
+        """Маска устройств, к которым относится правило"""
+        mask = np.ones(len(device_types), dtype=bool)
+        if self.device_types:
+            mask &= np.isin(device_types, list(self.device_types))
+        if self.groups:
+            mask &= np.isin(groups, list(self.groups))
+        return mask
+
+class FleetEvaluation:
+    """Результат оценки правил по всему парку"""
+
+    def __init__(self, rules: List[Rule], values: np.ndarray, breaches: np.ndarray,
+                 ranks: np.ndarray, stale: np.ndarray, metric_columns: Dict[str, int]):
+        self.rules = rules
+        self.values = values
+        self.breaches = breaches  # (устройства x правила)
+        self.ranks = ranks
+        self.stale = stale
+        self.metric_columns = metric_columns
+        self.has_metrics = ~np.all(np.isnan(values), axis=1) if values.size else np.zeros(len(stale), dtype=bool)
+
+    def status(self, index: int, current: str) -> str:
+        """Статус устройства (без метрик сохраняется текущий)"""
+        if not self.has_metrics[index]:
+            return current
+        return STATUS_BY_RANK[self.ranks[index]]
+
+    def statuses(self, current: List[str]) -> np.ndarray:
+        """Вектор статусов всего парка"""
+        return np.where(self.has_metrics, STATUS_BY_RANK[self.ranks], np.array(current, dtype=object))
+
+    def alerts(self, index: int) -> List[str]:
+        """Сообщения предупреждений устройства"""
+        messages = []
+        for rule_index in np.flatnonzero(self.breaches[index]):
+            rule = self.rules[rule_index]
+            if rule.alert:
+                value = self.values[index, self.metric_columns[rule.metric]]
+                messages.append(rule.message.format(value=value))
+        if self.stale[index]:
+            messages.append("Device not responding")
+        return messages
+
+class RuleEngine:
+    """Векторная оценка пороговых правил статуса и предупреждений.
+
+    Правила загружаются из YAML файла ``MONITORING_RULES_PATH`` и
+    перечитываются при его изменении; при отсутствии файла действуют
+    правила по умолчанию.
+    """
+
+    def __init__(self, metrics: List[str], path: Optional[str] = None):
+        self.metrics = list(metrics)
+        self.metric_columns = {metric: i for i, metric in enumerate(self.metrics)}
+        self.path = path
+        self._mtime: Optional[float] = None
+        self._apply(DEFAULT_RULES)
+        self.reload()
+
+    def _apply(self, config: Dict[str, Any]):
+        rules = [Rule(data) for data in config.get("rules", [])]
+        unknown = [rule.name for rule in rules if rule.metric not in self.metric_columns]
+        if unknown:
+            raise ValueError(f"Неизвестные метрики в правилах: {', '.join(unknown)}")
+        # Общие правила идут раньше переопределяющих с тем же именем
+        self.rules = sorted(rules, key=lambda rule: rule.specific)
+        self.stale_after = float(config.get("stale_after_minutes", 5)) * 60
+
+    def reload(self) -> bool:
+        """Перечитывание файла правил при изменении"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return False
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._apply(yaml.safe_load(f) or {})
+            self._mtime = mtime
+            logger.info(f"Правила мониторинга загружены: {len(self.rules)} из {self.path}")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка загрузки правил мониторинга {self.path}: {e}")
+            return False
+
+    def evaluate(self, values: np.ndarray, device_types: List[Any], groups: List[Any],
+                 last_seen: np.ndarray, now: float) -> FleetEvaluation:
+        """Оценка правил для всего парка.
+
+        ``values`` - матрица (устройства x метрики) в порядке ``metrics``,
+        NaN означает отсутствие значения; ``last_seen`` - unix время.
+        """
+        device_types = np.array(device_types, dtype=object)
+        groups = np.array(groups, dtype=object)
+        count = len(device_types)
+
+        breaches = np.zeros((count, len(self.rules)), dtype=bool)
+        ranks = np.zeros(count, dtype=np.int64)
+        overridden: Dict[str, np.ndarray] = {}
+
+        # Правила обходятся от специфичных к общим, чтобы исключить переопределенные устройства
+        for rule_index in reversed(range(len(self.rules))):
+            rule = self.rules[rule_index]
+            mask = rule.applies(device_types, groups)
+            if rule.specific:
+                overridden[rule.name] = overridden.get(rule.name, np.zeros(count, dtype=bool)) | mask
+            elif rule.name in overridden:
+                mask &= ~overridden[rule.name]
+
+            column = values[:, self.metric_columns[rule.metric]]
+            with np.errstate(invalid="ignore"):
+                breached = mask & (column > rule.threshold)
+            breaches[:, rule_index] = breached
+            ranks = np.where(breached, np.maximum(ranks, rule.rank), ranks)
+
+        stale = last_seen < now - self.stale_after
+        return FleetEvaluation(self.rules, values, breaches, ranks, stale, self.metric_columns)
+
+    def metrics_matrix(self, metrics: List[Dict[str, Any]]) -> np.ndarray:
+        """Матрица значений из словарей метрик устройств"""
+        matrix = np.full((len(metrics), len(self.metrics)), np.nan)
+        for row, device_metrics in enumerate(metrics):
+            for metric, value in device_metrics.items():
+                column = self.metric_columns.get(metric)
+                if column is not None and value is not None:
+                    matrix[row, column] = value
+        return matrix
@@ -218,10 +218,11 @@ class MonitoringStats(BaseModel):
     integrations: Dict[str, bool]
 
 class PingResult(BaseModel):
-    device_id: int
+    device_id: str
     ip_address: str
     status: str
     response_time: Optional[float]
+    method: Optional[str] = None
     timestamp: str
 
 # Схемы для аудита
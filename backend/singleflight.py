@@ -0,0 +1,48 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class SingleFlight:
+    """Объединение одновременных одинаковых вычислений.
+
+    Пока вычисление по ключу выполняется, остальные вызовы с тем же
+    ключом ожидают его результат вместо запуска собственного. Результат
+    не сохраняется: следующий вызов после завершения выполняется заново.
+    Первый элемент ключа - имя операции, по нему ведутся счетчики.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Tuple[Hashable, ...], asyncio.Task] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _counters(self, key: Tuple[Hashable, ...]) -> Dict[str, int]:
+        name = str(key[0])
+        counters = self.stats.get(name)
+        if counters is None:
+            counters = self.stats[name] = {"executions": 0, "coalesced": 0, "errors": 0}
+        return counters
+
+    def _done(self, key: Tuple[Hashable, ...], task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled() and task.exception() is not None:
+            self._counters(key)["errors"] += 1
+
+    @property
+    def in_flight(self) -> int:
+        """Число выполняющихся вычислений"""
+        return len(self._calls)
+
+    async def do(self, key: Tuple[Hashable, ...], factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Результат вычисления по ключу (общий для одновременных вызовов)"""
+        counters = self._counters(key)
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda done, key=key: self._done(key, done))
+            counters["executions"] += 1
+        else:
+            counters["coalesced"] += 1
+
+        # Отмена одного ожидающего не прерывает вычисление для остальных
+        return await asyncio.shield(task)
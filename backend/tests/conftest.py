@@ -0,0 +1,10 @@
+import os
+import sys
+import types
+
+# Модули backend импортируются по имени, как при запуске приложения из backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# database создает клиент Supabase при импорте; проверяемые здесь модули
+# к БД не обращаются, поэтому вместо него подставляется пустой модуль
+sys.modules.setdefault("database", types.SimpleNamespace(db=None, supabase=None))
@@ -0,0 +1,193 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+
+import alerts
+from alerts import ACKNOWLEDGED, ACTIVE, RESOLVED, STALE_SEVERITY, AlertManager, AlertState
+from rules import RuleEngine
+
+METRICS = ["cpu_usage", "memory_usage", "disk_usage"]
+NOW = 1_700_000_000.0
+
+def make_manager(**overrides):
+    options = dict(raise_after=2, clear_after=2, flap_window=600, flap_threshold=4, flap_clear_after=5)
+    options.update(overrides)
+    manager = AlertManager("monitoring_alerts", **options)
+    manager.writing = True
+    return manager
+
+def step(manager, engine, cpu, devices=("a",), last_seen=NOW):
+    values = np.array([[value, 10, 10] for value in cpu], dtype=np.float64)
+    evaluation = engine.evaluate(values, [None] * len(cpu), [None] * len(cpu),
+                                 np.full(len(cpu), last_seen), NOW)
+    return manager.process(evaluation, list(devices), [f"device {d}" for d in devices])
+
+def test_hysteresis():
+    engine, manager = RuleEngine(METRICS), make_manager()
+    assert step(manager, engine, [95]) == []
+    opened = step(manager, engine, [95])
+    assert [(state.rule, state.status) for state in opened] == [("cpu_critical", ACTIVE)]
+    # Одна чистая оценка не закрывает предупреждение, повторное нарушение сбрасывает счетчик
+    assert step(manager, engine, [10]) == []
+    assert step(manager, engine, [95]) == []
+    assert step(manager, engine, [10]) == []
+    resolved = step(manager, engine, [10])
+    assert [(state.id, state.status) for state in resolved] == [(opened[0].id, RESOLVED)]
+    assert manager.list() == []
+
+def test_alert_resolves_when_device_disappears():
+    engine, manager = RuleEngine(METRICS), make_manager(raise_after=1)
+    opened = step(manager, engine, [95, 95], devices=("a", "b"))
+    assert len(opened) == 2
+    resolved = step(manager, engine, [95], devices=("b",))
+    assert [(state.device_id, state.status) for state in resolved] == [("a", RESOLVED)]
+
+def test_stale_device_alert():
+    engine, manager = RuleEngine(METRICS), make_manager(raise_after=1)
+    opened = step(manager, engine, [10], last_seen=NOW - 3600)
+    assert [(state.rule, state.severity) for state in opened] == [("device_not_responding", STALE_SEVERITY)]
+
+def test_flapping_alert_keeps_one_id():
+    engine, manager = RuleEngine(METRICS), make_manager(raise_after=1, clear_after=1, flap_threshold=3)
+    rows = []
+    for cpu in [95, 10, 95, 10, 95, 10, 95, 10]:
+        rows.extend(state.to_row() for state in step(manager, engine, [cpu]))
+    # Открытие, закрытие, повторное открытие уже с признаком дребезга - дальше тишина
+    assert [(row["status"], row["flapping"]) for row in rows] == [
+        (ACTIVE, False), (RESOLVED, False), (ACTIVE, True)
+    ]
+    flapping_id = rows[-1]["id"]
+    assert [state.id for state in manager.list()] == [flapping_id]
+
+    # Закрытие только после flap_clear_after чистых оценок, тем же id
+    transitions = []
+    for _ in range(5):
+        transitions.extend(step(manager, engine, [10]))
+    assert [(state.id, state.status, state.flapping) for state in transitions] == [(flapping_id, RESOLVED, False)]
+
+def test_acknowledge_and_list_filters():
+    engine, manager = RuleEngine(METRICS), make_manager(raise_after=1)
+    opened = step(manager, engine, [95, 95], devices=("a", "b"))
+    state = manager.acknowledge(opened[0].id, "user-1")
+    assert (state.status, state.acknowledged_by) == (ACKNOWLEDGED, "user-1")
+    assert manager.acknowledge("missing", "user-1") is None
+    assert [alert.id for alert in manager.list(status=ACTIVE)] == [opened[1].id]
+    assert manager.open_severities() == {"a": ["critical"], "b": ["critical"]}
+
+def test_row_round_trip():
+    engine, manager = RuleEngine(METRICS), make_manager(raise_after=1)
+    state = step(manager, engine, [95])[0]
+    restored = AlertState.from_row(state.to_row())
+    assert (restored.id, restored.device_id, restored.rule, restored.status, restored.created_at) == (
+        state.id, state.device_id, state.rule, state.status, state.created_at
+    )
+
+class FakeTable:
+    """Таблица предупреждений в памяти с подмножеством построителя запросов PostgREST"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, columns):
+        return FakeQuery(self, None)
+
+    def update(self, values):
+        return FakeQuery(self, values)
+
+class FakeQuery:
+    def __init__(self, table, values):
+        self.table, self.values, self.filters = table, values, []
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def execute(self):
+        rows = [row for row in self.table.rows.values() if all(check(row) for check in self.filters)]
+        for row in rows:
+            row.update(self.values or {})
+        return SimpleNamespace(data=[dict(row) for row in rows])
+
+def use_fake_db(monkeypatch, rows):
+    async def upsert_rows(table, batch):
+        assert len({tuple(sorted(row)) for row in batch}) == 1
+        for row in batch:
+            rows.setdefault(row["id"], {}).update(row)
+        return len(batch)
+
+    monkeypatch.setattr(alerts, "supabase", SimpleNamespace(table=lambda name: FakeTable(rows)))
+    monkeypatch.setattr(alerts, "db", SimpleNamespace(upsert_rows=upsert_rows))
+
+def test_non_writer_keeps_no_alert_ids(monkeypatch):
+    rows = {}
+    use_fake_db(monkeypatch, rows)
+    engine, manager = RuleEngine(METRICS), make_manager(raise_after=1)
+    manager.writing = False
+    manager.writer = lambda: False
+    assert not asyncio.run(manager.claim())
+    opened = step(manager, engine, [95])
+    assert [state.id for state in opened] == [None]
+    assert asyncio.run(manager.persist(opened)) == 0 and rows == {}
+    # Важности открытых предупреждений нужны и без роли писателя
+    assert manager.open_severities() == {"a": ["critical"]} and manager.list() == []
+
+def test_new_writer_continues_stored_alerts(monkeypatch):
+    rows = {}
+    use_fake_db(monkeypatch, rows)
+    engine = RuleEngine(METRICS)
+    previous = make_manager(raise_after=1, clear_after=1)
+    opened = step(previous, engine, [95])
+    asyncio.run(previous.persist(opened))
+    alert_id = opened[0].id
+
+    # Аренда перешла: воркер, копивший состояние без id, перечитывает БД
+    successor = make_manager(raise_after=1, clear_after=1)
+    successor.writing = False
+    successor.writer = lambda: False
+    asyncio.run(successor.claim())
+    step(successor, engine, [95])
+    successor.writer = lambda: True
+    assert asyncio.run(successor.claim())
+    assert [state.id for state in successor.list()] == [alert_id]
+
+    resolved = step(successor, engine, [10])
+    asyncio.run(successor.persist(resolved))
+    assert [state.id for state in resolved] == [alert_id]
+    assert rows[alert_id]["status"] == RESOLVED and len(rows) == 1
+
+    # Потеряв роль, воркер забывает свои id
+    previous.writer = lambda: False
+    asyncio.run(previous.claim())
+    assert previous.list() == [] and opened[0].id is None
+
+def test_acknowledgement_survives_writer_transitions(monkeypatch):
+    rows = {}
+    use_fake_db(monkeypatch, rows)
+    engine = RuleEngine(METRICS)
+    writer = make_manager(raise_after=1, clear_after=1, flap_threshold=2, flap_clear_after=2)
+    opened = step(writer, engine, [95])
+    asyncio.run(writer.persist(opened))
+    alert_id = opened[0].id
+
+    # Подтверждение пришло на другой воркер: в памяти писателя предупреждение активно
+    other = make_manager()
+    assert asyncio.run(other.acknowledge_stored(alert_id, "user-1"))
+    assert not asyncio.run(other.acknowledge_stored(alert_id, "user-1"))
+    assert writer.active[alert_id].status == ACTIVE
+
+    # Переход в дребезг пишется под тем же id и не затирает подтверждение
+    flapping = step(writer, engine, [10])
+    assert [state.id for state in flapping] == [alert_id]
+    asyncio.run(writer.persist(flapping))
+    row = rows[alert_id]
+    assert (row["status"], row["flapping"], row["acknowledged_by"]) == (ACKNOWLEDGED, True, "user-1")
+    assert writer.active[alert_id].status == ACKNOWLEDGED
+
+    resolved = step(writer, engine, [10])
+    asyncio.run(writer.persist(resolved))
+    assert (rows[alert_id]["status"], rows[alert_id]["acknowledged_by"]) == (RESOLVED, "user-1")
@@ -0,0 +1,41 @@
+import numpy as np
+
+from anomaly import EwmaAnomalyDetector
+
+def test_scores_after_warmup():
+    detector = EwmaAnomalyDetector(["cpu"], alpha=0.1, warmup=5)
+    rng = np.random.default_rng(0)
+    scores = [detector.update(["a"], np.array([[50 + rng.normal()]]))[0] for _ in range(50)]
+    assert np.isnan(scores[:5]).all()
+    assert np.nanmax(scores[5:]) < 5
+    assert detector.update(["a"], np.array([[90.0]]))[0] > 10
+
+def test_missing_values_are_ignored():
+    detector = EwmaAnomalyDetector(["cpu", "ram"], alpha=0.5, warmup=1)
+    detector.update(["a"], np.array([[10.0, 20.0]]))
+    score = detector.update(["a"], np.array([[np.nan, 20.0]]))[0]
+    assert score == 0
+    assert np.isnan(detector.update(["b"], np.array([[np.nan, np.nan]]))[0])
+
+def test_constant_series_uses_relative_noise_floor():
+    detector = EwmaAnomalyDetector(["cpu"], alpha=0.1, warmup=1, min_relative_std=0.01)
+    for _ in range(10):
+        detector.update(["a"], np.array([[100.0]]))
+    # Отклонение на 1% при нулевой дисперсии - одно "стандартное отклонение"
+    assert abs(detector.update(["a"], np.array([[101.0]]))[0] - 1) < 1e-6
+
+def test_retain_resets_and_reuses_rows():
+    detector = EwmaAnomalyDetector(["cpu"], alpha=0.1, warmup=1, initial_devices=2)
+    detector.update(["a", "b"], np.array([[1.0], [2.0]]))
+    detector.retain(["b"])
+    assert "a" not in detector._index
+    # Новое устройство занимает освобожденную строку и начинает без статистики
+    assert np.isnan(detector.update(["c"], np.array([[3.0]]))[0])
+    assert len(detector._mean) == 2
+    assert detector.update(["c"], np.array([[3.0]]))[0] == 0
+
+def test_grows_beyond_initial_rows():
+    detector = EwmaAnomalyDetector(["cpu"], alpha=0.1, warmup=1, initial_devices=1)
+    devices = [str(i) for i in range(10)]
+    detector.update(devices, np.arange(10, dtype=np.float64).reshape(-1, 1))
+    assert (detector.update(devices, np.arange(10, dtype=np.float64).reshape(-1, 1)) == 0).all()
@@ -0,0 +1,89 @@
+import asyncio
+from types import SimpleNamespace
+
+from fleet import FleetAggregates, FleetPoller
+
+def device(device_id, status="online", cpu=None, memory=None, network_in=0.0, network_out=0.0):
+    return SimpleNamespace(device_id=device_id, status=status, cpu_usage=cpu, memory_usage=memory,
+                           network_in=network_in, network_out=network_out)
+
+def test_updates_adjust_aggregates_by_difference():
+    aggregates = FleetAggregates()
+    aggregates.update(device("a", cpu=10, memory=40, network_in=5))
+    aggregates.update(device("b", status="warning", cpu=30, network_out=2))
+    assert aggregates.total == 2
+    assert (aggregates.count("online"), aggregates.count("warning")) == (1, 1)
+    assert aggregates.average_cpu == 20 and aggregates.average_memory == 40
+    assert (aggregates.traffic_in, aggregates.traffic_out) == (5, 2)
+
+    aggregates.update(device("a", status="offline", cpu=50, memory=None))
+    assert (aggregates.count("online"), aggregates.count("offline")) == (0, 1)
+    assert aggregates.average_cpu == 40 and aggregates.memory_count == 0
+    assert aggregates.traffic_in == 0
+
+    aggregates.remove("b")
+    aggregates.remove("missing")
+    assert aggregates.total == 1 and aggregates.count("warning") == 0
+    assert aggregates.cpu_count == 1 and aggregates.traffic_out == 0
+
+def test_sums_do_not_drift():
+    aggregates = FleetAggregates()
+    aggregates.update(device("base", network_in=1e9, cpu=50))
+    for i in range(10000):
+        aggregates.update(device("a", network_in=0.1 * (i % 7) + 1e-4, cpu=33.3 + i % 3))
+    aggregates.remove("a")
+    assert aggregates.traffic_in == 1e9 and aggregates.traffic_in_fixed == 10 ** 12
+    assert aggregates.average_cpu == 50 and aggregates.cpu_sum_fixed == 50000
+    aggregates.remove("base")
+    assert (aggregates.traffic_in, aggregates.traffic_out, aggregates.cpu_count) == (0, 0, 0)
+
+def test_percentiles_from_histogram():
+    aggregates = FleetAggregates()
+    for i in range(100):
+        aggregates.update(device(str(i), cpu=float(i), memory=150.0))
+    assert aggregates.cpu_percentile(50) == 49
+    assert aggregates.cpu_percentile(95) == 94
+    # Значения вне 0..100 попадают в крайние корзины
+    assert aggregates.memory_percentile(50) == 100
+    assert FleetAggregates().cpu_percentile(95) == 0
+
+def test_snapshot_refreshes_on_demand_without_background_poll():
+    calls = []
+
+    async def collect():
+        calls.append(1)
+        return [device(str(len(calls)))]
+
+    async def main():
+        poller = FleetPoller(collect, interval=0.05)
+        first = await poller.get_snapshot()
+        assert await poller.get_snapshot() is first
+        await asyncio.sleep(0.06)
+        # Параллельные запросы устаревшего снимка объединяются в один опрос
+        second, third = await asyncio.gather(poller.get_snapshot(), poller.get_snapshot())
+        return first, second, third
+
+    first, second, third = asyncio.run(main())
+    assert len(calls) == 2
+    assert second is third and second is not first
+    assert list(second.devices) == ["2"]
+
+def test_background_poll_snapshot_is_not_refreshed_on_read():
+    calls = []
+
+    async def collect():
+        calls.append(1)
+        return []
+
+    async def main():
+        poller = FleetPoller(collect, interval=60)
+        poller.start()
+        try:
+            snapshot = await poller.get_snapshot()
+            poller.interval = 0
+            assert await poller.get_snapshot() is snapshot
+        finally:
+            await poller.stop()
+
+    asyncio.run(main())
+    assert len(calls) == 1
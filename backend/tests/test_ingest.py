@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import ingest
+from ingest import IngestBuffer, is_permanent_error
+
+class InsertError(Exception):
+    def __init__(self, code=None):
+        super().__init__(f"insert failed ({code})")
+        self.code = code
+
+class FakeSupabase:
+    """Клиент, записывающий вставленные пакеты; ``errors`` - ошибки очередных вставок"""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.batches = []
+
+    def table(self, name):
+        return SimpleNamespace(insert=lambda rows: SimpleNamespace(execute=lambda: self._insert(rows)))
+
+    def _insert(self, rows):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.batches.append(rows)
+
+def make_buffer(monkeypatch, client, **overrides):
+    audit = []
+
+    async def log_audit_event(event):
+        audit.append(event)
+
+    monkeypatch.setattr(ingest, "supabase", client)
+    monkeypatch.setattr(ingest, "db", SimpleNamespace(log_audit_event=log_audit_event))
+    options = dict(capacity=10, batch_size=4, flush_interval=1.0, max_retries=2)
+    options.update(overrides)
+    return IngestBuffer("monitoring_logs", "monitoring_logs_ingested", **options), audit
+
+def rows(count, start=0):
+    return [{"device_id": str(i), "metric_value": float(i)} for i in range(start, start + count)]
+
+def test_offer_rejects_when_full(monkeypatch):
+    buffer, _ = make_buffer(monkeypatch, FakeSupabase())
+    assert buffer.offer(rows(8), "user-1")
+    # Пакет не принимается частично: емкость превышена - отказ целиком
+    assert not buffer.offer(rows(3), "user-1")
+    assert buffer.offer(rows(2), "user-1")
+    assert buffer.depth == 10
+    assert (buffer.stats["accepted"], buffer.stats["rejected"]) == (10, 3)
+
+def test_flush_writes_batches_with_one_audit_event_each(monkeypatch):
+    client = FakeSupabase()
+    buffer, audit = make_buffer(monkeypatch, client)
+    buffer.offer(rows(3), "user-1")
+    buffer.offer(rows(3, start=3), "user-2")
+    asyncio.run(buffer.flush())
+    assert [len(batch) for batch in client.batches] == [4, 2]
+    assert buffer.depth == 0 and buffer.stats["flushed"] == 6 and buffer.stats["batches"] == 2
+    assert [event["details"]["users"] for event in audit] == [{"user-1": 3, "user-2": 1}, {"user-2": 2}]
+    assert [event["user_id"] for event in audit] == [None, "user-2"]
+
+def test_transient_error_retries_same_batch_first(monkeypatch):
+    client = FakeSupabase(errors=[InsertError("08006")])
+    buffer, _ = make_buffer(monkeypatch, client)
+    buffer.offer(rows(6))
+    asyncio.run(buffer.flush())
+    # Первая попытка не удалась - пакет ждет повтора и по-прежнему учитывается в глубине
+    assert client.batches == [] and buffer.depth == 6
+    asyncio.run(buffer.flush())
+    assert client.batches == [rows(4), rows(2, start=4)]
+    assert buffer.stats["failed"] == 0 and buffer.stats["flushed"] == 6
+
+def test_retry_cap_drops_batch(monkeypatch):
+    client = FakeSupabase(errors=[TimeoutError()] * 3)
+    buffer, _ = make_buffer(monkeypatch, client, max_retries=2)
+    buffer.offer(rows(6))
+    for _ in range(3):
+        asyncio.run(buffer.flush())
+    # Третья неудача превышает max_retries: первый пакет отброшен, остаток записан следующим flush
+    assert buffer.stats["failed"] == 4 and buffer.depth == 2 and client.batches == []
+    asyncio.run(buffer.flush())
+    assert client.batches == [rows(2, start=4)] and buffer.depth == 0
+
+def test_permanent_error_drops_batch_without_retry(monkeypatch):
+    client = FakeSupabase(errors=[InsertError("PGRST102")])
+    buffer, audit = make_buffer(monkeypatch, client)
+    buffer.offer(rows(6))
+    asyncio.run(buffer.flush())
+    assert buffer.stats["failed"] == 4 and buffer.depth == 2 and audit == []
+    asyncio.run(buffer.flush())
+    assert client.batches == [rows(2, start=4)]
+
+def test_is_permanent_error():
+    assert is_permanent_error(InsertError("23505"))
+    assert is_permanent_error(InsertError("PGRST204"))
+    assert not is_permanent_error(InsertError("PGRST001"))
+    assert not is_permanent_error(InsertError("40001"))
+    assert not is_permanent_error(ConnectionError())
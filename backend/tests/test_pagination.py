@@ -0,0 +1,94 @@
+import asyncio
+import base64
+import json
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from pagination import clamp_limit, decode_cursor, encode_cursor, keyset_pages, next_cursor, seek
+
+ROW_ID = uuid.UUID("0b0f5d6e-8f0c-4f57-9a4e-3f9b2f1b7d10")
+
+def raw_cursor(timestamp, row_id) -> str:
+    return base64.urlsafe_b64encode(json.dumps([timestamp, row_id]).encode()).decode().rstrip("=")
+
+class FakeQuery:
+    """Построитель запроса над списком строк с упорядочиванием по (timestamp, id)"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+        self.size = None
+
+    def or_(self, expression):
+        self.filters.append(expression)
+        return self
+
+    def order(self, column, desc=False):
+        self.desc = desc
+        return self
+
+    def limit(self, size):
+        self.size = size
+        return self
+
+    def execute(self):
+        rows = sorted(self.rows, key=lambda row: (row["timestamp"], row["id"]), reverse=self.desc)
+        for expression in self.filters:
+            timestamp = expression.split('"')[1]
+            row_id = expression.rsplit(".", 1)[1].rstrip(")")
+            rows = [row for row in rows if (row["timestamp"], row["id"]) > (timestamp, row_id)]
+        return type("Result", (), {"data": rows[:self.size]})()
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(timestamp.isoformat(), ROW_ID)) == (timestamp, ROW_ID)
+
+def test_naive_cursor_time_is_utc():
+    timestamp, _ = decode_cursor(encode_cursor("2024-05-01T12:30:00", ROW_ID))
+    assert timestamp.tzinfo == timezone.utc
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 !",
+    raw_cursor("2024-05-01T12:30:00", "1),id.gt.0"),
+    raw_cursor('2024",and(id.gt.0', str(ROW_ID)),
+    raw_cursor(None, str(ROW_ID)),
+    base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_seek_filter_uses_normalized_values():
+    query = FakeQuery([])
+    seek(query, "timestamp", encode_cursor("2024-05-01 12:30:00+03:00", str(ROW_ID).upper()), 10)
+    assert query.filters == [
+        f'timestamp.lt."2024-05-01T12:30:00+03:00",'
+        f'and(timestamp.eq."2024-05-01T12:30:00+03:00",id.lt.{ROW_ID})'
+    ]
+    assert query.size == 10
+
+def test_next_cursor_only_for_full_pages():
+    rows = [{"timestamp": "2024-05-01T00:00:00+00:00", "id": str(ROW_ID)}]
+    assert next_cursor(rows, "timestamp", 2) is None
+    cursor = next_cursor(rows, "timestamp", 1)
+    assert decode_cursor(cursor)[1] == ROW_ID
+
+def test_clamp_limit():
+    assert clamp_limit(0, 100) == 1
+    assert clamp_limit(50, 100) == 50
+    assert clamp_limit(1000, 100) == 100
+
+def test_keyset_pages_walks_all_rows_once():
+    rows = [
+        {"timestamp": f"2024-05-01T00:00:{i // 3:02d}+00:00", "id": str(uuid.UUID(int=i))}
+        for i in range(25)
+    ]
+
+    async def collect():
+        return [page async for page in keyset_pages(lambda: FakeQuery(rows), "timestamp", 10)]
+
+    pages = asyncio.run(collect())
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [row["id"] for page in pages for row in page] == [row["id"] for row in rows]
@@ -0,0 +1,75 @@
+import asyncio
+import socket
+
+from prober import Prober, tcp_ping
+
+def listening_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+    return sock
+
+def closed_port() -> int:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def test_tcp_ping_open_port():
+    with listening_socket() as server:
+        port = server.getsockname()[1]
+        elapsed = asyncio.run(tcp_ping("127.0.0.1", port))
+    assert elapsed is not None and elapsed >= 0
+
+def test_tcp_ping_refused_port_is_reachable():
+    # RST от закрытого порта означает, что узел отвечает
+    elapsed = asyncio.run(tcp_ping("127.0.0.1", closed_port()))
+    assert elapsed is not None
+
+def test_tcp_ping_unreachable_address():
+    assert asyncio.run(tcp_ping("256.0.0.1", 80)) is None
+
+def make_prober(load_targets, on_results, tcp_ports, timeout=0.5):
+    return Prober(load_targets, on_results, interval=0.05, timeout=timeout,
+                  concurrency=4, methods=["tcp"], tcp_ports=tcp_ports)
+
+def test_probe_statuses():
+    async def main():
+        with listening_socket() as server:
+            prober = make_prober(None, None, [server.getsockname()[1]])
+            online = await prober.probe("up", "127.0.0.1")
+            offline = await prober.probe("down", "256.0.0.1")
+        return online, offline
+
+    online, offline = asyncio.run(main())
+    assert (online.status, online.method) == ("online", "tcp")
+    assert online.response_time is not None
+    assert (offline.status, offline.method, offline.response_time) == ("offline", None, None)
+
+def test_prober_runs_rounds():
+    async def main():
+        rounds = []
+        with listening_socket() as server:
+            async def load_targets():
+                return [("a", "127.0.0.1"), ("b", "127.0.0.1")]
+
+            async def on_results(results):
+                rounds.append(results)
+
+            prober = make_prober(load_targets, on_results, [server.getsockname()[1]])
+            prober.start()
+            try:
+                for _ in range(100):
+                    if len(rounds) >= 2:
+                        break
+                    await asyncio.sleep(0.02)
+            finally:
+                await prober.stop()
+        return prober, rounds
+
+    prober, rounds = asyncio.run(main())
+    assert len(rounds) >= 2
+    assert sorted(result.device_id for result in rounds[0]) == ["a", "b"]
+    assert all(result.status == "online" for result in rounds[0])
+    assert prober.stats["rounds"] >= 2 and prober.stats["online"] == 2
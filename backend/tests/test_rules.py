@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from rules import RuleEngine
+
+METRICS = ["cpu_usage", "memory_usage", "disk_usage"]
+NOW = 1_700_000_000.0
+
+def evaluate(engine, values, device_types=None, groups=None, last_seen=None):
+    values = np.array(values, dtype=np.float64)
+    count = len(values)
+    return engine.evaluate(
+        values,
+        device_types or [None] * count,
+        groups or [None] * count,
+        np.array(last_seen if last_seen is not None else [NOW] * count, dtype=np.float64),
+        NOW
+    )
+
+def test_default_thresholds():
+    engine = RuleEngine(METRICS)
+    evaluation = evaluate(engine, [[10, 10, 10], [80, 10, 10], [95, 10, 10], [np.nan] * 3])
+    assert evaluation.statuses(["online", "online", "online", "offline"]).tolist() == [
+        "online", "warning", "offline", "offline"
+    ]
+    # Предупреждение пишется только по правилам с alert
+    assert evaluation.alerts(1) == []
+    assert evaluation.alerts(2) == ["High CPU usage: 95.0%"]
+
+def test_stale_devices():
+    engine = RuleEngine(METRICS)
+    evaluation = evaluate(engine, [[10, 10, 10], [10, 10, 10]], last_seen=[NOW, NOW - 3600])
+    assert evaluation.stale.tolist() == [False, True]
+    assert evaluation.alerts(1) == ["Device not responding"]
+
+def test_specific_rule_overrides_general(tmp_path):
+    path = tmp_path / "rules.yaml"
+    path.write_text(
+        "rules:\n"
+        "  - {name: cpu_critical, metric: cpu_usage, threshold: 90, severity: critical}\n"
+        "  - {name: cpu_critical, metric: cpu_usage, threshold: 98, severity: critical, device_types: [firewall]}\n",
+        encoding="utf-8"
+    )
+    engine = RuleEngine(METRICS, str(path))
+    evaluation = evaluate(engine, [[95, 0, 0], [95, 0, 0], [99, 0, 0]],
+                          device_types=["router", "firewall", "firewall"])
+    assert evaluation.ranks.tolist() == [2, 0, 2]
+
+def test_reload_keeps_rules_on_error(tmp_path):
+    path = tmp_path / "rules.yaml"
+    path.write_text("rules:\n  - {name: x, metric: temperature, threshold: 1}\n", encoding="utf-8")
+    engine = RuleEngine(METRICS, str(path))
+    assert [rule.name for rule in engine.rules][:2] == ["cpu_warning", "cpu_critical"]
+
+def test_unknown_metric_is_rejected():
+    engine = RuleEngine(METRICS)
+    with pytest.raises(ValueError):
+        engine._apply({"rules": [{"name": "x", "metric": "temperature", "threshold": 1}]})
+
+def test_metrics_matrix():
+    engine = RuleEngine(METRICS)
+    matrix = engine.metrics_matrix([{"cpu_usage": 5, "unknown": 1}, {"disk_usage": None}])
+    assert matrix[0, 0] == 5
+    assert np.isnan(matrix[0, 1:]).all() and np.isnan(matrix[1]).all()
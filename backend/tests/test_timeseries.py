@@ -0,0 +1,48 @@
+import numpy as np
+
+from timeseries import align_window, downsample_values, lttb, parse_step, split_range
+
+def test_parse_step():
+    assert parse_step("15s") == 15
+    assert parse_step("5m") == 300
+    assert parse_step("6h") == 21600
+
+def test_align_window_is_stable_within_step():
+    assert align_window(1000, 600, 60) == (360, 960)
+    assert align_window(1019, 600, 60) == align_window(960, 600, 60)
+
+def test_split_range_covers_range_without_overlap():
+    step, max_points = 15, 100
+    ranges = split_range(0, 10000, step, max_points)
+    assert ranges[0][0] == 0 and ranges[-1][1] == 10000
+    for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+        assert next_start == end + step
+    for start, end in ranges:
+        assert (end - start) // step + 1 <= max_points
+
+def test_split_range_single_chunk():
+    assert split_range(0, 60, 15, 100) == [(0, 60)]
+
+def test_lttb_keeps_endpoints_and_peak():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.sin(x / 50)
+    y[537] = 10
+    points = np.column_stack([x, y])
+    result = lttb(points, 50)
+    assert len(result) == 50
+    assert result[0].tolist() == points[0].tolist()
+    assert result[-1].tolist() == points[-1].tolist()
+    assert 537 in result[:, 0]
+    assert np.all(np.diff(result[:, 0]) > 0)
+
+def test_lttb_returns_short_series_unchanged():
+    points = np.array([[0.0, 1.0], [1.0, 2.0], [2.0, 3.0]])
+    assert lttb(points, 10) is points
+    assert lttb(points, 2) is points
+
+def test_downsample_values_skips_non_finite():
+    values = [[i, "NaN" if i == 3 else str(i)] for i in range(100)]
+    result = downsample_values(values, 10)
+    assert len(result) == 10
+    assert all(value != "nan" for _, value in result)
+    assert downsample_values(values[:5], 10) == values[:5]
@@ -0,0 +1,50 @@
+import numpy as np
+
+from tsdb import MetricRingStore
+
+def filled_store(capacity=8, max_devices=4):
+    store = MetricRingStore(["cpu", "ram"], capacity, max_devices, initial_devices=1)
+    for i in range(10):
+        store.append(100.0 + i, {
+            "a": {"cpu": float(i), "ram": 50.0},
+            "b": {"cpu": None if i % 2 else 10.0 * i, "ram": None},
+        })
+    return store
+
+def test_range_keeps_last_capacity_samples_in_order():
+    store = filled_store()
+    timestamps, values = store.range("a", "cpu", 0, 1000)
+    assert timestamps.tolist() == [102.0 + i for i in range(8)]
+    assert values.tolist() == [float(i) for i in range(2, 10)]
+    assert store.oldest == 102.0 and store.covers(102) and not store.covers(100)
+
+def test_stats_and_rate():
+    store = filled_store()
+    assert store.stats("a", "cpu", 104, 107) == {"min": 4.0, "max": 7.0, "avg": 5.5, "count": 4}
+    assert store.rate("a", "cpu", 104, 107) == 1.0
+    # Пропуски не участвуют в агрегатах
+    assert store.stats("b", "cpu", 0, 1000) == {"min": 20.0, "max": 80.0, "avg": 50.0, "count": 4}
+    assert store.stats("b", "ram", 0, 1000) == {"min": None, "max": None, "avg": None, "count": 0}
+    assert store.rate("a", "cpu", 104, 104) is None
+    assert store.stats("missing", "cpu", 0, 1000)["count"] == 0
+
+def test_fleet_stats_follow_recycled_rows():
+    store = filled_store()
+    store.retain(["b"])
+    store.append(110.0, {"c": {"cpu": 99.0}, "b": {"cpu": 1.0}})
+    stats = store.fleet_stats("cpu", 0, 1000)
+    by_device = {device_id: (stats["min"][i], stats["max"][i]) for i, device_id in enumerate(stats["device_ids"])}
+    assert by_device == {"b": (1.0, 80.0), "c": (99.0, 99.0)}
+    empty = store.fleet_stats("cpu", 2000, 3000)
+    assert np.isnan(empty["avg"]).all()
+
+def test_max_devices_and_row_reuse():
+    store = MetricRingStore(["cpu"], 4, max_devices=2, initial_devices=1)
+    store.append(1.0, {"a": {"cpu": 1.0}, "b": {"cpu": 2.0}, "c": {"cpu": 3.0}})
+    assert store.has("a") and store.has("b") and not store.has("c")
+    memory = store.memory_bytes
+    store.retain(["b"])
+    store.append(2.0, {"b": {"cpu": 2.0}, "c": {"cpu": 3.0}})
+    assert store.has("c") and store.memory_bytes == memory
+    # Строка удаленного устройства очищена до передачи новому
+    assert store.range("c", "cpu", 0, 10)[1].tolist() == [3.0]
@@ -0,0 +1,160 @@
+import asyncio
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+from fleet import FleetAggregates, FleetSnapshot
+from ws_feed import FleetChange, MonitoringFeed, parse_subscription
+from ws_hub import WebSocketClient, WebSocketHub
+
+class FakePoller:
+    def __init__(self):
+        self.aggregates = FleetAggregates()
+        self.snapshot = None
+
+    def add_listener(self, listener):
+        pass
+
+def device(device_id, cpu=10.0, device_type="switch", status="online"):
+    return SimpleNamespace(device_id=device_id, device_name=f"device {device_id}", status=status,
+                           cpu_usage=cpu, memory_usage=20.0, alerts=[], device_type=device_type,
+                           site="hq", alert_severities=[])
+
+class Harness:
+    """Лента с клиентами без сокетов: кадры остаются в очередях клиентов"""
+
+    def __init__(self, history=60):
+        self.hub = WebSocketHub(queue_size=16)
+        self.feed = MonitoringFeed(self.hub, FakePoller(), interval=0, history=history)
+        self._ids = 0
+
+    def connect(self):
+        self._ids += 1
+        client = WebSocketClient(self._ids, None, self.hub.queue_size)
+        self.hub.clients[client.id] = client
+        self.feed.welcome(client)
+        return client
+
+    def publish(self, *devices):
+        snapshot = FleetSnapshot(list(devices), datetime(2024, 5, 1), 0.1)
+        asyncio.run(self.feed._deliver([self.feed.diff_snapshot(snapshot)]))
+
+    def send(self, client, message):
+        self.feed.receive(client, json.dumps(message))
+
+def frames(client):
+    result = []
+    while not client.queue.empty():
+        result.append(json.loads(client.queue.get_nowait()))
+    return result
+
+def test_snapshot_then_cumulative_deltas():
+    harness = Harness()
+    client = harness.connect()
+    harness.publish(device("a"), device("b"))
+    [snapshot] = frames(client)
+    assert (snapshot["type"], snapshot["version"]) == ("snapshot", 1)
+    assert sorted(item["id"] for item in snapshot["devices"]) == ["a", "b"]
+
+    # Неподтвержденный снимок - база дельты; в дельте только изменившиеся поля
+    harness.publish(device("a", cpu=50.0), device("b"))
+    [delta] = frames(client)
+    assert (delta["type"], delta["from"], delta["version"]) == ("delta", 1, 2)
+    assert delta["devices"] == [{"id": "a", "cpu": 50.0}] and delta["removed"] == []
+
+    # Без подтверждения дельта накапливает изменения с последней базы
+    harness.publish(device("a", cpu=50.0), device("b", cpu=70.0))
+    harness.publish(device("a", cpu=60.0))
+    deltas = frames(client)
+    assert [(frame["from"], frame["version"]) for frame in deltas] == [(1, 3), (1, 4)]
+    assert deltas[-1]["devices"] == [{"id": "a", "cpu": 60.0}] and deltas[-1]["removed"] == ["b"]
+
+    harness.send(client, {"type": "ack", "version": 4})
+    harness.publish(device("a", cpu=60.0, status="warning"))
+    [delta] = frames(client)
+    assert (delta["from"], delta["devices"]) == (4, [{"id": "a", "status": "warning"}])
+
+def test_acks_are_validated():
+    harness = Harness()
+    client = harness.connect()
+    harness.publish(device("a"))
+    harness.publish(device("a", cpu=20.0))
+    frames(client)
+    for version in (0, 3, True, "2"):
+        harness.send(client, {"type": "ack", "version": version})
+        assert not client.acked
+    harness.send(client, {"type": "ack", "version": 2})
+    harness.send(client, {"type": "ack", "version": 1})
+    # Подтверждение не откатывает базу клиента
+    assert (client.version, client.acked) == (2, True)
+
+def test_lagging_or_resyncing_client_gets_snapshot():
+    harness = Harness(history=2)
+    client = harness.connect()
+    harness.publish(device("a"))
+    harness.send(client, {"type": "ack", "version": 1})
+    for cpu in (20.0, 30.0, 40.0):
+        harness.publish(device("a", cpu=cpu))
+    assert frames(client)[-1]["type"] == "snapshot"
+
+    harness.send(client, {"type": "ack", "version": 4})
+    harness.send(client, {"type": "resync"})
+    harness.publish(device("a", cpu=50.0))
+    assert [frame["type"] for frame in frames(client)] == ["snapshot"]
+
+def test_dropped_unacked_snapshot_resets_client():
+    harness = Harness()
+    client = harness.connect()
+    harness.publish(device("a"))
+    assert client.version == 1 and not client.acked
+    harness.feed._on_drop(client)
+    assert client.version is None
+    client.acked, client.version = True, 1
+    harness.feed._on_drop(client)
+    # Подтвержденная база остается безопасной
+    assert client.version == 1
+
+def test_subscription_views():
+    harness = Harness()
+    harness.publish(device("a", device_type="router"), device("b"))
+    everyone, routers = harness.connect(), harness.connect()
+    harness.send(routers, {"type": "subscribe", "device_types": ["router"]})
+    assert [item["id"] for item in frames(routers)[-1]["devices"]] == ["a"]
+    assert harness.feed.views == 2
+    frames(everyone)
+
+    # Устройство, ставшее подходить под подписку, приходит со всеми полями, переставшее - удаляется
+    harness.publish(device("a"), device("b", device_type="router"))
+    [delta] = frames(routers)
+    assert delta["removed"] == ["a"]
+    assert delta["devices"] == [{"id": "b", "name": "device b", "status": "online", "cpu": 10.0, "ram": 20.0, "alerts": []}]
+    # Весь парк видит только смену признаков, без изменения полей
+    assert [frame["devices"] for frame in frames(everyone)] == [[]]
+
+    del harness.hub.clients[routers.id]
+    harness.publish(device("a"), device("b", device_type="router"))
+    assert harness.feed.views == 1
+
+def test_parse_subscription():
+    assert parse_subscription({}) == frozenset()
+    assert parse_subscription({"device_ids": ["a", 1], "sites": ["hq"]}) == frozenset(
+        {("device_id", "a"), ("device_id", "1"), ("site", "hq")}
+    )
+    assert parse_subscription({"device_ids": "a"}) is None
+    assert parse_subscription({"device_ids": [True]}) is None
+    assert parse_subscription({"device_ids": [{"id": 1}]}) is None
+
+def test_change_message_and_checkpoint_round_trip():
+    producer, replica = Harness(), Harness()
+    producer.publish(device("a"), device("b"))
+    snapshot = FleetSnapshot([device("a", cpu=30.0)], datetime(2024, 5, 1), 0.1)
+    change = producer.feed.diff_snapshot(snapshot)
+    assert sorted(change.devices) == ["a"] and change.removed == ["b"]
+
+    # Реплика восстанавливается по контрольной точке как одним изменением
+    checkpoint = FleetChange.from_message(producer.feed.checkpoint(change))
+    restored = replica.feed.diff(checkpoint.version, checkpoint.timestamp, checkpoint.traffic, checkpoint.devices.items())
+    asyncio.run(replica.feed._deliver([FleetChange.from_message(restored.to_message())]))
+    asyncio.run(producer.feed._deliver([change]))
+    assert replica.feed.version == producer.feed.version == 2
+    assert replica.feed._state[3] == producer.feed._state[3]
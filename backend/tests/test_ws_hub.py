@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from ws_hub import CLOSE_TRY_AGAIN_LATER, DISCONNECT, DROP_OLDEST, WebSocketHub
+
+class FakeWebSocket:
+    """Сокет, отправка в который ждет разрешения теста"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+        self.release = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        await self.release.wait()
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+def queued(client):
+    return list(client.queue._queue)
+
+def test_drop_oldest_keeps_newest_frames():
+    async def main():
+        hub = WebSocketHub(queue_size=2, policy=DROP_OLDEST, max_dropped=10)
+        dropped = []
+        hub.on_drop = dropped.append
+        websocket = FakeWebSocket()
+        client = await hub.connect(websocket)
+        # Первый кадр забирает задача отправки, в очереди помещаются два
+        assert hub.send(client, "0")
+        await asyncio.sleep(0)
+        for i in range(1, 5):
+            assert hub.send(client, str(i))
+        assert queued(client) == ["3", "4"]
+        assert client.dropped == 2 and dropped == [client, client]
+
+        websocket.release.set()
+        await asyncio.sleep(0.01)
+        assert websocket.sent == ["0", "3", "4"] and client.dropped_in_row == 0
+        await hub.close_all()
+
+    asyncio.run(main())
+
+def test_drop_oldest_disconnects_after_max_dropped():
+    async def main():
+        hub = WebSocketHub(queue_size=1, policy=DROP_OLDEST, max_dropped=3)
+        websocket = FakeWebSocket()
+        client = await hub.connect(websocket)
+        hub.send(client, "0")
+        await asyncio.sleep(0)
+        results = [hub.send(client, str(i)) for i in range(1, 6)]
+        await asyncio.sleep(0.01)
+        # Третий вытесненный подряд кадр отключает клиента
+        assert results == [True, True, True, False, False]
+        assert client.closed and client.id not in hub.clients
+        assert websocket.closed_with == CLOSE_TRY_AGAIN_LATER
+
+    asyncio.run(main())
+
+def test_disconnect_policy_closes_on_full_queue():
+    async def main():
+        hub = WebSocketHub(queue_size=1, policy=DISCONNECT)
+        websocket = FakeWebSocket()
+        client = await hub.connect(websocket)
+        assert hub.broadcast("0") == 1
+        await asyncio.sleep(0)
+        assert hub.broadcast("1") == 1
+        assert hub.broadcast("2") == 0
+        await asyncio.sleep(0.01)
+        assert client.closed and websocket.closed_with == CLOSE_TRY_AGAIN_LATER
+
+    asyncio.run(main())
+
+def test_send_timeout_closes_client():
+    async def main():
+        hub = WebSocketHub(queue_size=4, send_timeout=0.05)
+        websocket = FakeWebSocket()
+        client = await hub.connect(websocket)
+        hub.send(client, "frame")
+        await asyncio.sleep(0.1)
+        assert client.closed and hub.depth == 0
+
+    asyncio.run(main())
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        WebSocketHub(queue_size=1, policy="block")
@@ -0,0 +1,130 @@
+import asyncio
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+import numpy as np
+
+# Множители суффиксов длительности Prometheus
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+def parse_step(step: str) -> int:
+    """Перевод длительности вида 15s/5m/6h в секунды"""
+    return int(step[:-1]) * DURATION_UNITS[step[-1]]
+
+def align_window(end: float, duration: float, step: int) -> Tuple[float, float]:
+    """Окно [start, end], конец которого выровнен по шагу.
+
+    Все запросы в пределах одного шага получают одинаковые границы и
+    поэтому попадают в одну запись кэша.
+    """
+    aligned_end = math.floor(end / step) * step
+    return aligned_end - duration, aligned_end
+
+def split_range(start: float, end: float, step: int, max_points: int) -> List[Tuple[float, float]]:
+    """Разбиение диапазона на выровненные по шагу поддиапазоны не более max_points точек"""
+    span = step * (max_points - 1)
+    ranges = []
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + span, end)
+        ranges.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + step
+    return ranges
+
+def lttb(points: np.ndarray, threshold: int) -> np.ndarray:
+    """Прореживание ряда алгоритмом Largest-Triangle-Three-Buckets.
+
+    ``points`` - массив формы (n, 2) из пар (timestamp, value).
+    Первая и последняя точки сохраняются, из каждой корзины выбирается
+    точка, образующая наибольший треугольник с соседними корзинами.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return points
+
+    x = points[:, 0]
+    y = points[:, 1]
+    every = (n - 2) / (threshold - 2)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        bucket_start = int(i * every) + 1
+        bucket_end = int((i + 1) * every) + 1
+        next_start = bucket_end
+        next_end = min(int((i + 2) * every) + 1, n)
+        if next_end <= next_start:
+            next_start, next_end = n - 1, n
+
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[a] - avg_x) * (y[bucket_start:bucket_end] - y[a])
+            - (x[a] - x[bucket_start:bucket_end]) * (avg_y - y[a])
+        )
+        a = bucket_start + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    return points[selected]
+
+def downsample_values(values: List[List[Any]], max_points: int) -> List[List[Any]]:
+    """Прореживание значений Prometheus ([ts, "value"], ...) до max_points"""
+    if len(values) <= max_points:
+        return values
+
+    points = np.array([(float(ts), float(value)) for ts, value in values], dtype=np.float64)
+    points = points[np.isfinite(points[:, 1])]
+    return [[ts, str(value)] for ts, value in lttb(points, max_points).tolist()]
+
+def merge_matrices(results: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Склейка результатов range-запросов по поддиапазонам в один ряд на набор меток"""
+    series: Dict[Tuple, Dict[str, Any]] = {}
+    for result in results:
+        for item in result:
+            key = tuple(sorted(item.get("metric", {}).items()))
+            merged = series.setdefault(key, {"metric": item.get("metric", {}), "values": []})
+            merged["values"].extend(item.get("values", []))
+
+    for merged in series.values():
+        merged["values"].sort(key=lambda value: float(value[0]))
+    return list(series.values())
+
+class TTLCache:
+    """Кэш результатов в памяти процесса с временем жизни записей.
+
+    Хранит задачи, а не значения: одновременные запросы одного ключа
+    ожидают одно и то же вычисление.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[float, asyncio.Task]] = {}
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+        while len(self._entries) >= self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    async def get_or_set(self, key: Hashable, ttl: float, factory: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            task = entry[1]
+        else:
+            self._evict()
+            task = asyncio.ensure_future(factory())
+            self._entries[key] = (time.monotonic() + ttl, task)
+
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            # Ошибки не кэшируются
+            if self._entries.get(key, (None, None))[1] is task:
+                del self._entries[key]
+            raise
@@ -0,0 +1,172 @@
+import threading
+import warnings
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+class MetricRingStore:
+    """Локальное хранилище последних метрик парка устройств.
+
+    Все устройства опрашиваются одновременно, поэтому хранилище
+    колоночное: общий кольцевой буфер меток времени и по одной
+    непрерывной матрице float32 (устройства x емкость) на метрику.
+    Отсутствующие значения хранятся как NaN, запросы диапазонов и
+    агрегатов (минимум, максимум, среднее, скорость) выполняются векторно.
+
+    Память: 4 байта x метрики x емкость x строки (например, 5 метрик по
+    2880 срезов - около 57 КБ на устройство, 576 МБ на 10 000
+    устройств). Число строк ограничено ``max_devices``: устройства сверх
+    него не сохраняются, строки удаленных из инвентаря устройств
+    освобождаются и переиспользуются.
+    """
+
+    def __init__(self, metrics: List[str], capacity: int, max_devices: int, initial_devices: int = 256):
+        self.metrics = list(metrics)
+        self.capacity = capacity
+        self.max_devices = max_devices
+        self._rows = min(initial_devices, max_devices)
+        self._index: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._timestamps = np.full(capacity, np.nan, dtype=np.float64)
+        self._values = {
+            metric: np.full((self._rows, capacity), np.nan, dtype=np.float32)
+            for metric in self.metrics
+        }
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def memory_bytes(self) -> int:
+        """Объем матриц значений"""
+        return sum(values.nbytes for values in self._values.values())
+
+    def has(self, device_id: str) -> bool:
+        return str(device_id) in self._index
+
+    def _row(self, device_id: str) -> Optional[int]:
+        """Строка устройства (None при достижении max_devices; матрицы расширяются удвоением)"""
+        row = self._index.get(device_id)
+        if row is not None:
+            return row
+        if self._free:
+            row = self._free.pop()
+            self._index[device_id] = row
+            return row
+
+        row = len(self._index)
+        if row >= self.max_devices:
+            return None
+        if row >= self._rows:
+            rows = min(self._rows * 2, self.max_devices)
+            for metric, values in self._values.items():
+                grown = np.full((rows, self.capacity), np.nan, dtype=np.float32)
+                grown[:self._rows] = values
+                self._values[metric] = grown
+            self._rows = rows
+        self._index[device_id] = row
+        return row
+
+    def retain(self, device_ids: Iterable[str]):
+        """Освобождение строк устройств, отсутствующих в инвентаре"""
+        keep = set(str(device_id) for device_id in device_ids)
+        with self._lock:
+            for device_id in [device_id for device_id in self._index if device_id not in keep]:
+                row = self._index.pop(device_id)
+                for values in self._values.values():
+                    values[row] = np.nan
+                self._free.append(row)
+
+    def append(self, timestamp: float, samples: Dict[str, Dict[str, Optional[float]]]):
+        """Запись одного среза парка: {device_id: {metric: value}}"""
+        with self._lock:
+            rows: List[int] = []
+            stored: List[Dict[str, Optional[float]]] = []
+            for device_id, sample in samples.items():
+                row = self._row(str(device_id))
+                if row is not None:
+                    rows.append(row)
+                    stored.append(sample)
+            column = self._head
+
+            self._timestamps[column] = timestamp
+            for metric, values in self._values.items():
+                values[:, column] = np.nan
+                if rows:
+                    values[rows, column] = [
+                        np.nan if sample.get(metric) is None else sample[metric]
+                        for sample in stored
+                    ]
+
+            self._head = (self._head + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def _columns(self, start: float, end: float) -> np.ndarray:
+        """Индексы колонок в хронологическом порядке внутри [start, end]"""
+        order = (self._head - self._count + np.arange(self._count)) % self.capacity
+        timestamps = self._timestamps[order]
+        return order[(timestamps >= start) & (timestamps <= end)]
+
+    @property
+    def oldest(self) -> Optional[float]:
+        """Метка времени самого старого среза"""
+        if not self._count:
+            return None
+        return float(self._timestamps[(self._head - self._count) % self.capacity])
+
+    def covers(self, start: float, tolerance: float = 0) -> bool:
+        """Покрывает ли хранилище период, начинающийся в start"""
+        oldest = self.oldest
+        return oldest is not None and oldest <= start + tolerance
+
+    def range(self, device_id: str, metric: str, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Значения метрики устройства за период (без пропусков)"""
+        with self._lock:
+            row = self._index.get(str(device_id))
+            if row is None or metric not in self._values:
+                return np.empty(0), np.empty(0)
+            columns = self._columns(start, end)
+            timestamps = self._timestamps[columns]
+            values = self._values[metric][row, columns].astype(np.float64)
+        valid = ~np.isnan(values)
+        return timestamps[valid], values[valid]
+
+    def stats(self, device_id: str, metric: str, start: float, end: float) -> Dict[str, Optional[float]]:
+        """Минимум, максимум, среднее и число точек за период"""
+        _, values = self.range(device_id, metric, start, end)
+        if not len(values):
+            return {"min": None, "max": None, "avg": None, "count": 0}
+        return {
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "avg": float(values.mean()),
+            "count": int(len(values))
+        }
+
+    def rate(self, device_id: str, metric: str, start: float, end: float) -> Optional[float]:
+        """Скорость изменения метрики в секунду между первой и последней точкой"""
+        timestamps, values = self.range(device_id, metric, start, end)
+        if len(values) < 2 or timestamps[-1] == timestamps[0]:
+            return None
+        return float((values[-1] - values[0]) / (timestamps[-1] - timestamps[0]))
+
+    def fleet_stats(self, metric: str, start: float, end: float) -> Dict[str, np.ndarray]:
+        """Агрегаты метрики за период сразу по всем устройствам"""
+        with self._lock:
+            device_ids = np.array(list(self._index), dtype=object)
+            rows = np.fromiter(self._index.values(), dtype=np.int64, count=len(self._index))
+            columns = self._columns(start, end)
+            values = self._values[metric][np.ix_(rows, columns)]
+        if not values.size:
+            empty = np.full(len(device_ids), np.nan)
+            return {"device_ids": device_ids, "min": empty, "max": empty, "avg": empty}
+
+        # Строки без единого значения дают NaN без предупреждений numpy
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return {
+                "device_ids": device_ids,
+                "min": np.nanmin(values, axis=1),
+                "max": np.nanmax(values, axis=1),
+                "avg": np.nanmean(values, axis=1)
+            }
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import AsyncIterator, List, Optional, Tuple
+
+from redis import asyncio as aioredis
+
+from metrics import UPSTREAM_LATENCY, observe
+
+logger = logging.getLogger(__name__)
+
+# Продление аренды только ее владельцем
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Освобождение аренды только ее владельцем
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Публикация изменения: только владелец аренды и только следующий номер.
+# KEYS: аренда, номер, журнал, контрольная точка; ARGV: владелец, номер,
+# сообщение, канал, контрольная точка (пустая строка - без нее).
+# Возвращает {1, номер} при успехе и {0, последний номер} при отказе.
+_PUBLISH_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return {0, -1}
+end
+local last = tonumber(redis.call('GET', KEYS[2]) or '0')
+local seq = tonumber(ARGV[2])
+if last ~= 0 and seq ~= last + 1 then
+    return {0, last}
+end
+redis.call('SET', KEYS[2], seq)
+if ARGV[5] ~= '' then
+    redis.call('SET', KEYS[4], ARGV[5])
+    redis.call('DEL', KEYS[3])
+else
+    redis.call('RPUSH', KEYS[3], ARGV[3])
+end
+redis.call('PUBLISH', ARGV[4], ARGV[3])
+return {1, seq}
+"""
+
+class RedisBackplane:
+    """Общая для воркеров шина кадров мониторинга через Redis.
+
+    Воркеры выбирают производителя арендой ключа (``SET NX PX``),
+    продлеваемой каждые ``lease_ttl / 3`` секунд. Производитель
+    публикует пронумерованные изменения парка в канал pub/sub; все
+    воркеры, включая его самого, получают их и рассылают своим
+    клиентам. Публикация атомарно проверяет аренду и номер, поэтому два
+    производителя не могут выпустить один номер. Изменения с последней
+    контрольной точки (полного состояния) хранятся в журнале: воркер,
+    заметивший пропуск номера, восстанавливается по точке и журналу.
+    """
+
+    def __init__(self, url: str, prefix: str, lease_ttl: float):
+        self.url = url
+        self.lease_ttl = lease_ttl
+        self.channel = f"{prefix}:frames"
+        self.lease_key = f"{prefix}:leader"
+        self.seq_key = f"{prefix}:seq"
+        self.log_key = f"{prefix}:log"
+        self.checkpoint_key = f"{prefix}:checkpoint"
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        # Новый производитель сначала догоняет общее состояние и публикует контрольную точку
+        self.needs_checkpoint = False
+        self._redis: Optional[aioredis.Redis] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def redis(self) -> aioredis.Redis:
+        if self._redis is None:
+            self._redis = aioredis.from_url(self.url)
+        return self._redis
+
+    async def _elect(self) -> bool:
+        lease_ms = int(self.lease_ttl * 1000)
+        if self.is_leader:
+            with observe(UPSTREAM_LATENCY, upstream="redis", operation="renew"):
+                return bool(await self.redis.eval(_RENEW_SCRIPT, 1, self.lease_key, self.worker_id, lease_ms))
+        with observe(UPSTREAM_LATENCY, upstream="redis", operation="acquire"):
+            return bool(await self.redis.set(self.lease_key, self.worker_id, nx=True, px=lease_ms))
+
+    async def _run(self):
+        while True:
+            try:
+                leader = await self._elect()
+            except Exception as e:
+                logger.error(f"Ошибка выбора производителя кадров: {e}")
+                leader = False
+            if leader and not self.is_leader:
+                logger.info(f"Воркер {self.worker_id} стал производителем кадров мониторинга")
+                self.needs_checkpoint = True
+            elif self.is_leader and not leader:
+                logger.warning(f"Воркер {self.worker_id} потерял аренду производителя кадров")
+            self.is_leader = leader
+            await asyncio.sleep(self.lease_ttl / 3)
+
+    async def publish(self, seq: int, message: str, checkpoint: Optional[str] = None) -> Tuple[bool, int]:
+        """Публикация изменения с номером ``seq``; (успех, последний номер в Redis)"""
+        with observe(UPSTREAM_LATENCY, upstream="redis", operation="publish"):
+            published, last = await self.redis.eval(
+                _PUBLISH_SCRIPT, 4,
+                self.lease_key, self.seq_key, self.log_key, self.checkpoint_key,
+                self.worker_id, seq, message, self.channel, checkpoint or ""
+            )
+        if int(last) == -1:
+            self.is_leader = False
+        elif published and checkpoint:
+            self.needs_checkpoint = False
+        return bool(published), int(last)
+
+    async def load(self) -> Tuple[Optional[bytes], List[bytes]]:
+        """Последняя контрольная точка и журнал изменений после нее"""
+        with observe(UPSTREAM_LATENCY, upstream="redis", operation="load"):
+            async with self.redis.pipeline(transaction=True) as pipe:
+                checkpoint, log = await pipe.get(self.checkpoint_key).lrange(self.log_key, 0, -1).execute()
+        return checkpoint, log
+
+    async def messages(self) -> AsyncIterator[Optional[bytes]]:
+        """Сообщения канала; None - после переподключения (возможен пропуск)"""
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                # Сообщения до подписки могли быть пропущены
+                yield None
+                while True:
+                    message = await pubsub.get_message(timeout=None)
+                    if message is not None and message["type"] == "message":
+                        yield message["data"]
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка подписки на канал кадров мониторинга: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def start(self):
+        """Запуск выбора производителя"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка выбора производителя и освобождение аренды"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            try:
+                await self.redis.eval(_RELEASE_SCRIPT, 1, self.lease_key, self.worker_id)
+            except Exception as e:
+                logger.warning(f"Ошибка освобождения аренды производителя кадров: {e}")
+            self.is_leader = False
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
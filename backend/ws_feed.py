@@ -0,0 +1,599 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from fleet import FleetPoller, FleetSnapshot
+from ws_backplane import RedisBackplane
+from ws_hub import WebSocketClient, WebSocketHub
+
+logger = logging.getLogger(__name__)
+
+# Поля устройства в кадрах мониторинга и их источники в статусе устройства
+DEVICE_FIELDS = (
+    ("name", "device_name"),
+    ("status", "status"),
+    ("cpu", "cpu_usage"),
+    ("ram", "memory_usage"),
+    ("alerts", "alerts"),
+)
+
+# Поля сообщения подписки и соответствующие им признаки устройства
+SUBSCRIPTION_FIELDS = {
+    "device_ids": "device_id",
+    "device_types": "device_type",
+    "sites": "site",
+    "severities": "severity",
+}
+
+# Ограничение числа значений в одной подписке
+MAX_SUBSCRIPTION_KEYS = 10000
+
+SubscriptionKey = Tuple[str, str]
+
+def device_keys(device: Any) -> FrozenSet[SubscriptionKey]:
+    """Признаки устройства, по которым на него подписываются клиенты"""
+    keys = {("device_id", str(device.device_id))}
+    if device.device_type:
+        keys.add(("device_type", str(device.device_type)))
+    if device.site:
+        keys.add(("site", str(device.site)))
+    for severity in device.alert_severities or []:
+        keys.add(("severity", str(severity)))
+    return frozenset(keys)
+
+def parse_subscription(data: Dict[str, Any]) -> Optional[FrozenSet[SubscriptionKey]]:
+    """Признаки из сообщения подписки (пустое множество - весь парк, None - ошибка)"""
+    keys: Set[SubscriptionKey] = set()
+    for field, key in SUBSCRIPTION_FIELDS.items():
+        values = data.get(field) or []
+        if not isinstance(values, list):
+            return None
+        for value in values:
+            if not isinstance(value, (str, int)) or isinstance(value, bool):
+                return None
+            keys.add((key, str(value)))
+    if len(keys) > MAX_SUBSCRIPTION_KEYS:
+        return None
+    return frozenset(keys)
+
+DeviceRecord = Tuple[Tuple[Any, ...], FrozenSet[SubscriptionKey]]
+
+class FleetChange:
+    """Изменение парка одной версии: новые значения и признаки устройств, удаленные id.
+
+    Это же сообщение производитель публикует через общую шину воркеров.
+    """
+
+    def __init__(self, version: int, timestamp: Optional[str], traffic: Dict[str, Any],
+                 devices: Dict[str, DeviceRecord], removed: List[str]):
+        self.version = version
+        self.timestamp = timestamp
+        self.traffic = traffic
+        self.devices = devices
+        self.removed = removed
+
+    def to_message(self) -> str:
+        return json.dumps({
+            "version": self.version,
+            "timestamp": self.timestamp,
+            "traffic": self.traffic,
+            "devices": {
+                device_id: [list(values), sorted(list(key) for key in keys)]
+                for device_id, (values, keys) in self.devices.items()
+            },
+            "removed": self.removed
+        })
+
+    @classmethod
+    def from_message(cls, message: Any) -> "FleetChange":
+        data = json.loads(message)
+        return cls(
+            data["version"],
+            data["timestamp"],
+            data["traffic"],
+            {
+                device_id: (tuple(values), frozenset(tuple(key) for key in keys))
+                for device_id, (values, keys) in data["devices"].items()
+            },
+            data["removed"]
+        )
+
+class FeedVersion:
+    """Изменения представления, внесенные одной версией состояния"""
+
+    def __init__(self, version: int, changed: Dict[str, Dict[str, Any]], removed: List[str]):
+        self.version = version
+        self.changed = changed
+        self.removed = removed
+
+class FeedView:
+    """Представление парка для клиентов с одинаковой подпиской.
+
+    Хранит множество видимых устройств и историю их изменений по
+    версиям. ``keys`` и ``devices`` равны None для всего парка.
+    """
+
+    def __init__(self, keys: Optional[FrozenSet[SubscriptionKey]], devices: Optional[Set[str]], history: int):
+        self.keys = keys
+        self.devices = devices
+        self.history: Deque[FeedVersion] = deque(maxlen=history)
+        self.clients: Set[int] = set()
+        self.snapshot_frame: Optional[Tuple[int, str]] = None
+
+    def visible(self, state_devices: Dict[str, Tuple[Any, ...]]) -> Iterable[str]:
+        return state_devices if self.devices is None else self.devices
+
+    def has_delta(self, base: Optional[int], version: int) -> bool:
+        """Можно ли обновить клиента с версии ``base`` дельтой"""
+        if base is None or base > version:
+            return False
+        oldest = self.history[0].version - 1 if self.history else version
+        return base >= oldest
+
+class MonitoringFeed:
+    """Единственный производитель кадров /ws/monitoring.
+
+    Каждый новый снимок парка получает номер версии. Клиент при
+    подключении получает полный снимок (``snapshot``), далее - только
+    изменившиеся поля устройств (``delta``) начиная с последней
+    подтвержденной им версии (сообщение ``{"type": "ack", "version": N}``).
+    Дельта накопительная, поэтому потерянный кадр не нарушает состояние
+    клиента. Клиент, отставший больше чем на ``history`` версий,
+    запросивший ``{"type": "resync"}`` или потерявший неподтвержденный
+    снимок, получает новый полный снимок.
+
+    Сообщение ``{"type": "subscribe", "device_ids": [...],
+    "device_types": [...], "sites": [...], "severities": [...]}``
+    ограничивает клиента устройствами, подходящими хотя бы под одно
+    значение (пустая подписка - весь парк). Клиенты с одинаковой
+    подпиской объединяются в представление. Обратный индекс признак
+    устройства -> представления направляет каждое изменение только в
+    заинтересованные представления; устройство, начавшее или
+    переставшее подходить под подписку, добавляется в ней или удаляется.
+
+    Кадры строятся и сериализуются один раз на представление, версию и
+    базу дельты и рассылаются всем клиентам с этой базой одной и той же
+    строкой. Кадры отправляются не чаще раза в ``interval`` секунд.
+
+    С общей шиной ``backplane`` изменения парка вычисляет только
+    выбранный производитель: он публикует их с номером версии, а все
+    воркеры применяют их по порядку и рассылают своим клиентам, поэтому
+    номера версий едины для всех воркеров. Пропуск номера приводит к
+    восстановлению состояния из контрольной точки и журнала шины.
+    """
+
+    def __init__(self, hub: WebSocketHub, poller: FleetPoller, interval: float, history: int,
+                 backplane: Optional[RedisBackplane] = None, checkpoint_every: int = 12):
+        self.hub = hub
+        self.poller = poller
+        self.interval = interval
+        self.history = history
+        self.backplane = backplane
+        self.checkpoint_every = checkpoint_every
+        # Версия, время, трафик и поля устройств; меняются только при доставке
+        # изменений, пока подключения и подписки откладываются
+        self._state: Tuple[int, Optional[str], Dict[str, Any], Dict[str, Tuple[Any, ...]]] = (
+            0, None, {"incoming": 0, "outgoing": 0}, {}
+        )
+        self._device_keys: Dict[str, FrozenSet[SubscriptionKey]] = {}
+        self._key_devices: Dict[SubscriptionKey, Set[str]] = {}
+        self._key_views: Dict[SubscriptionKey, Set[FeedView]] = {}
+        self._everything = FeedView(None, None, history)
+        self._views: Dict[Optional[FrozenSet[SubscriptionKey]], FeedView] = {None: self._everything}
+        self._client_views: Dict[int, FeedView] = {}
+        self._building = False
+        self._pending: List[Callable[[], None]] = []
+        # Доставка изменений (своих и полученных через шину) строго по очереди
+        self._lock = asyncio.Lock()
+        self._snapshot: Optional[FleetSnapshot] = None
+        self._updated = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        hub.on_drop = self._on_drop
+        poller.add_listener(self._on_snapshot)
+
+    @property
+    def version(self) -> int:
+        return self._state[0]
+
+    @property
+    def views(self) -> int:
+        """Число представлений с разными подписками"""
+        return len(self._views)
+
+    def _on_snapshot(self, snapshot: FleetSnapshot):
+        self._updated.set()
+
+    def _on_drop(self, client: WebSocketClient):
+        # Вытесненным мог оказаться неподтвержденный снимок - состояние клиента неизвестно
+        if not client.acked:
+            client.version = None
+
+    def _views_for(self, keys: FrozenSet[SubscriptionKey]) -> Set[FeedView]:
+        views: Set[FeedView] = set()
+        for key in keys:
+            views.update(self._key_views.get(key, ()))
+        return views
+
+    def _index(self, device_id: str, removed: FrozenSet[SubscriptionKey], added: FrozenSet[SubscriptionKey]):
+        for key in removed:
+            devices = self._key_devices[key]
+            devices.discard(device_id)
+            if not devices:
+                del self._key_devices[key]
+        for key in added:
+            self._key_devices.setdefault(key, set()).add(device_id)
+
+    def diff(self, version: int, timestamp: Optional[str], traffic: Dict[str, Any],
+             records: Iterable[Tuple[str, DeviceRecord]]) -> FleetChange:
+        """Изменение от текущего состояния до полного состояния ``records``"""
+        devices = self._state[3]
+        changed: Dict[str, DeviceRecord] = {}
+        seen: Set[str] = set()
+        for device_id, (values, keys) in records:
+            seen.add(device_id)
+            if devices.get(device_id) != values or self._device_keys.get(device_id) != keys:
+                changed[device_id] = (values, keys)
+        removed = [device_id for device_id in devices if device_id not in seen]
+        return FleetChange(version, timestamp, traffic, changed, removed)
+
+    def diff_snapshot(self, snapshot: FleetSnapshot) -> FleetChange:
+        """Изменение парка по новому снимку как следующая версия"""
+        aggregates = self.poller.aggregates
+        return self.diff(
+            self.version + 1,
+            snapshot.taken_at.isoformat() + "Z",
+            {"incoming": aggregates.traffic_in, "outgoing": aggregates.traffic_out},
+            (
+                (str(device.device_id), (tuple(getattr(device, source) for _, source in DEVICE_FIELDS), device_keys(device)))
+                for device in snapshot.list()
+            )
+        )
+
+    def checkpoint(self, change: FleetChange) -> str:
+        """Полное состояние после ``change`` (контрольная точка шины)"""
+        devices = self._state[3]
+        records = {device_id: (values, self._device_keys[device_id]) for device_id, values in devices.items()}
+        records.update(change.devices)
+        for device_id in change.removed:
+            records.pop(device_id, None)
+        return FleetChange(change.version, change.timestamp, change.traffic, records, []).to_message()
+
+    def apply(self, change: FleetChange):
+        """Учет изменения парка в состоянии и истории представлений"""
+        devices = self._state[3]
+        names = [field for field, _ in DEVICE_FIELDS]
+        changes: Dict[FeedView, Tuple[Dict[str, Dict[str, Any]], List[str]]] = {
+            view: ({}, []) for view in self._views.values()
+        }
+
+        for device_id, (values, keys) in change.devices.items():
+            previous = devices.get(device_id)
+            previous_keys = self._device_keys.get(device_id, frozenset())
+            devices[device_id] = values
+            self._device_keys[device_id] = keys
+
+            fields = {
+                field: value
+                for i, (field, value) in enumerate(zip(names, values))
+                if previous is None or previous[i] != value
+            }
+            if fields:
+                changes[self._everything][0][device_id] = fields
+
+            if previous_keys == keys:
+                # Признаки не изменились - изменение идет в подписанные представления
+                if fields:
+                    for view in self._views_for(keys):
+                        changes[view][0][device_id] = fields
+                continue
+
+            self._index(device_id, previous_keys - keys, keys - previous_keys)
+            previous_views = self._views_for(previous_keys)
+            views = self._views_for(keys)
+            for view in views:
+                if view not in previous_views:
+                    # Устройство стало подходить под подписку - нужны все поля
+                    view.devices.add(device_id)
+                    changes[view][0][device_id] = dict(zip(names, values))
+                elif fields:
+                    changes[view][0][device_id] = fields
+            for view in previous_views - views:
+                view.devices.discard(device_id)
+                changes[view][1].append(device_id)
+
+        for device_id in change.removed:
+            previous_keys = self._device_keys.pop(device_id, None)
+            if previous_keys is None:
+                continue
+            del devices[device_id]
+            changes[self._everything][1].append(device_id)
+            for view in self._views_for(previous_keys):
+                view.devices.discard(device_id)
+                changes[view][1].append(device_id)
+            self._index(device_id, previous_keys, frozenset())
+
+        for view, (changed, removed) in changes.items():
+            view.history.append(FeedVersion(change.version, changed, removed))
+        self._state = (change.version, change.timestamp, change.traffic, devices)
+
+    def build_snapshot(self, view: FeedView) -> Tuple[int, str]:
+        """Версия и сериализованный полный снимок представления"""
+        version, timestamp, traffic, devices = self._state
+        cached = view.snapshot_frame
+        if cached is None or cached[0] != version:
+            names = [field for field, _ in DEVICE_FIELDS]
+            cached = (version, json.dumps({
+                "type": "snapshot",
+                "version": version,
+                "timestamp": timestamp,
+                "devices": [
+                    {"id": device_id, **dict(zip(names, devices[device_id]))}
+                    for device_id in view.visible(devices)
+                ],
+                "network_traffic": traffic
+            }))
+            view.snapshot_frame = cached
+        return cached
+
+    def build_delta(self, view: FeedView, base: int) -> str:
+        """Сериализованная накопительная дельта представления от версии ``base`` до текущей"""
+        version, timestamp, traffic, _ = self._state
+        changed: Dict[str, Dict[str, Any]] = {}
+        removed: Set[str] = set()
+        for entry in view.history:
+            if entry.version <= base:
+                continue
+            for device_id in entry.removed:
+                changed.pop(device_id, None)
+                removed.add(device_id)
+            for device_id, fields in entry.changed.items():
+                removed.discard(device_id)
+                changed.setdefault(device_id, {}).update(fields)
+        return json.dumps({
+            "type": "delta",
+            "from": base,
+            "version": version,
+            "timestamp": timestamp,
+            "devices": [{"id": device_id, **fields} for device_id, fields in changed.items()],
+            "removed": sorted(removed),
+            "network_traffic": traffic
+        })
+
+    def build_frame(self, view: FeedView, base: Optional[int]) -> str:
+        """Кадр для клиента представления с версией ``base``: дельта или полный снимок"""
+        if view.has_delta(base, self.version):
+            return self.build_delta(view, base)
+        return self.build_snapshot(view)[1]
+
+    def build_frames(self, changes: List[FleetChange],
+                     bases: Dict[FeedView, Set[Optional[int]]]) -> Dict[Tuple[FeedView, Optional[int]], str]:
+        """Применение изменений и кадры для каждой пары (представление, база клиентов)"""
+        for change in changes:
+            self.apply(change)
+        return {
+            (view, base): self.build_frame(view, base)
+            for view, view_bases in bases.items()
+            for base in view_bases
+        }
+
+    def _defer(self, action: Callable[[], None]):
+        if self._building:
+            self._pending.append(action)
+        else:
+            action()
+
+    def _view(self, keys: FrozenSet[SubscriptionKey]) -> FeedView:
+        if not keys:
+            return self._everything
+        view = self._views.get(keys)
+        if view is None:
+            devices: Set[str] = set()
+            for key in keys:
+                devices.update(self._key_devices.get(key, ()))
+            view = self._views[keys] = FeedView(keys, devices, self.history)
+            for key in keys:
+                self._key_views.setdefault(key, set()).add(view)
+        return view
+
+    def _release(self, client_id: int):
+        view = self._client_views.pop(client_id, None)
+        if view is None:
+            return
+        view.clients.discard(client_id)
+        if view.clients or view is self._everything:
+            return
+        del self._views[view.keys]
+        for key in view.keys:
+            views = self._key_views[key]
+            views.discard(view)
+            if not views:
+                del self._key_views[key]
+
+    def _join(self, client: WebSocketClient, view: FeedView):
+        if client.closed:
+            return
+        if self._client_views.get(client.id) is not view:
+            self._release(client.id)
+            view.clients.add(client.id)
+            self._client_views[client.id] = view
+        client.version = None
+        client.acked = False
+        if self.version:
+            # Версия берется вместе с кадром: это база следующих дельт клиента
+            version, frame = self.build_snapshot(view)
+            if self.hub.send(client, frame):
+                self._snapshot_sent(client, version)
+
+    def _snapshot_sent(self, client: WebSocketClient, version: int):
+        # Полученный снимок - база следующих дельт клиента до его подтверждения
+        client.version = version
+        client.acked = False
+
+    def welcome(self, client: WebSocketClient):
+        """Подписка нового клиента на весь парк и отправка ему полного снимка"""
+        self._defer(lambda: self._join(client, self._everything))
+
+    def receive(self, client: WebSocketClient, message: str):
+        """Обработка сообщения клиента (подтверждение версии, подписка или запрос снимка)"""
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+        if data.get("type") == "ack":
+            version = data.get("version")
+            if not isinstance(version, int) or isinstance(version, bool) or not 0 < version <= self.version:
+                return
+            # Подтверждения версий до отправленного снимка относятся к прежнему состоянию
+            if not client.acked and client.version is not None and version < client.version:
+                return
+            # Состояние клиента не откатывается: подтверждение всегда безопасная база
+            if not client.acked or version > client.version:
+                client.version = version
+                client.acked = True
+        elif data.get("type") == "subscribe":
+            keys = parse_subscription(data)
+            if keys is not None:
+                self._defer(lambda: self._join(client, self._view(keys)))
+        elif data.get("type") == "resync":
+            client.version = None
+            client.acked = False
+
+    async def _deliver(self, changes: List[FleetChange]):
+        """Применение изменений и рассылка кадров клиентам воркера (под блокировкой)"""
+        if not changes:
+            return
+        try:
+            # Отключившиеся клиенты освобождают свои представления
+            for client_id in [client_id for client_id in self._client_views if client_id not in self.hub.clients]:
+                self._release(client_id)
+            clients = [
+                (client, self._client_views[client.id])
+                for client in self.hub.clients.values()
+                if client.id in self._client_views
+            ]
+            bases: Dict[FeedView, Set[Optional[int]]] = {}
+            for client, view in clients:
+                bases.setdefault(view, set()).add(client.version)
+            self._building = True
+            try:
+                # Применение изменений и сериализация выполняются вне цикла событий
+                frames = await asyncio.to_thread(self.build_frames, changes, bases)
+            finally:
+                self._building = False
+            for client, view in clients:
+                # База могла смениться подтверждением во время построения
+                base = client.version
+                frame = frames.get((view, base))
+                if frame is None:
+                    frame = frames[(view, base)] = self.build_frame(view, base)
+                if self.hub.send(client, frame) and not view.has_delta(base, self.version):
+                    self._snapshot_sent(client, self.version)
+        finally:
+            # Подключения и подписки, полученные во время построения, применяются к новой версии
+            pending, self._pending = self._pending, []
+            for action in pending:
+                action()
+
+    async def _resync(self):
+        """Догон общего состояния по контрольной точке и журналу шины (под блокировкой)"""
+        checkpoint, log = await self.backplane.load()
+        changes: List[FleetChange] = []
+        version = self.version
+        if checkpoint is not None:
+            state = await asyncio.to_thread(FleetChange.from_message, checkpoint)
+            if state.version > version:
+                # Разница между своим состоянием и точкой - одно изменение
+                changes.append(await asyncio.to_thread(
+                    self.diff, state.version, state.timestamp, state.traffic, state.devices.items()
+                ))
+                version = state.version
+        for message in log:
+            change = FleetChange.from_message(message)
+            if change.version == version + 1:
+                changes.append(change)
+                version = change.version
+        if changes:
+            logger.info(f"Состояние кадров мониторинга восстановлено до версии {version}")
+        await self._deliver(changes)
+
+    async def _produce(self, snapshot: FleetSnapshot):
+        """Изменение по новому снимку: публикация через шину и доставка своим клиентам"""
+        if self.backplane is None:
+            await self._deliver([await asyncio.to_thread(self.diff_snapshot, snapshot)])
+            return
+        if not self.backplane.is_leader:
+            return
+        if self.backplane.needs_checkpoint:
+            await self._resync()
+        change = await asyncio.to_thread(self.diff_snapshot, snapshot)
+        message = await asyncio.to_thread(change.to_message)
+        checkpoint = None
+        if self.backplane.needs_checkpoint or change.version % self.checkpoint_every == 0:
+            checkpoint = await asyncio.to_thread(self.checkpoint, change)
+        published, last = await self.backplane.publish(change.version, message, checkpoint)
+        if published:
+            await self._deliver([change])
+        elif last >= 0:
+            # В шине другие номера версий - состояние догоняется, снимок публикуется позже
+            logger.warning(f"Версия кадров мониторинга {change.version} отклонена, последняя {last}")
+            await self._resync()
+
+    async def _run(self):
+        while True:
+            await self._updated.wait()
+            self._updated.clear()
+            snapshot = self.poller.snapshot
+            if snapshot is not None and snapshot is not self._snapshot:
+                try:
+                    async with self._lock:
+                        await self._produce(snapshot)
+                    self._snapshot = snapshot
+                except Exception as e:
+                    logger.error(f"Ошибка построения кадра мониторинга: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _relay(self):
+        """Применение изменений, опубликованных производителем через шину"""
+        async for message in self.backplane.messages():
+            try:
+                async with self._lock:
+                    if message is None:
+                        await self._resync()
+                        continue
+                    change = FleetChange.from_message(message)
+                    if change.version <= self.version:
+                        # Свое или уже примененное изменение
+                        continue
+                    if change.version == self.version + 1:
+                        await self._deliver([change])
+                    else:
+                        logger.warning(f"Пропуск версий кадров мониторинга: {self.version} -> {change.version}")
+                        await self._resync()
+            except Exception as e:
+                logger.error(f"Ошибка применения кадра мониторинга из шины: {e}")
+
+    def start(self):
+        """Запуск производителя кадров (и приема изменений из шины)"""
+        if self._tasks:
+            return
+        # Снимок мог появиться до запуска
+        if self.poller.snapshot is not None:
+            self._updated.set()
+        self._tasks.append(asyncio.create_task(self._run()))
+        if self.backplane is not None:
+            self._tasks.append(asyncio.create_task(self._relay()))
+
+    async def stop(self):
+        """Остановка производителя кадров"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
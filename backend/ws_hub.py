@@ -0,0 +1,152 @@
+import asyncio
+import itertools
+import logging
+from typing import Callable, Dict, Optional
+
+from fastapi import WebSocket
+
+from metrics import WEBSOCKET_DISCONNECTS, WEBSOCKET_DROPPED_FRAMES
+
+logger = logging.getLogger(__name__)
+
+# Политики для клиентов, не успевающих получать кадры
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+# Код закрытия WebSocket "повторите позже" для отключенных медленных клиентов
+CLOSE_TRY_AGAIN_LATER = 1013
+
+class WebSocketClient:
+    """Подключение с собственной ограниченной очередью отправки"""
+
+    def __init__(self, client_id: int, websocket: WebSocket, queue_size: int):
+        self.id = client_id
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.dropped_in_row = 0
+        # Версия состояния клиента для дельта-кадров и признак ее подтверждения клиентом
+        self.version: Optional[int] = None
+        self.acked = False
+
+class WebSocketHub:
+    """Неблокирующая рассылка кадров WebSocket клиентам.
+
+    Каждый клиент получает ограниченную очередь и собственную задачу
+    отправки, поэтому рассылка только раскладывает кадр по очередям, а
+    медленный клиент не задерживает остальных. При переполнении очереди
+    политика ``drop_oldest`` вытесняет самый старый кадр (клиент
+    получает более свежие данные с пропусками), а ``disconnect`` сразу
+    отключает клиента. Клиент, потерявший ``max_dropped`` кадров подряд
+    или не принявший кадр за ``send_timeout`` секунд, отключается при
+    любой политике.
+    """
+
+    def __init__(self, queue_size: int, policy: str = DROP_OLDEST,
+                 max_dropped: int = 64, send_timeout: float = 10.0):
+        if policy not in (DROP_OLDEST, DISCONNECT):
+            raise ValueError(f"Неизвестная политика медленных клиентов: {policy}")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.max_dropped = max_dropped
+        self.send_timeout = send_timeout
+        self.clients: Dict[int, WebSocketClient] = {}
+        self.on_drop: Optional[Callable[[WebSocketClient], None]] = None
+        self._ids = itertools.count(1)
+
+    @property
+    def depth(self) -> int:
+        """Число кадров во всех очередях отправки"""
+        return sum(client.queue.qsize() for client in self.clients.values())
+
+    async def connect(self, websocket: WebSocket) -> WebSocketClient:
+        """Принятие подключения и запуск его задачи отправки"""
+        await websocket.accept()
+        client = WebSocketClient(next(self._ids), websocket, self.queue_size)
+        client.writer = asyncio.create_task(self._write(client))
+        self.clients[client.id] = client
+        return client
+
+    def send(self, client: WebSocketClient, message: str) -> bool:
+        """Постановка кадра в очередь клиента; False, если клиент отключен"""
+        if client.closed:
+            return False
+        try:
+            client.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.policy == DISCONNECT:
+            self._close(client, "slow", CLOSE_TRY_AGAIN_LATER)
+            return False
+
+        client.queue.get_nowait()
+        client.queue.put_nowait(message)
+        client.dropped += 1
+        client.dropped_in_row += 1
+        WEBSOCKET_DROPPED_FRAMES.inc()
+        if client.dropped_in_row >= self.max_dropped:
+            self._close(client, "slow", CLOSE_TRY_AGAIN_LATER)
+            return False
+        if self.on_drop is not None:
+            self.on_drop(client)
+        return True
+
+    def broadcast(self, message: str) -> int:
+        """Рассылка кадра всем клиентам; возвращает число принявших очередей"""
+        return sum(self.send(client, message) for client in list(self.clients.values()))
+
+    async def _write(self, client: WebSocketClient):
+        try:
+            while True:
+                message = await client.queue.get()
+                async with asyncio.timeout(self.send_timeout):
+                    await client.websocket.send_text(message)
+                client.sent += 1
+                client.dropped_in_row = 0
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._close(client, "slow", CLOSE_TRY_AGAIN_LATER)
+        except Exception:
+            self._close(client, "error")
+
+    def _close(self, client: WebSocketClient, reason: str, code: Optional[int] = None):
+        if client.closed:
+            return
+        client.closed = True
+        self.clients.pop(client.id, None)
+        WEBSOCKET_DISCONNECTS.labels(reason).inc()
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+        if code is not None:
+            asyncio.create_task(self._close_socket(client, code))
+
+    async def _close_socket(self, client: WebSocketClient, code: int):
+        try:
+            await asyncio.wait_for(client.websocket.close(code=code), self.send_timeout)
+        except Exception:
+            pass
+
+    async def disconnect(self, client: WebSocketClient):
+        """Отключение клиента (по закрытию соединения с его стороны)"""
+        self._close(client, "closed")
+        if client.writer is not None:
+            try:
+                await client.writer
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def close_all(self):
+        """Отключение всех клиентов при остановке приложения"""
+        for client in list(self.clients.values()):
+            self._close(client, "shutdown", 1001)
+            if client.writer is not None:
+                try:
+                    await client.writer
+                except (asyncio.CancelledError, Exception):
+                    pass
@@ -157,7 +157,7 @@ export const monitoringApi = {
   // Получение логов мониторинга
   getMonitoringLogs: (params?: {
     limit?: number
-    offset?: number
+    cursor?: string
     device_id?: string
     alert_level?: string
   }) => apiClient.get('/api/monitoring/logs', { params }),
@@ -174,7 +174,7 @@ export const monitoringApi = {
   // Получение предупреждений
   getAlerts: (params?: {
     limit?: number
-    offset?: number
+    cursor?: string
     status?: string
     severity?: string
   }) => apiClient.get('/api/monitoring/alerts', { params }),
@@ -224,17 +224,31 @@ export const userApi = {
   updateProfile: (data: any) => apiClient.put('/api/user/profile', data)
 }
 
+// Фильтр потока мониторинга; пустой фильтр - весь парк
+export interface MonitoringSubscription {
+  device_ids?: string[]
+  device_types?: string[]
+  sites?: string[]
+  severities?: string[]
+}
+
 // WebSocket для real-time мониторинга
 export class MonitoringWebSocket {
   private ws: WebSocket | null = null
   private reconnectAttempts = 0
   private maxReconnectAttempts = 5
   private reconnectDelay = 1000
+  // Состояние парка, собираемое из полного снимка и дельт сервера
+  private version: number | null = null
+  private devices = new Map<string, any>()
+  // Подписка переотправляется после переподключения
+  private subscription: MonitoringSubscription | null = null
 
   constructor(private onMessage: (data: any) => void) {}
 
   connect() {
-    const wsUrl = (API_BASE_URL.replace('http', 'ws')) + '/ws/monitoring'
+    const token = localStorage.getItem('bmk_token') || ''
+    const wsUrl = (API_BASE_URL.replace('http', 'ws')) + '/ws/monitoring?token=' + encodeURIComponent(token)
     
     try {
       this.ws = new WebSocket(wsUrl)
@@ -242,12 +256,23 @@ export class MonitoringWebSocket {
       this.ws.onopen = () => {
         console.log('WebSocket connected')
         this.reconnectAttempts = 0
+        this.version = null
+        this.devices.clear()
+        if (this.subscription) {
+          this.send({ type: 'subscribe', ...this.subscription })
+        }
       }
 
       this.ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data)
-          this.onMessage(data)
+          if (this.applyFrame(data)) {
+            this.onMessage({
+              timestamp: data.timestamp,
+              devices: Array.from(this.devices.values()),
+              network_traffic: data.network_traffic
+            })
+          }
         } catch (error) {
           console.error('Error parsing WebSocket message:', error)
         }
@@ -266,6 +291,36 @@ export class MonitoringWebSocket {
     }
   }
 
+  // Применение снимка или дельты; false, если кадр устарел или не применим
+  private applyFrame(data: any): boolean {
+    if (data.type === 'snapshot') {
+      // Снимок всегда заменяет состояние (в том числе после смены подписки)
+      this.devices = new Map(data.devices.map((device: any) => [device.id, device]))
+    } else if (data.type === 'delta') {
+      if (this.version !== null && data.version <= this.version) return false
+      if (this.version === null || data.from > this.version) {
+        // Пропущена база дельты - нужен новый полный снимок
+        this.send({ type: 'resync' })
+        return false
+      }
+      for (const id of data.removed) this.devices.delete(id)
+      for (const change of data.devices) {
+        this.devices.set(change.id, { ...this.devices.get(change.id), ...change })
+      }
+    } else {
+      return false
+    }
+    this.version = data.version
+    this.send({ type: 'ack', version: data.version })
+    return true
+  }
+
+  // Ограничение потока устройствами по id, типам, площадкам или важности предупреждений
+  subscribe(subscription: MonitoringSubscription) {
+    this.subscription = subscription
+    this.send({ type: 'subscribe', ...subscription })
+  }
+
   private attemptReconnect() {
     if (this.reconnectAttempts < this.maxReconnectAttempts) {
       this.reconnectAttempts++